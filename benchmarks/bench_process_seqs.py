@@ -0,0 +1,275 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Benchmark process_seqs, collate_fastp_reports and visualize end to end.
+
+Synthetic Casava directories are generated for every combination of the
+requested sample counts, read counts and layouts; the actions are then
+timed for every combination of the requested thread, compression, output
+compressor, shard size and concurrency settings. Results are written as a
+JSON document which can be compared between revisions of the plugin.
+
+With --stub-fastp, fastp and MultiQC are replaced by stubs which only
+write minimal outputs - the timings then reflect the orchestration
+overhead of the plugin alone.
+
+Example:
+    python benchmarks/bench_process_seqs.py --samples 10 100 \\
+        --reads 1000 --threads 4 --n-jobs 1 4 --output results.json
+"""
+
+import argparse
+import contextlib
+import gzip
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from unittest.mock import patch
+
+from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+
+from q2_fastp import collate_fastp_reports, process_seqs, visualize
+from q2_fastp.types import FastpJsonDirectoryFormat
+from q2_fastp.utils import run_command
+
+READ_POOL_SIZE = 1000
+
+
+def generate_reads(fp, n_reads, read_length, seed):
+    """Write n_reads random reads to a gzipped FASTQ file.
+
+    Reads are drawn from a pool of random sequences to keep generation of
+    large files cheap.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for i in range(READ_POOL_SIZE):
+        seq = "".join(rng.choice("ACGT") for _ in range(read_length))
+        qual = "".join(chr(33 + rng.randint(2, 40)) for _ in range(read_length))
+        pool.append((seq, qual))
+
+    with gzip.open(fp, "wt", compresslevel=1) as f:
+        for i in range(n_reads):
+            seq, qual = pool[i % READ_POOL_SIZE]
+            f.write(f"@read{i}\n{seq}\n+\n{qual}\n")
+
+
+def generate_dataset(path, n_samples, n_reads, read_length, paired, seed=42):
+    """Generate a Casava directory with n_samples samples of n_reads each."""
+    os.makedirs(path, exist_ok=True)
+    for i in range(n_samples):
+        for direction in (1, 2) if paired else (1,):
+            generate_reads(
+                os.path.join(path, f"sample{i}_00_L001_R{direction}_001.fastq.gz"),
+                n_reads,
+                read_length,
+                seed=seed + i * 2 + direction,
+            )
+    return CasavaOneEightSingleLanePerSampleDirFmt(path, mode="r")
+
+
+def _stub_run_command(cmd, *args, **kwargs):
+    """Stand in for fastp and MultiQC, writing minimal outputs only.
+
+    Other commands (e.g. splitting samples into shards) are run as they are.
+    """
+    if cmd[0] not in ("fastp", "multiqc"):
+        return run_command(cmd, *args, **kwargs)
+    if cmd[0] == "multiqc":
+        out_dir = cmd[cmd.index("--outdir") + 1]
+        with open(os.path.join(out_dir, cmd[cmd.index("--filename") + 1]), "w") as f:
+            f.write("<html></html>")
+        return
+
+    for in_opt, out_opt in (("--in1", "--out1"), ("--in2", "--out2")):
+        if out_opt in cmd:
+            # the output may be a pipe read by an output compressor
+            with open(cmd[cmd.index(in_opt) + 1], "rb") as src, open(
+                cmd[cmd.index(out_opt) + 1], "wb"
+            ) as dst:
+                shutil.copyfileobj(src, dst)
+    with open(cmd[cmd.index("--json") + 1], "w") as f:
+        json.dump(
+            {
+                "summary": {
+                    "fastp_version": "stub",
+                    "before_filtering": {"total_reads": 1},
+                    "after_filtering": {"total_reads": 1},
+                }
+            },
+            f,
+        )
+    if kwargs.get("resources"):
+        return {"wall_time": 0.0, "user_time": 0.0, "system_time": 0.0, "max_rss": 0}
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(sequences, params, collate_partitions, engine):
+    """Time process_seqs, collate_fastp_reports and visualize once."""
+    (processed, reports), process_time = _timed(process_seqs, sequences, **params)
+    output_size = sum(fp.stat().st_size for fp in processed.path.glob("*.fastq.gz"))
+
+    # split the reports to collate them back together
+    json_fps = sorted(reports.path.glob("*.json"))
+    partitions = []
+    for i in range(collate_partitions):
+        partition = FastpJsonDirectoryFormat()
+        for fp in json_fps[i::collate_partitions]:
+            shutil.copy(fp, partition.path / fp.name)
+        partitions.append(partition)
+    collated, collate_time = _timed(collate_fastp_reports, partitions)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        _, visualize_time = _timed(
+            visualize, output_dir, collated, engine=engine, n_jobs=params["n_jobs"]
+        )
+
+    return {
+        "process_seqs": process_time,
+        "output_size": output_size,
+        "collate_fastp_reports": collate_time,
+        "visualize": visualize_time,
+    }
+
+
+def _environment(stub_fastp):
+    fastp_version = "stub"
+    if not stub_fastp:
+        result = subprocess.run(["fastp", "--version"], capture_output=True, text=True)
+        fastp_version = (result.stderr or result.stdout).strip()
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "fastp": fastp_version,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--samples", type=int, nargs="+", default=[10])
+    parser.add_argument("--reads", type=int, nargs="+", default=[1000])
+    parser.add_argument("--read-length", type=int, default=150)
+    parser.add_argument(
+        "--layout", choices=["single", "paired"], nargs="+", default=["single"]
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--compression", type=int, nargs="+", default=[2])
+    parser.add_argument(
+        "--output-compressor",
+        choices=["fastp", "pigz", "bgzip", "none"],
+        nargs="+",
+        default=["fastp"],
+    )
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--shard-size",
+        type=float,
+        nargs="+",
+        default=[0],
+        help="Split samples larger than this (in GB) into shards; 0 disables it.",
+    )
+    parser.add_argument(
+        "--engine", choices=["native", "multiqc"], nargs="+", default=["native"]
+    )
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--collate-partitions", type=int, default=2)
+    parser.add_argument(
+        "--stub-fastp",
+        action="store_true",
+        help="Replace fastp and MultiQC with stubs to measure the plugin overhead.",
+    )
+    parser.add_argument("--data-dir", help="Keep the generated datasets here.")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="q2-fastp-bench-")
+    results = []
+    with contextlib.ExitStack() as stack:
+        if args.stub_fastp:
+            for target in ("q2_fastp.fastp", "q2_fastp.visualization"):
+                stack.enter_context(patch(f"{target}.run_command", _stub_run_command))
+        for n_samples, n_reads, layout in itertools.product(
+            args.samples, args.reads, args.layout
+        ):
+            dataset = os.path.join(data_dir, f"{layout}-{n_samples}x{n_reads}")
+            sequences, generate_time = _timed(
+                generate_dataset,
+                dataset,
+                n_samples,
+                n_reads,
+                args.read_length,
+                layout == "paired",
+            )
+            for (
+                threads,
+                compression,
+                compressor,
+                shard_size,
+                n_jobs,
+                engine,
+            ) in itertools.product(
+                args.threads,
+                args.compression,
+                args.output_compressor,
+                args.shard_size,
+                args.n_jobs,
+                args.engine,
+            ):
+                params = {
+                    "thread": threads,
+                    "compression": compression,
+                    "output_compressor": compressor,
+                    "shard_size": shard_size,
+                    "n_jobs": n_jobs,
+                }
+                for repeat in range(args.repeats):
+                    timings = run_benchmark(
+                        sequences, params, args.collate_partitions, engine
+                    )
+                    results.append(
+                        {
+                            "samples": n_samples,
+                            "reads": n_reads,
+                            "layout": layout,
+                            "repeat": repeat,
+                            "generate_time": generate_time,
+                            "engine": engine,
+                            **params,
+                            **timings,
+                        }
+                    )
+                    print(json.dumps(results[-1]))
+
+    if not args.data_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "environment": _environment(args.stub_fastp),
+                "stub_fastp": args.stub_fastp,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
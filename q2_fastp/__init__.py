@@ -6,7 +6,8 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 from .fastp import process_seqs
-from .utils import collate_fastp_reports
+from .reports import summarize_reports
+from .utils import collate_fastp_reports, collate_fastp_summaries
 from .visualization import visualize
 
 try:
@@ -14,4 +15,10 @@ try:
 except ModuleNotFoundError:
     __version__ = "0.0.0+notfound"
 
-__all__ = ["collate_fastp_reports", "process_seqs", "visualize"]
+__all__ = [
+    "collate_fastp_reports",
+    "collate_fastp_summaries",
+    "process_seqs",
+    "summarize_reports",
+    "visualize",
+]
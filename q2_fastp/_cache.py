@@ -0,0 +1,181 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List
+
+from .utils import link_or_copy, run_command
+
+# command line options whose values depend on the location of the files
+# or on the available resources rather than on the processing itself
+PATH_OPTIONS = ["--in1", "--in2", "--out1", "--out2", "--json", "--html"]
+RESOURCE_OPTIONS = ["--thread"]
+
+HASH_BLOCK_SIZE = 1024 * 1024
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+
+def get_fastp_version() -> str:
+    """Get the version string of the available fastp executable."""
+    result = run_command(["fastp", "--version"], verbose=False, pipe=True)
+    # fastp prints its version to stderr, e.g. "fastp 0.23.4"
+    return (result.stderr or result.stdout).strip().split()[-1]
+
+
+def normalize_cmd(cmd: List[str]) -> List[str]:
+    """Strip the file paths and resource options from a fastp command.
+
+    The returned command only contains the options which affect
+    the content of the fastp outputs.
+    """
+    normalized = []
+    args = iter(cmd)
+    for arg in args:
+        if arg in PATH_OPTIONS:
+            normalized.append(arg)
+            next(args, None)
+        elif arg in RESOURCE_OPTIONS:
+            next(args, None)
+        else:
+            normalized.append(arg)
+    return normalized
+
+
+def hash_file(fp: str) -> str:
+    """Compute the SHA-256 digest of the file's content."""
+    digest = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint_files(fps: List[str]) -> str:
+    """Compute a cheap fingerprint of the files.
+
+    Rather than the full content, only the size of every file and its
+    first, middle and last block are hashed.
+    """
+    digest = hashlib.sha256()
+    for fp in fps:
+        size = os.path.getsize(fp)
+        digest.update(str(size).encode())
+        with open(fp, "rb") as f:
+            for offset in (0, size // 2, max(size - FINGERPRINT_BLOCK_SIZE, 0)):
+                f.seek(offset)
+                digest.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def hash_cmd(cmd: List[str]) -> str:
+    """Compute the hash of the normalized fastp command."""
+    return hashlib.sha256("\0".join(normalize_cmd(cmd)).encode()).hexdigest()
+
+
+class FastpResultCache:
+    """Content-addressed, size-bounded cache of per-sample fastp results.
+
+    Every entry is a directory named after the hash of the inputs'
+    content, the normalized fastp command and the fastp version. It holds
+    the outputs of a single fastp run (trimmed reads and the JSON report),
+    stored under their role (e.g. "out1", "json"). The least recently used
+    entries are evicted once the cache grows beyond its maximum size.
+
+    Parameters:
+    path (str): The cache directory. Created if it does not exist.
+    max_size (int): The maximum size of the cache, in bytes.
+    """
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, input_fps: List[str], cmd: List[str], fastp_version: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(fastp_version.encode())
+        digest.update(hash_cmd(cmd).encode())
+        for fp in input_fps:
+            digest.update(hash_file(fp).encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def restore(self, key: str, outputs: Dict[str, str]) -> bool:
+        """Restore the cached outputs into their destinations.
+
+        Returns True on a cache hit and False otherwise.
+        """
+        entry = self._entry_path(key)
+        if not all(os.path.isfile(os.path.join(entry, role)) for role in outputs):
+            with self._lock:
+                self.misses += 1
+            return False
+
+        for role, dst in outputs.items():
+            link_or_copy(os.path.join(entry, role), dst)
+        # mark the entry as recently used
+        os.utime(entry)
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key: str, outputs: Dict[str, str]):
+        """Store the outputs of a fastp run under the given key."""
+        entry = self._entry_path(key)
+        if os.path.exists(entry):
+            return
+
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix=".tmp-")
+        for role, src in outputs.items():
+            link_or_copy(src, os.path.join(tmp_entry, role))
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # the same entry was stored concurrently
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    def _entries(self):
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                yield entry.stat().st_mtime, size, entry.path
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.evicted += 1
+
+    def summary(self) -> str:
+        return (
+            f"fastp result cache ({self.path}): {self.hits} hit(s), "
+            f"{self.misses} miss(es), {self.evicted} entry(ies) evicted, "
+            f"{self.size() / 1024**3:.2f} of {self.max_size / 1024**3:.2f} GB used."
+        )
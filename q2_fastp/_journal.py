@@ -0,0 +1,129 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import threading
+from typing import Dict
+
+import pandas as pd
+
+from .utils import link_or_copy
+
+JOURNAL_FILENAME = "journal.jsonl"
+
+
+class CheckpointJournal:
+    """Record the samples processed by fastp in a persistent work directory.
+
+    The outputs of every finished sample are kept in the work directory,
+    stored under their role (e.g. "out1", "json"), and the sample is
+    appended to the journal - together with its input fingerprint, the
+    hash of its processing parameters and the version of fastp. A run
+    using the same work directory reuses every sample whose entry matches
+    these, so that an interrupted or failed run can be resumed.
+
+    Parameters:
+    path (str): The work directory. Created if it does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.path, "samples"), exist_ok=True)
+        self.entries = self._read()
+
+    @property
+    def journal_fp(self) -> str:
+        return os.path.join(self.path, JOURNAL_FILENAME)
+
+    def _read(self) -> Dict[str, dict]:
+        entries = {}
+        if not os.path.isfile(self.journal_fp):
+            return entries
+        with open(self.journal_fp) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last entry of a run killed while writing it
+                    continue
+                entries[entry["sample_id"]] = entry
+        return entries
+
+    def _sample_dir(self, sample_id: str) -> str:
+        return os.path.join(self.path, "samples", sample_id)
+
+    def find_completed(
+        self, plan: pd.DataFrame, fastp_version: str
+    ) -> Dict[str, Dict[str, str]]:
+        """Find the samples completed by a previous run.
+
+        Parameters:
+        plan (pd.DataFrame): The current run plan, with the input fingerprint
+            and parameter hash of every sample.
+        fastp_version (str): The version of the current fastp executable.
+
+        Returns:
+        Dict[str, Dict[str, str]]: The kept output files of every completed
+            sample, by fastp role.
+        """
+        completed = {}
+        for sample_id in plan.index.intersection(list(self.entries)):
+            entry = self.entries[sample_id]
+            if (
+                entry["input_fingerprint"] != plan.loc[sample_id, "input_fingerprint"]
+                or entry["params_hash"] != plan.loc[sample_id, "params_hash"]
+                or entry["fastp_version"] != fastp_version
+            ):
+                continue
+            outputs = {
+                role: os.path.join(self._sample_dir(sample_id), role)
+                for role in entry["roles"]
+            }
+            if all(os.path.isfile(fp) for fp in outputs.values()):
+                completed[sample_id] = outputs
+        return completed
+
+    def record(
+        self,
+        sample_id: str,
+        outputs: Dict[str, str],
+        input_fingerprint: str,
+        params_hash: str,
+        fastp_version: str,
+    ):
+        """Keep the outputs of a finished sample and append it to the journal.
+
+        Parameters:
+        sample_id (str): The finished sample.
+        outputs (Dict[str, str]): The output files of the sample, by fastp role.
+        input_fingerprint (str): The fingerprint of the sample's inputs.
+        params_hash (str): The hash of the sample's processing parameters.
+        fastp_version (str): The version of fastp.
+        """
+        sample_dir = self._sample_dir(sample_id)
+        os.makedirs(sample_dir, exist_ok=True)
+        for role, fp in outputs.items():
+            dst = os.path.join(sample_dir, role)
+            if os.path.exists(dst):
+                os.remove(dst)
+            link_or_copy(fp, dst)
+
+        entry = {
+            "sample_id": sample_id,
+            "input_fingerprint": input_fingerprint,
+            "params_hash": params_hash,
+            "fastp_version": fastp_version,
+            "roles": sorted(outputs),
+        }
+        with self._lock:
+            with open(self.journal_fp, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[sample_id] = entry
@@ -0,0 +1,425 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import CancelledError as FutureCancelledError
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+from typing import Callable, Iterable, List
+
+# the script running the commands and reporting their resource usage
+RUSAGE_WRAPPER = os.path.join(os.path.dirname(__file__), "_rusage.py")
+
+# the signals cancelling all the jobs of a runner
+CANCEL_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+# the job running in the current thread (see current_job)
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class JobCancelledError(RuntimeError):
+    """Raised within jobs whose processes were killed as the run was cancelled."""
+
+
+async def run_process(
+    cmd: List[str], timeout: float = None, on_start: Callable = None, **kwargs
+) -> dict:
+    """Run the command, killing it if it times out or the task is cancelled.
+
+    The command is run in a new session, through a wrapper collecting its
+    resource usage (see _rusage.py). Killing the session kills both the
+    wrapper and the command - and it is not reached by a Ctrl-C meant for
+    the plugin, which lets the runner decide what to kill.
+
+    Parameters:
+    cmd (List[str]): The command to run.
+    timeout (float): The number of seconds after which the command is
+        killed, if any.
+    on_start (Callable): Called with the PID of the process once it starts.
+    **kwargs: Passed to asyncio.create_subprocess_exec (e.g. the streams).
+
+    Returns:
+    dict: The wall time, user and system time and maximum resident set
+        size of the command.
+    """
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            # isolated, so that the directory of the script (the package)
+            # does not shadow the standard library
+            "-I",
+            RUSAGE_WRAPPER,
+            str(write_fd),
+            *cmd,
+            pass_fds=(write_fd,),
+            start_new_session=True,
+            **kwargs,
+        )
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+
+    finished = False
+    try:
+        if on_start is not None:
+            on_start(process.pid)
+        await asyncio.wait_for(process.wait(), timeout)
+        finished = True
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(cmd, timeout) from None
+    finally:
+        if not finished:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+        # the wrapper has exited, so this does not block
+        with open(read_fd) as f:
+            report = f.read()
+    wall_time = time.perf_counter() - start
+
+    usage = json.loads(report) if report else {"returncode": process.returncode}
+    if "errno" in usage:
+        raise OSError(usage["errno"], usage["strerror"], cmd[0])
+    returncode = usage.pop("returncode")
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return {"wall_time": wall_time, **usage}
+
+
+class _CoreBudget:
+    """Keep track of the threads used by concurrently running jobs.
+
+    A job is only started if it fits into the remaining budget, unless
+    nothing else is running - this way jobs requesting more threads than
+    the total budget can still run, just not concurrently with others.
+    """
+
+    def __init__(self, threads: int, n_jobs: int):
+        self.threads = threads
+        self.n_jobs = n_jobs
+        self.used = 0
+        self.running = 0
+        self.aborted = False
+        self._condition = asyncio.Condition()
+
+    def _fits(self, threads: int) -> bool:
+        if self.running == 0:
+            return True
+        return self.running < self.n_jobs and self.used + threads <= self.threads
+
+    async def acquire(self, threads: int) -> bool:
+        """Wait until the requested threads are available.
+
+        Returns False if the budget was aborted in the meantime.
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.aborted or self._fits(threads))
+            if self.aborted:
+                return False
+            self.running += 1
+            self.used += threads
+            return True
+
+    async def release(self, threads: int, failed: bool = False):
+        async with self._condition:
+            self.running -= 1
+            self.used -= threads
+            self.aborted = self.aborted or failed
+            self._condition.notify_all()
+
+    async def abort(self):
+        async with self._condition:
+            self.aborted = True
+            self._condition.notify_all()
+
+
+class _Job:
+    """A job run by a JobRunner in one of its worker threads.
+
+    The job itself is blocking, but the processes it starts (through
+    run_command with resources=True) are run on the event loop of the
+    runner, which kills them once the job times out or the run is
+    cancelled.
+
+    Parameters:
+    loop (asyncio.AbstractEventLoop): The event loop of the runner.
+    timeout (float): The number of seconds the job may run, if limited.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, timeout: float = None):
+        self.loop = loop
+        self.timeout = timeout
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.cancelled = False
+        # the tasks running the processes of the job, only used by the loop
+        self._tasks = set()
+
+    def __call__(self, job: Callable):
+        token = _current_job.set(self)
+        try:
+            return job()
+        finally:
+            _current_job.reset(token)
+
+    def cancel(self):
+        """Kill the processes of the job - called from the event loop."""
+        self.cancelled = True
+        for task in self._tasks:
+            task.cancel()
+
+    async def _supervise(self, cmd: List[str], timeout: float, **kwargs) -> dict:
+        if self.cancelled:
+            raise asyncio.CancelledError()
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await run_process(cmd, timeout, **kwargs)
+        finally:
+            self._tasks.discard(task)
+
+    def run_process(
+        self, cmd: List[str], on_start: Callable = None, stdin=None, **kwargs
+    ) -> dict:
+        """Run the command on the event loop and wait for it to finish.
+
+        Behaves like utils._run_with_resources: if the input is a pipe,
+        on_start is called (in this thread) with an object holding the
+        writable end of the pipe as its stdin.
+
+        Returns:
+        dict: The resources used by the command (see run_process).
+        """
+        if self.cancelled:
+            raise JobCancelledError("The run was cancelled.")
+        timeout = None
+        if self.deadline is not None:
+            timeout = self.deadline - time.monotonic()
+            if timeout <= 0:
+                raise subprocess.TimeoutExpired(cmd, self.timeout)
+
+        write_fd = None
+        if stdin == subprocess.PIPE:
+            stdin, write_fd = os.pipe()
+        started = Future()
+        try:
+            finished = asyncio.run_coroutine_threadsafe(
+                self._supervise(
+                    cmd, timeout, on_start=started.set_result, stdin=stdin, **kwargs
+                ),
+                self.loop,
+            )
+            wait([started, finished], return_when=FIRST_COMPLETED)
+        finally:
+            if write_fd is not None:
+                os.close(stdin)
+        if started.done():
+            writer = open(write_fd, "wb") if write_fd is not None else None
+            if on_start is not None:
+                on_start(SimpleNamespace(pid=started.result(), stdin=writer))
+            elif writer is not None:
+                writer.close()
+        elif write_fd is not None:
+            os.close(write_fd)
+
+        try:
+            return finished.result()
+        except FutureCancelledError:
+            raise JobCancelledError("The run was cancelled.") from None
+        except subprocess.TimeoutExpired:
+            raise subprocess.TimeoutExpired(cmd, self.timeout) from None
+
+
+def current_job() -> _Job:
+    """Get the job running in the current thread, if started by a JobRunner."""
+    return _current_job.get()
+
+
+class JobRunner:
+    """Run blocking jobs concurrently, supervised by an asyncio event loop.
+
+    Jobs are taken from a bounded queue by a fixed number of workers, so
+    that jobs are only created as fast as they are run, and are started in
+    the order in which they were provided, each as soon as enough threads
+    are available. Once any of the jobs fails, no new jobs are started.
+
+    Every job runs in a worker thread, while the processes it starts run
+    on the event loop (see _Job) - this way they are killed once the job
+    times out, or once the run is cancelled by SIGINT (Ctrl-C) or SIGTERM
+    (e.g. sent by a job scheduler preempting the run). The signal is
+    raised again once all the processes are killed.
+
+    Parameters:
+    n_jobs (int): The maximum number of concurrently running jobs.
+    total_threads (int): The total number of threads available to the
+        jobs (defaults to n_jobs).
+    timeout (float): The number of seconds after which the processes of
+        a job are killed, if limited.
+    """
+
+    def __init__(self, n_jobs: int = 1, total_threads: int = None, timeout=None):
+        self.n_jobs = n_jobs
+        self.total_threads = total_threads or n_jobs
+        self.timeout = timeout
+        self._signal = None
+
+    def run(self, jobs: Iterable[Callable], threads: Iterable[int] = None) -> list:
+        """Run the jobs, as callables without arguments.
+
+        The error raised is always the one of the first failed job (in the
+        order in which the jobs were provided), irrespective of the order
+        in which the jobs finished.
+
+        Parameters:
+        jobs (Iterable[Callable]): The jobs to run.
+        threads (Iterable[int]): The number of threads used by every job
+            (one by default).
+
+        Returns:
+        list: The results of all the jobs.
+        """
+        self._signal = None
+        threads = itertools.repeat(1) if threads is None else threads
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            outcomes = asyncio.run(self._run(jobs, threads))
+        else:
+            outcomes = self._run_in_thread(jobs, threads)
+
+        if self._signal is not None:
+            signal.raise_signal(self._signal)
+        outcomes = [outcomes[i] for i in sorted(outcomes)]
+        for _, error in outcomes:
+            if error is not None:
+                raise error
+        return [result for result, _ in outcomes]
+
+    def _cancel(self, signum: int, budget: _CoreBudget, running: set):
+        self._signal = signum
+        print(
+            f"Received {signal.Signals(signum).name}, killing the running "
+            "processes.",
+            file=sys.stderr,
+            flush=True,
+        )
+        asyncio.get_running_loop().create_task(budget.abort())
+        for job in running:
+            job.cancel()
+
+    def _run_in_thread(self, jobs: Iterable[Callable], threads: Iterable[int]):
+        """Run the jobs on an event loop of their own, in a separate thread.
+
+        Used if the caller runs an event loop (e.g. of a notebook), which
+        cannot be blocked. The signal handlers of the caller are replaced
+        until the jobs are finished, so that SIGINT and SIGTERM kill the
+        processes here too - the signal is raised again once they are
+        killed (see run), to be handled by the caller.
+        """
+        started = Future()
+
+        def _cancel(signum: int, *_):
+            # the loop of the runner is only available once it started
+            wait([started, outcome], return_when=FIRST_COMPLETED)
+            if started.done() and not outcome.done():
+                loop, budget, running = started.result()
+                with contextlib.suppress(RuntimeError):
+                    loop.call_soon_threadsafe(self._cancel, signum, budget, running)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            outcome = executor.submit(asyncio.run, self._run(jobs, threads, started))
+            handlers = {}
+            if threading.current_thread() is threading.main_thread():
+                for signum in CANCEL_SIGNALS:
+                    handlers[signum] = signal.signal(signum, _cancel)
+            try:
+                return outcome.result()
+            except BaseException:
+                # e.g. a KeyboardInterrupt raised by a handler of the caller
+                _cancel(signal.SIGINT)
+                wait([outcome])
+                raise
+            finally:
+                for signum, handler in handlers.items():
+                    signal.signal(signum, handler)
+
+    async def _run(
+        self, jobs: Iterable[Callable], threads: Iterable[int], started: Future = None
+    ) -> dict:
+        loop = asyncio.get_running_loop()
+        budget = _CoreBudget(self.total_threads, self.n_jobs)
+        queue = asyncio.Queue(maxsize=self.n_jobs)
+        # taking a job and waiting for its threads is done by one worker at
+        # a time, so that jobs are started in order
+        in_order = asyncio.Lock()
+        running, outcomes = set(), {}
+        if started is not None:
+            started.set_result((loop, budget, running))
+
+        async def produce():
+            for item in enumerate(zip(jobs, threads)):
+                if budget.aborted:
+                    break
+                await queue.put(item)
+            for _ in range(self.n_jobs):
+                await queue.put(None)
+
+        async def work(executor: ThreadPoolExecutor):
+            while True:
+                async with in_order:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    i, (job, job_threads) = item
+                    if not await budget.acquire(job_threads):
+                        continue
+                state = _Job(loop, self.timeout)
+                running.add(state)
+                failed = True
+                try:
+                    outcomes[i] = (
+                        await loop.run_in_executor(executor, state, job),
+                        None,
+                    )
+                    failed = False
+                except Exception as e:
+                    outcomes[i] = (None, e)
+                finally:
+                    running.discard(state)
+                    await budget.release(job_threads, failed=failed)
+
+        handled = []
+        if threading.current_thread() is threading.main_thread():
+            for signum in CANCEL_SIGNALS:
+                with contextlib.suppress(NotImplementedError, RuntimeError):
+                    loop.add_signal_handler(
+                        signum, self._cancel, signum, budget, running
+                    )
+                    handled.append(signum)
+        try:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                await asyncio.gather(
+                    produce(), *(work(executor) for _ in range(self.n_jobs))
+                )
+        finally:
+            for signum in handled:
+                loop.remove_signal_handler(signum)
+        return outcomes
@@ -0,0 +1,53 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Run a command and report the resources used by its process.
+
+Processes started by asyncio are reaped by asyncio itself, which does not
+give access to their resource usage - the job runner therefore starts them
+through this script, which waits for the command and writes its return
+code and resource usage as JSON into the file descriptor given as the
+first argument (or the error if the command could not be started):
+
+    python _rusage.py FD COMMAND [ARGUMENTS...]
+
+The script is run by its path, not as a module of the package, so that it
+starts without importing the plugin.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+
+def main():
+    fd, cmd = int(sys.argv[1]), sys.argv[2:]
+    try:
+        process = subprocess.Popen(cmd)
+    except OSError as e:
+        # e.g. the command was not found - reported to be raised as is
+        with os.fdopen(fd, "w") as f:
+            json.dump({"errno": e.errno, "strerror": e.strerror}, f)
+        return
+    _, status, rusage = os.wait4(process.pid, 0)
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    max_rss = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    with os.fdopen(fd, "w") as f:
+        json.dump(
+            {
+                "returncode": os.waitstatus_to_exitcode(status),
+                "user_time": rusage.ru_utime,
+                "system_time": rusage.ru_stime,
+                "max_rss": max_rss,
+            },
+            f,
+        )
+
+
+if __name__ == "__main__":
+    main()
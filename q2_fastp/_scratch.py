@@ -0,0 +1,178 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .utils import _copy_file
+
+# the number of threads moving the outputs from the scratch directory
+MOVE_WORKERS = 2
+
+
+class ScratchStager:
+    """Stage the inputs and outputs of fastp on fast local storage.
+
+    A background thread copies the inputs of the samples to the scratch
+    directory, one sample at a time and in the order in which the samples
+    are processed - at most `prefetch` samples ahead of the samples whose
+    processing already started. The outputs are written to the scratch
+    directory too and moved to their destination in the background, while
+    the next samples are processed.
+
+    Every staged sample reserves twice the size of its inputs (for the
+    inputs and the outputs) from the byte budget until its outputs are
+    moved, or discarded if it failed. A sample which does not fit into the
+    budget on its own is only staged once nothing else is.
+
+    Parameters:
+    path (str): The scratch directory.
+    inputs (Dict[str, List[str]]): The input files of every sample to be
+        staged, in the order in which the samples are processed.
+    max_size (int): The byte budget of the scratch directory.
+    prefetch (int): The number of samples staged ahead.
+    """
+
+    def __init__(
+        self, path: str, inputs: Dict[str, List[str]], max_size: int, prefetch: int
+    ):
+        self.path = path
+        self.inputs = inputs
+        self.sizes = {
+            sample_id: sum(os.path.getsize(fp) for fp in fps)
+            for sample_id, fps in inputs.items()
+        }
+        self.max_size = max_size
+        self.prefetch = prefetch
+        self.used = 0
+        self.started = 0
+        self.staged = {}
+        # the samples whose outputs reserve space but are not being moved
+        self.unmoved = set()
+        self.error = None
+        self.closed = False
+        self._condition = threading.Condition()
+        self._movers = ThreadPoolExecutor(max_workers=MOVE_WORKERS)
+        self._moves = []
+        self._prefetcher = threading.Thread(target=self._prefetch, daemon=True)
+        self._prefetcher.start()
+
+    def _fits(self, position: int, size: int) -> bool:
+        if position >= self.started + self.prefetch:
+            return False
+        return self.used == 0 or self.used + size <= self.max_size
+
+    def _prefetch(self):
+        for position, (sample_id, fps) in enumerate(self.inputs.items()):
+            size = 2 * self.sizes[sample_id]
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self.closed or self._fits(position, size)
+                )
+                if self.closed:
+                    return
+                self.used += size
+                self.unmoved.add(sample_id)
+
+            sample_dir = os.path.join(self.path, f"inputs-{position}")
+            try:
+                os.makedirs(sample_dir)
+                staged = []
+                for fp in fps:
+                    staged.append(os.path.join(sample_dir, os.path.basename(fp)))
+                    _copy_file(fp, staged[-1])
+            except OSError as e:
+                with self._condition:
+                    self.error = e
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                self.staged[sample_id] = staged
+                self._condition.notify_all()
+
+    def wait_for_inputs(self, sample_id: str) -> List[str]:
+        """Wait until the inputs of the sample are staged.
+
+        Samples need to be requested in the order in which they were
+        provided - every request lets the prefetching move on.
+
+        Returns:
+        List[str]: The staged input files of the sample.
+        """
+        with self._condition:
+            self.started += 1
+            self._condition.notify_all()
+            self._condition.wait_for(
+                lambda: sample_id in self.staged or self.error is not None
+            )
+            if self.error is not None:
+                raise RuntimeError(
+                    f"Staging the inputs in {self.path} failed: {self.error}"
+                ) from self.error
+            return self.staged[sample_id]
+
+    def discard_inputs(self, sample_id: str):
+        """Remove the staged inputs of a sample once it was processed."""
+        with self._condition:
+            staged = self.staged.pop(sample_id)
+        for fp in staged:
+            os.remove(fp)
+        with self._condition:
+            self.used -= self.sizes[sample_id]
+            self._condition.notify_all()
+
+    def _release_outputs(self, sample_id: str):
+        with self._condition:
+            self.used -= self.sizes.get(sample_id, 0)
+            self._condition.notify_all()
+
+    def discard_outputs(self, sample_id: str):
+        """Release the space reserved for the outputs of a sample.
+
+        The outputs of a failed sample are never moved, so its reservation
+        has to be released for the following samples to be staged. Does
+        nothing once the outputs are moved (see move_outputs), so it can be
+        called whenever the processing of a sample ends.
+        """
+        with self._condition:
+            if sample_id not in self.unmoved:
+                return
+            self.unmoved.remove(sample_id)
+        self._release_outputs(sample_id)
+
+    def _move(self, sample_id: str, moves: Dict[str, str]):
+        try:
+            for src, dst in moves.items():
+                shutil.move(src, dst)
+        finally:
+            self._release_outputs(sample_id)
+
+    def move_outputs(self, sample_id: str, moves: Dict[str, str]):
+        """Move the outputs of a sample to their destinations in the background.
+
+        Parameters:
+        sample_id (str): The sample the outputs belong to.
+        moves (Dict[str, str]): The destinations, by the staged output files.
+        """
+        with self._condition:
+            self.unmoved.discard(sample_id)
+        self._moves.append(self._movers.submit(self._move, sample_id, moves))
+
+    def close(self):
+        """Stop prefetching and wait until all the outputs are moved."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self._prefetcher.join()
+        self._movers.shutdown(wait=True)
+        for future in self._moves:
+            if future.exception() is not None:
+                raise future.exception()
@@ -0,0 +1,114 @@
+// Render a paginated, sortable and filterable table of samples.
+//
+// The table is given in the "split" orientation of pandas (with the
+// "columns", "index" and "data" keys) and rendered into the container.
+// Only the rows of the current page are rendered, so that the page stays
+// responsive with thousands of samples.
+function renderSampleTable(container, table) {
+  container.innerHTML =
+    '<div class="pager form-inline" style="margin: 10px 0;">' +
+    '<input class="form-control input-sm st-filter" type="text" ' +
+    'placeholder="Filter samples" style="width: auto;"> ' +
+    '<select class="form-control input-sm st-page-size" style="width: auto;">' +
+    '<option>25</option><option selected>50</option><option>100</option>' +
+    '<option>500</option></select> ' +
+    '<button class="btn btn-default btn-sm st-previous">&laquo;</button> ' +
+    '<span class="st-page-info"></span> ' +
+    '<button class="btn btn-default btn-sm st-next">&raquo;</button></div>' +
+    '<table class="table table-striped table-hover table-condensed">' +
+    '<thead></thead><tbody></tbody></table>';
+
+  var columns = ['Sample'].concat(table.columns);
+  var rows = table.index.map(function (id, i) {
+    return [id].concat(table.data[i]);
+  });
+  var shown = rows.slice(), page = 0, sortColumn = null, ascending = true;
+
+  var head = container.querySelector('thead');
+  var body = container.querySelector('tbody');
+  var pageSizeSelect = container.querySelector('.st-page-size');
+  // sample IDs and column names are set as text, never parsed as HTML
+  var headRow = document.createElement('tr');
+  columns.forEach(function (c, i) {
+    var th = document.createElement('th');
+    th.setAttribute('data-column', i);
+    th.style.cursor = 'pointer';
+    th.style.whiteSpace = 'nowrap';
+    th.textContent = c;
+    headRow.appendChild(th);
+  });
+  head.appendChild(headRow);
+
+  function pageSize() {
+    return parseInt(pageSizeSelect.value, 10);
+  }
+
+  function format(value) {
+    if (value === null) { return ''; }
+    return typeof value === 'number' ? value.toLocaleString() : value;
+  }
+
+  function render() {
+    var pages = Math.max(Math.ceil(shown.length / pageSize()), 1);
+    page = Math.min(Math.max(page, 0), pages - 1);
+    var start = page * pageSize();
+    var rowsShown = document.createDocumentFragment();
+    shown.slice(start, start + pageSize()).forEach(function (row) {
+      var tr = document.createElement('tr');
+      row.forEach(function (value, i) {
+        var td = document.createElement('td');
+        td.style.textAlign = i === 0 ? 'left' : 'right';
+        td.textContent = format(value);
+        tr.appendChild(td);
+      });
+      rowsShown.appendChild(tr);
+    });
+    body.textContent = '';
+    body.appendChild(rowsShown);
+    container.querySelector('.st-page-info').textContent =
+      'Page ' + (page + 1) + ' of ' + pages + ' (' + shown.length + ' samples)';
+  }
+
+  function sortRows() {
+    if (sortColumn === null) { return; }
+    shown.sort(function (a, b) {
+      var x = a[sortColumn], y = b[sortColumn];
+      if (x === y) { return 0; }
+      if (x === null) { return 1; }
+      if (y === null) { return -1; }
+      return (x < y ? -1 : 1) * (ascending ? 1 : -1);
+    });
+  }
+
+  container.querySelector('.st-filter').addEventListener('input', function (e) {
+    var query = e.target.value.toLowerCase();
+    shown = rows.filter(function (row) {
+      return String(row[0]).toLowerCase().indexOf(query) !== -1;
+    });
+    sortRows();
+    page = 0;
+    render();
+  });
+  pageSizeSelect.addEventListener('change', function () {
+    page = 0;
+    render();
+  });
+  container.querySelector('.st-previous').addEventListener('click', function () {
+    page -= 1;
+    render();
+  });
+  container.querySelector('.st-next').addEventListener('click', function () {
+    page += 1;
+    render();
+  });
+  head.addEventListener('click', function (e) {
+    var column = parseInt(e.target.getAttribute('data-column'), 10);
+    if (isNaN(column)) { return; }
+    ascending = sortColumn === column ? !ascending : true;
+    sortColumn = column;
+    sortRows();
+    render();
+  });
+
+  render();
+}
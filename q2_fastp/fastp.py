@@ -5,39 +5,178 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
-import glob
+import contextlib
+import contextvars
+import gzip
+import json
 import os
-from typing import List
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import BinaryIO, Callable, Dict, List, Tuple
 from warnings import warn
 
-from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+import numpy as np
+import pandas as pd
+from q2_types.per_sample_sequences import (
+    CasavaOneEightSingleLanePerSampleDirFmt,
+    PairedEndSequencesWithQuality,
+)
+from q2_types.sample_data import SampleData
 
+from ._cache import (
+    FastpResultCache,
+    fingerprint_files,
+    get_fastp_version,
+    hash_cmd,
+)
+from ._journal import CheckpointJournal
+from ._runner import JobRunner
+from ._scratch import ScratchStager
+from .reports import merge_reports
 from .types import FastpJsonDirectoryFormat
-from .utils import add_param, run_command
+from .utils import (
+    EXTERNAL_CMD_WARNING,
+    _find_duplicates,
+    _read_sample_table,
+    _transfer_files,
+    add_param,
+    link_or_copy,
+    run_command,
+)
 
+# the file names of the Casava 1.8 format
+CASAVA_FILENAME = re.compile(
+    r"^(?P<sample_id>.+)_(?P<barcode>.+)_L(?P<lane>\d{3})_R(?P<read>[12])_001"
+    r"\.fastq\.gz$"
+)
 
-def _find_empty_samples(
-    sequences: CasavaOneEightSingleLanePerSampleDirFmt, original_ids: List[str]
-) -> List[str]:
+# fastp does not make use of more than 16 worker threads
+FASTP_MAX_THREADS = 16
+
+# the number of reads dealt out to a shard of a split sample at a time
+SHARD_BATCH_READS = 1000
+
+# deals the reads of an uncompressed FASTQ file out to the files of the
+# shards (named by the prefix and the shard) and writes the number of reads
+SPLIT_READS_AWK = (
+    'BEGIN { for (i = 0; i < shards; i++) printf "" > (prefix i ".fastq") }'
+    ' { print > (prefix (int((NR - 1) / (4 * batch)) % shards) ".fastq") }'
+    " END {"
+    '  if (NR % 4) { print "The file ends with an incomplete read." > "/dev/stderr";'
+    "  exit 1 }"
+    '  print NR / 4 > (prefix "reads") }'
+)
+
+# the number of lines of fastp's output shown when it fails
+LOG_TAIL_LINES = 20
+# the minimal interval between progress updates, in seconds
+PROGRESS_INTERVAL = 10
+
+# the parameters of process_seqs which are not passed to fastp as they are
+RUN_PARAMS = [
+    "trim_front2",
+    "trim_tail2",
+    "max_len2",
+    "adapter_sequence_r2",
+    "n_jobs",
+    "cache_dir",
+    "cache_max_size",
+    "keep_html_reports",
+    "keep_empty_samples",
+    "output_compressor",
+    "stage_to_scratch",
+    "scratch_dir",
+    "scratch_max_size",
+    "prefetch_samples",
+    "work_dir",
+    "on_sample_failure",
+    "shard_size",
+    "sample_timeout",
+]
+
+# the compressors which can replace the built-in gzip compression of fastp,
+# with the highest compression level they support
+OUTPUT_COMPRESSORS = {"pigz": 9, "bgzip": 9}
+
+TIMING_COLUMNS = [
+    "wall_time",
+    "user_time",
+    "system_time",
+    "max_rss",
+    "bytes_read",
+    "bytes_written",
+    "reads_before_filtering",
+]
+
+
+def _lane_manifest(
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+) -> pd.DataFrame:
+    """Build the manifest of the sequences, with all the lanes of every sample.
+
+    Returns:
+    pd.DataFrame: The lane files of every sample (sorted by lane) in the
+        "forward" and "reverse" columns, indexed by sample ID. The reverse
+        reads of single-end samples are None.
+    """
+    lanes = {}
+    for fp in sorted(sequences.path.glob("*.fastq.gz")):
+        match = CASAVA_FILENAME.match(fp.name)
+        if match is None:
+            continue
+        direction = "forward" if match["read"] == "1" else "reverse"
+        sample = lanes.setdefault(match["sample_id"], {"forward": [], "reverse": []})
+        sample[direction].append(str(fp))
+
+    manifest = pd.DataFrame.from_dict(lanes, orient="index")
+    manifest["reverse"] = manifest["reverse"].map(lambda fps: fps or None)
+    manifest.index.name = "sample-id"
+    return manifest
+
+
+def _count_reads(json_fp: str, stage: str = "after_filtering") -> int:
+    """Get the number of reads from the summary of a fastp JSON report.
+
+    The summary section is always written at the top of the report,
+    so the number can usually be found without parsing the whole file.
+
+    Parameters:
+    json_fp (str): The fastp JSON report.
+    stage (str): Either "before_filtering" or "after_filtering".
+
+    Returns:
+    int: The total number of reads at the given stage.
+    """
+    with open(json_fp) as f:
+        match = re.search(rf'"{stage}":\s*{{\s*"total_reads":\s*(\d+)', f.read(4096))
+        if match:
+            return int(match.group(1))
+        f.seek(0)
+        return json.load(f)["summary"][stage]["total_reads"]
+
+
+def _find_empty_samples(read_counts: Dict[str, int]) -> List[str]:
     """Find empty samples.
 
     Parameters:
-    sequences (CasavaOneEightSingleLanePerSampleDirFmt):
-        The sequences to find empty samples within.
-    original_ids (List[str]): Sample IDs for the sequences.
+    read_counts (Dict[str, int]): The number of reads left after
+        processing, by sample ID.
 
     Returns:
     List[str]: A list of empty samples.
     """
+    empty_samples = [
+        sample_id for sample_id, count in read_counts.items() if count == 0
+    ]
 
-    empty_samples = []
-    all_reads = sorted(glob.glob(os.path.join(sequences.path, "*.fastq.gz")))
-    for sample_id in original_ids:
-        current_sample = [x for x in all_reads if sample_id in x]
-        if any(os.path.getsize(f) == 0 for f in current_sample):
-            empty_samples.append(sample_id)
-
-    if len(empty_samples) == len(original_ids):
+    if len(empty_samples) == len(read_counts):
         raise ValueError(
             "All samples are empty after processing with fastp - please check "
             "your run parameters and try again."
@@ -51,87 +190,1293 @@ def _find_empty_samples(
     return empty_samples
 
 
-def _remove_samples(
-    sequences: CasavaOneEightSingleLanePerSampleDirFmt, samples: List[str]
-) -> CasavaOneEightSingleLanePerSampleDirFmt:
-    """Remove samples from the sequence set.
+def _finalize_sample(
+    job: Callable,
+    outputs: Dict[str, str],
+    destinations: Dict[str, str],
+    keep_empty: bool = False,
+    move: Callable[[Dict[str, str]], None] = None,
+) -> dict:
+    """Run the job processing a sample and move its reads to the output.
+
+    The reads are produced in a staging location and only moved to their
+    destination if any of them are left after filtering - unless requested
+    otherwise, empty samples are never written to the output.
 
     Parameters:
-    sequences (CasavaOneEightSingleLanePerSampleDirFmt):
-        The sequences to remove samples from.
+    job (Callable): The job producing the outputs of the sample.
+    outputs (Dict[str, str]): The output files of the sample, by fastp role.
+    destinations (Dict[str, str]): The final location of the staged
+        output files, by fastp role.
+    keep_empty (bool): Whether to move the reads of empty samples too - an
+        empty file is written for reads which are missing.
+    move (Callable[[Dict[str, str]], None]): Moves the staged files to their
+        destinations, given by the staged files. They are renamed by default.
+
+    Returns:
+    dict: The record of the job, extended with the number of reads
+        before and after filtering.
+    """
+    record = job()
+    record["reads_before_filtering"] = _count_reads(outputs["json"], "before_filtering")
+    record["reads_after_filtering"] = _count_reads(outputs["json"])
+    moves = {}
+    for role, dst in destinations.items():
+        if record["reads_after_filtering"] > 0 or keep_empty:
+            if not os.path.exists(outputs[role]):
+                # an empty sample reused from a run which did not keep it
+                with gzip.open(outputs[role], "wb"):
+                    pass
+            moves[outputs[role]] = dst
+        elif os.path.exists(outputs[role]):
+            os.remove(outputs[role])
+    if move is not None:
+        move(moves)
+    else:
+        for src, dst in moves.items():
+            os.replace(src, dst)
+    return record
+
+
+def _split_core_budget(threads: int, n_jobs: int, n_samples: int) -> Tuple[int, int]:
+    """Split the total core budget between concurrent fastp processes.
+
+    Parameters:
+    threads (int): The total number of threads available to the run.
+    n_jobs (int): The requested number of concurrently processed samples.
+    n_samples (int): The number of samples to be processed.
 
     Returns:
-    CasavaOneEightSingleLanePerSampleDirFmt: The sequences without the empty samples.
+    Tuple[int, int]: The number of concurrent fastp processes and
+        the number of threads each of them should use.
     """
-    for sample_id in samples:
-        for f in glob.glob(os.path.join(sequences.path, f"{sample_id}*.fastq.gz")):
-            os.remove(f)
-    return sequences
+    n_jobs = max(1, min(n_jobs, n_samples))
+    return n_jobs, max(1, threads // n_jobs)
 
 
-def _run_fastp(sequences: CasavaOneEightSingleLanePerSampleDirFmt, params: dict):
+def _input_size(fps) -> int:
+    """Get the size of an input file, or of all the lane files of a sample."""
+    if not fps:
+        return 0
+    if isinstance(fps, str):
+        return os.path.getsize(fps)
+    return sum(os.path.getsize(fp) for fp in fps)
+
+
+def _plan_fastp_runs(
+    manifest: pd.DataFrame, threads: int, n_jobs: int, shard_size: int = 0
+) -> pd.DataFrame:
+    """Plan the order of fastp runs and the number of threads for each of them.
+
+    Samples are launched largest first (longest-processing-time scheduling).
+    If samples are processed concurrently, a sample of median input size
+    gets an even share of the core budget; larger samples get proportionally
+    more threads (up to the fastp limit) and smaller samples proportionally
+    fewer (at least one). If they are processed one at a time, every sample
+    gets the whole budget, as the other cores would be idle. Samples larger
+    than the shard size are split into shards of about that size, each
+    processed by its own fastp process - they are not limited by the number
+    of threads a single fastp process can use, only by the total budget.
+
+    Parameters:
+    manifest (pd.DataFrame): The manifest of the sequences to be processed,
+        with either a single file or a list of lane files per read direction.
+    threads (int): The total number of threads available to the run.
+    n_jobs (int): The requested number of concurrently processed samples.
+    shard_size (int): The input size (in bytes) above which samples are
+        split into shards. Samples are never split if 0.
+
+    Returns:
+    pd.DataFrame: The run plan, indexed by sample ID and sorted by the
+        launch order, with the input size (in bytes), the number of
+        threads and the number of shards assigned to every sample.
+    """
+    sizes = manifest[[c for c in ("forward", "reverse") if c in manifest.columns]]
+    sizes = sizes.apply(lambda col: col.map(_input_size)).sum(axis=1)
+
+    n_jobs, threads_per_job = _split_core_budget(threads, n_jobs, len(manifest))
+    if n_jobs > 1:
+        scale = sizes / max(sizes.median(), 1)
+    else:
+        scale = pd.Series(1.0, index=sizes.index)
+    sample_threads = (
+        (scale * threads_per_job)
+        .round()
+        .clip(lower=1, upper=min(threads, FASTP_MAX_THREADS))
+        .astype(int)
+    )
+
+    plan = pd.DataFrame({"input_size": sizes, "threads": sample_threads, "shards": 1})
+    if shard_size > 0:
+        split_threads = (
+            (scale * threads_per_job).round().clip(lower=1, upper=threads).astype(int)
+        )
+        # every shard is processed by at least one thread
+        shards = np.minimum(np.ceil(sizes / shard_size), split_threads).astype(int)
+        split = shards > 1
+        plan.loc[split, "shards"] = shards[split]
+        plan.loc[split, "threads"] = split_threads[split]
+
+    plan = plan.sort_values("input_size", ascending=False, kind="stable")
+    plan.insert(0, "launch_order", range(1, len(plan) + 1))
+    plan.index.name = "sample-id"
+    return plan
+
+
+def _run_jobs(
+    jobs: List[Callable],
+    threads: List[int],
+    n_jobs: int,
+    total_threads: int,
+    timeout: float = None,
+) -> list:
+    """Run the jobs concurrently, within the given core budget.
+
+    Jobs are started in the order in which they were provided, each as
+    soon as enough threads are available. Once any of the jobs fails,
+    no new jobs are started. The error raised is always the one of the
+    first failed job (in the order in which the jobs were provided),
+    irrespective of the order in which the jobs finished. The processes
+    started by the jobs are killed if the run is interrupted (see
+    JobRunner).
+
+    Parameters:
+    jobs (List[Callable]): The jobs to run, as callables without arguments.
+    threads (List[int]): The number of threads used by every job.
+    n_jobs (int): The maximum number of concurrently running jobs.
+    total_threads (int): The total number of threads available.
+    timeout (float): The number of seconds after which the processes of
+        a job are killed, if limited.
+
+    Returns:
+    list: The results of all the jobs.
+    """
+    return JobRunner(n_jobs, total_threads, timeout).run(jobs, threads)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class _Progress:
+    """Report the number of finished samples and the estimated time left.
+
+    Updates are printed at most once per interval (and always once all
+    samples are finished), so that runs with many samples do not flood
+    the output.
+    """
+
+    def __init__(self, total: int, interval: float = PROGRESS_INTERVAL):
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.start = time.perf_counter()
+        self._last_update = self.start
+        self._lock = threading.Lock()
+
+    def update(self):
+        with self._lock:
+            self.done += 1
+            now = time.perf_counter()
+            if self.done < self.total and now - self._last_update < self.interval:
+                return
+            self._last_update = now
+            elapsed = now - self.start
+            eta = elapsed / self.done * (self.total - self.done)
+            print(
+                f"Processed {self.done}/{self.total} samples "
+                f"({self.done / self.total:.0%}), elapsed "
+                f"{_format_duration(elapsed)}, ETA {_format_duration(eta)}.",
+                flush=True,
+            )
+
+    def run(self, job: Callable):
+        """Run the job and count it as finished once it succeeds."""
+        result = job()
+        self.update()
+        return result
+
+
+def _split_compression_threads(
+    threads: int, n_outputs: int, compressor: str
+) -> Tuple[int, int]:
+    """Split the threads of a sample between fastp and its output compressors.
+
+    External compressors run next to fastp, so half of the threads are
+    split between them (at least one each) and fastp gets the rest. Stored
+    ("none") outputs take hardly any CPU time, so fastp keeps all threads.
+
+    Parameters:
+    threads (int): The number of threads of the sample.
+    n_outputs (int): The number of compressed output files.
+    compressor (str): The output compressor.
+
+    Returns:
+    Tuple[int, int]: The number of threads of fastp and of every compressor.
+    """
+    if compressor not in OUTPUT_COMPRESSORS:
+        return threads, 1
+    compressor_threads = max(1, threads // (2 * n_outputs))
+    return max(1, threads - n_outputs * compressor_threads), compressor_threads
+
+
+class _OutputCompressor:
+    """Compress the reads written by fastp outside of fastp.
+
+    fastp writes uncompressed reads into named pipes, which are read by
+    the compressors (one per output file) running next to it. "pigz"
+    compresses with several threads, "bgzip" writes blocked gzip (BGZF)
+    files which downstream tools can decompress in parallel and "none"
+    writes gzip files with uncompressed (stored) blocks - they keep the
+    format required by the sequence artifacts, but cost no compression.
+
+    Parameters:
+    name (str): The compressor - "pigz", "bgzip" or "none".
+    pipes (Dict[str, str]): The output files, by the pipe they are read from.
+    level (int): The compression level (capped at the highest level
+        supported by the compressor).
+    threads (int): The number of threads of every compressor (see
+        _split_compression_threads).
+    """
+
+    def __init__(self, name: str, pipes: Dict[str, str], level: int, threads: int):
+        self.name = name
+        self.pipes = pipes
+        self.level = min(level, OUTPUT_COMPRESSORS.get(name, 0))
+        self.threads = threads
+        self.usage = {"user_time": 0.0, "system_time": 0.0}
+        self.errors = []
+        self._lock = threading.Lock()
+
+    @property
+    def key_args(self) -> List[str]:
+        """The arguments identifying the compressor in the cache keys."""
+        return ["--output_compressor", self.name]
+
+    def command(self) -> List[str]:
+        if self.name == "pigz":
+            return ["pigz", "-c", f"-{self.level}", "-p", str(self.threads)]
+        return ["bgzip", "-c", "-l", str(self.level), "-@", str(self.threads)]
+
+    def _write(self, src: BinaryIO, output_fp: str, log):
+        if self.name == "none":
+            with gzip.open(output_fp, "wb", compresslevel=0) as dst:
+                shutil.copyfileobj(src, dst, 1024**2)
+            return
+
+        with open(output_fp, "wb") as dst:
+            process = subprocess.Popen(
+                self.command(), stdin=src, stdout=dst, stderr=log
+            )
+            _, status, rusage = os.wait4(process.pid, 0)
+
+        with self._lock:
+            self.usage["user_time"] += rusage.ru_utime
+            self.usage["system_time"] += rusage.ru_stime
+            if os.waitstatus_to_exitcode(status) != 0:
+                self.errors.append(
+                    f"{self.name} failed with return code "
+                    f"{os.waitstatus_to_exitcode(status)}."
+                )
+
+    def _compress(self, read_fd: int, output_fp: str, log):
+        with open(read_fd, "rb") as src:
+            try:
+                self._write(src, output_fp, log)
+            except Exception as e:
+                # raised by running() once fastp finished
+                with self._lock:
+                    self.errors.append(f"Writing {output_fp} failed: {e}")
+            # discard whatever a failed compressor left unread, so that
+            # fastp does not block on writing into the pipe
+            while src.read(1024**2):
+                pass
+
+    @contextlib.contextmanager
+    def running(self, log):
+        """Run the compressors while fastp writes into the pipes.
+
+        Every pipe is held open for writing until fastp finishes, so that
+        the compressors do not see the end of their input before fastp
+        opens the pipe (or, if fastp fails early, never opens it).
+        """
+        workers, keep_fds = [], []
+        for pipe, output_fp in self.pipes.items():
+            os.mkfifo(pipe)
+            read_fd = os.open(pipe, os.O_RDONLY | os.O_NONBLOCK)
+            os.set_blocking(read_fd, True)
+            keep_fds.append(os.open(pipe, os.O_WRONLY))
+            worker = threading.Thread(
+                target=self._compress, args=(read_fd, output_fp, log), daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+        try:
+            yield
+        finally:
+            for fd in keep_fds:
+                os.close(fd)
+            for worker in workers:
+                worker.join()
+            for pipe in self.pipes:
+                os.remove(pipe)
+        if self.errors:
+            raise RuntimeError(" ".join(self.errors))
+
+
+@contextlib.contextmanager
+def _concatenated_lanes(lanes: Dict[str, List[str]]):
+    """Concatenate the lane files of a sample into temporary input files.
+
+    fastp reads its input files twice - first to evaluate the reads (to
+    detect the adapters and overrepresented sequences and the read length)
+    - so the lanes need to be written into files it can read again.
+    Concatenated gzip files are a valid gzip file, so the lanes are copied
+    as they are, without recompressing them. The files are removed once
+    fastp finished.
+
+    Parameters:
+    lanes (Dict[str, List[str]]): The lane files, by the file they are
+        concatenated into.
+    """
+    try:
+        for fp, lane_fps in lanes.items():
+            with open(fp, "wb") as dst:
+                for lane_fp in lane_fps:
+                    with open(lane_fp, "rb") as src:
+                        shutil.copyfileobj(src, dst, 1024**2)
+        yield
+    finally:
+        for fp in lanes:
+            if os.path.exists(fp):
+                os.remove(fp)
+
+
+def _shard_cmd(
+    cmd: List[str], shard: int, n_shards: int, shard_dir: str
+) -> Tuple[List[str], Dict[str, str]]:
+    """Build the fastp command processing a single shard of a sample.
+
+    The shard is read from its files in the shard directory (see
+    _split_reads) and its outputs are written next to those of the sample.
+    The threads of the sample are split evenly between its shards.
+    Duplication is not evaluated, as its rate cannot be merged across shards.
+
+    Parameters:
+    cmd (List[str]): The fastp command processing the whole sample.
+    shard (int): The index of the shard.
+    n_shards (int): The number of shards of the sample.
+    shard_dir (str): The directory holding the input files of the shards.
+
+    Returns:
+    Tuple[List[str], Dict[str, str]]: The command and the output files of
+        the shard, by the fastp option writing them.
+    """
+    shard_cmd, outputs = [cmd[0]], {}
+    args = iter(cmd[1:])
+    for arg in args:
+        if arg in ("--in1", "--in2"):
+            next(args)
+            shard_cmd.extend([arg, os.path.join(shard_dir, f"{arg[2:]}-{shard}.fastq")])
+        elif arg in ("--out1", "--out2", "--json"):
+            fp = next(args)
+            outputs[arg] = os.path.join(
+                os.path.dirname(fp), f"shard{shard}-{os.path.basename(fp)}"
+            )
+            shard_cmd.extend([arg, outputs[arg]])
+        elif arg == "--html":
+            shard_cmd.extend([arg, os.devnull])
+            next(args)
+        elif arg == "--thread":
+            shard_cmd.extend([arg, str(max(1, int(next(args)) // n_shards))])
+        else:
+            shard_cmd.append(arg)
+    if "--dont_eval_duplication" not in shard_cmd:
+        shard_cmd.append("--dont_eval_duplication")
+    return shard_cmd, outputs
+
+
+def _split_reads(
+    input_fp: str, name: str, shard_dir: str, n_shards: int, log
+) -> Tuple[int, List[dict]]:
+    """Split a gzipped FASTQ file into the uncompressed files of the shards.
+
+    The file is decompressed by gzip (or pigz, if installed) and its reads
+    dealt out round-robin by awk, in batches of SHARD_BATCH_READS, into
+    files named after the shard - e.g. "in1-0.fastq" for the forward reads
+    of the first shard. Both commands run concurrently, connected by a pipe.
+
+    Parameters:
+    input_fp (str): The file to split.
+    name (str): The name of the read (e.g. "in1"), prefixing the files.
+    shard_dir (str): The directory to write the files of the shards into.
+    n_shards (int): The number of shards.
+    log (TextIO): The file capturing the errors of the commands.
+
+    Returns:
+    Tuple[int, List[dict]]: The number of reads in the file and the
+        resources used by the commands.
+    """
+    decompressor = "pigz" if shutil.which("pigz") else "gzip"
+    cmds = [
+        [decompressor, "-cd", input_fp],
+        [
+            "awk",
+            "-v", f"prefix={name}-",
+            "-v", f"batch={SHARD_BATCH_READS}",
+            "-v", f"shards={n_shards}",
+            SPLIT_READS_AWK,
+        ],
+    ]  # fmt: skip
+    read_fd, write_fd = os.pipe()
+    # the ends of the pipe are only held by the commands once they started,
+    # so that either of them sees the other one finishing
+    ends = {read_fd: False, write_fd: False}
+
+    def _close(fd: int):
+        if not ends[fd]:
+            ends[fd] = True
+            os.close(fd)
+
+    def _run(i: int) -> dict:
+        fd = write_fd if i == 0 else read_fd
+        try:
+            return run_command(
+                cmds[i],
+                verbose=False,
+                resources=True,
+                stdin=None if i == 0 else fd,
+                stdout=fd if i == 0 else subprocess.DEVNULL,
+                stderr=log,
+                cwd=shard_dir,
+                on_start=lambda _: _close(fd),
+            )
+        finally:
+            _close(fd)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # the commands are run within the job of the sample (see JobRunner)
+        runs = [
+            executor.submit(contextvars.copy_context().run, _run, i) for i in (0, 1)
+        ]
+    usages = [run.result() for run in runs]
+    with open(os.path.join(shard_dir, f"{name}-reads")) as f:
+        return int(f.read()), usages
+
+
+def _run_shards(cmd: List[str], n_shards: int, log) -> dict:
+    """Process a sample split into shards, with a fastp process per shard.
+
+    The inputs of the sample are first split into uncompressed files of the
+    shards (see _split_reads), which are then processed at the same time -
+    fastp evaluates the reads of every shard (e.g. to detect the adapters)
+    on its own. Once they are finished, their outputs are concatenated and
+    their reports merged into the outputs of the sample, as written by the
+    given command. The reads of the sample are therefore not written in
+    their original order, but paired-end reads stay in pairs.
+
+    Parameters:
+    cmd (List[str]): The fastp command processing the whole sample.
+    n_shards (int): The number of shards to split the sample into.
+    log (TextIO): The file capturing the output of fastp.
+
+    Returns:
+    dict: The resources used by the fastp processes, together.
+    """
+    inputs = {
+        opt[2:]: cmd[cmd.index(opt) + 1] for opt in ("--in1", "--in2") if opt in cmd
+    }
+    outputs_dir = os.path.dirname(
+        cmd[cmd.index("--out1" if "--out1" in cmd else "--json") + 1]
+    )
+    shard_dir = tempfile.mkdtemp(prefix="shards-", dir=outputs_dir)
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=len(inputs)) as executor:
+            splits = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    _split_reads,
+                    fp,
+                    name,
+                    shard_dir,
+                    n_shards,
+                    log,
+                )
+                for name, fp in inputs.items()
+            ]
+        counts, usages = zip(*(split.result() for split in splits))
+        usages = [usage for split_usages in usages for usage in split_usages]
+        if len(set(counts)) > 1:
+            raise ValueError(
+                "The forward and reverse reads of the sample differ in number "
+                f"({counts[0]} and {counts[1]}): {' and '.join(inputs.values())}"
+            )
+
+        # shards which no batch of reads was dealt out to are left out
+        n_batches = -(-counts[0] // SHARD_BATCH_READS)
+        shards = [
+            _shard_cmd(cmd, shard, n_shards, shard_dir)
+            for shard in range(max(1, min(n_shards, n_batches)))
+        ]
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            # the shards are run within the job of the sample (see JobRunner)
+            runs = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    run_command,
+                    shard_cmd,
+                    verbose=False,
+                    resources=True,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+                for shard_cmd, _ in shards
+            ]
+        usages.extend(run.result() for run in runs)
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    wall_time = time.perf_counter() - start
+
+    for opt in ("--out1", "--out2"):
+        if opt not in cmd:
+            continue
+        with open(cmd[cmd.index(opt) + 1], "wb") as dst:
+            for _, outputs in shards:
+                # concatenated gzip files are a valid gzip file
+                with open(outputs[opt], "rb") as src:
+                    shutil.copyfileobj(src, dst, 1024**2)
+                os.remove(outputs[opt])
+
+    reports = []
+    for _, outputs in shards:
+        with open(outputs["--json"]) as f:
+            reports.append(json.load(f))
+        os.remove(outputs["--json"])
+    with open(cmd[cmd.index("--json") + 1], "w") as f:
+        json.dump(merge_reports(reports, command=" ".join(cmd)), f, indent="\t")
+
+    # the processes of the shards run at the same time
+    usage = {
+        key: sum(shard_usage[key] for shard_usage in usages)
+        for key in ("user_time", "system_time", "max_rss")
+    }
+    return {"wall_time": wall_time, **usage}
+
+
+def _key_args(compressor: _OutputCompressor = None, shards: int = 1) -> List[str]:
+    """Get the arguments identifying the outputs of a sample next to its command."""
+    args = compressor.key_args if compressor is not None else []
+    if shards > 1:
+        args = args + ["--shards", str(shards)]
+    return args
+
+
+def _tail(fp: str, n: int = LOG_TAIL_LINES) -> str:
+    """Get the last n lines of a text file."""
+    with open(fp, errors="replace") as f:
+        return "".join(deque(f, maxlen=n))
+
+
+def _run_sample(
+    cmd: List[str],
+    inputs: List[str],
+    outputs: Dict[str, str],
+    log_fp: str,
+    cache: FastpResultCache = None,
+    fastp_version: str = None,
+    compressor: _OutputCompressor = None,
+    lanes: Dict[str, List[str]] = None,
+    shards: int = 1,
+) -> dict:
+    """Run fastp on a single sample, reusing cached results if possible.
+
+    The output of fastp (and of the compressors) is captured in the log
+    file and only shown if either of them fails.
+
+    Parameters:
+    cmd (List[str]): The fastp command to run.
+    inputs (List[str]): The input files of the sample.
+    outputs (Dict[str, str]): The output files of the sample, by fastp role.
+    log_fp (str): The file capturing the output of fastp.
+    cache (FastpResultCache): The result cache, if enabled.
+    fastp_version (str): The version of fastp, used as a part of the cache key.
+    compressor (_OutputCompressor): The compressor of the processed reads,
+        if they are not compressed by fastp itself.
+    lanes (Dict[str, List[str]]): The lane files of samples sequenced on
+        several lanes, by the input file of fastp they are concatenated
+        into (see _concatenated_lanes).
+    shards (int): The number of shards to split the sample into
+        (see _run_shards).
+
+    Returns:
+    dict: The record of the run: the source of the results (either "fastp"
+        or "cache") and, if fastp was run, the resources it used (together
+        with the compressors).
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(inputs, cmd + _key_args(compressor, shards), fastp_version)
+        if cache.restore(key, outputs):
+            return {"source": "cache"}
+
+    with open(log_fp, "w") as log:
+        running = compressor.running(log) if compressor else contextlib.nullcontext()
+        try:
+            with _concatenated_lanes(lanes or {}), running:
+                if shards > 1:
+                    usage = _run_shards(cmd, shards, log)
+                else:
+                    usage = run_command(
+                        cmd,
+                        verbose=False,
+                        resources=True,
+                        stdout=log,
+                        stderr=subprocess.STDOUT,
+                    )
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(
+                f"{e.cmd[0]} failed with return code {e.returncode}. The command was:"
+                f"\n\n{' '.join(e.cmd)}\n\nThe last lines of its output were:\n\n"
+                f"{_tail(log_fp)}"
+            ) from e
+        except subprocess.TimeoutExpired as e:
+            raise RuntimeError(
+                f"fastp was stopped after the time limit of {e.timeout:.0f} s. "
+                f"The last lines of its output were:\n\n{_tail(log_fp)}"
+            ) from e
+        except RuntimeError as e:
+            raise RuntimeError(
+                f"{e} The last lines of the output were:\n\n{_tail(log_fp)}"
+            ) from e
+
+    record = {"source": "fastp", **usage}
+    if compressor is not None:
+        record["user_time"] += compressor.usage["user_time"]
+        record["system_time"] += compressor.usage["system_time"]
+    record["bytes_read"] = sum(os.path.getsize(fp) for fp in inputs)
+    record["bytes_written"] = sum(
+        os.path.getsize(fp) for fp in outputs.values() if os.path.exists(fp)
+    )
+
+    if cache is not None:
+        cache.store(key, outputs)
+    return record
+
+
+def _run_staged_sample(
+    stager: ScratchStager,
+    sample_id: str,
+    cmd: List[str],
+    inputs: List[str],
+    *args,
+    lanes: Dict[str, List[str]] = None,
+    shards: int = 1,
+) -> dict:
+    """Run fastp on a single sample, reading its inputs from the scratch.
+
+    Parameters:
+    stager (ScratchStager): The stager of the inputs.
+    sample_id (str): The sample to process.
+    cmd (List[str]): The fastp command to run, reading the original inputs.
+    inputs (List[str]): The original input files of the sample.
+    *args: The remaining arguments of _run_sample.
+    lanes (Dict[str, List[str]]): The original lane files of the sample,
+        by the input file of fastp they are concatenated into.
+    shards (int): The number of shards to split the sample into.
+
+    Returns:
+    dict: The record of the run (see _run_sample).
+    """
+    staged = dict(zip(inputs, stager.wait_for_inputs(sample_id)))
+    if lanes is not None:
+        lanes = {fp: [staged[lane_fp] for lane_fp in fps] for fp, fps in lanes.items()}
+    try:
+        return _run_sample(
+            [staged.get(arg, arg) for arg in cmd],
+            list(staged.values()),
+            *args,
+            lanes=lanes,
+            shards=shards,
+        )
+    finally:
+        stager.discard_inputs(sample_id)
+
+
+def _release_staged_outputs(stager: ScratchStager, sample_id: str, job: Callable):
+    """Run the job finishing a staged sample, then release its output space.
+
+    The outputs are only moved (releasing their space) once the sample
+    was finished - whatever fails before that (fastp, counting the reads or
+    recording the sample in the journal), the space is released here.
+
+    Parameters:
+    stager (ScratchStager): The stager of the inputs.
+    sample_id (str): The sample finished by the job.
+    job (Callable): The job finishing the sample (see _finalize_sample).
+
+    Returns:
+    dict: The record of the job.
+    """
+    try:
+        return job()
+    finally:
+        stager.discard_outputs(sample_id)
+
+
+def _reuse_sample(
+    previous_outputs: Dict[str, str],
+    outputs: Dict[str, str],
+    source: str = "previous",
+) -> dict:
+    """Reuse the results of a sample from a previous run.
+
+    Parameters:
+    previous_outputs (Dict[str, str]): The output files of the sample from
+        the previous run, by fastp role.
+    outputs (Dict[str, str]): The output files of the sample, by fastp role.
+    source (str): Where the results come from - "previous" for the outputs
+        of a previous run, "checkpoint" for those kept in the work directory.
+
+    Returns:
+    dict: The record of the job, with the source of the results.
+    """
+    for role, fp in previous_outputs.items():
+        link_or_copy(fp, outputs[role])
+    return {"source": source}
+
+
+def _checkpoint_sample(
+    job: Callable,
+    journal: CheckpointJournal,
+    sample_id: str,
+    outputs: Dict[str, str],
+    *checkpoint,
+) -> dict:
+    """Run the job processing a sample and record it in the journal.
+
+    Parameters:
+    job (Callable): The job producing the outputs of the sample.
+    journal (CheckpointJournal): The journal of the work directory.
+    sample_id (str): The sample processed by the job.
+    outputs (Dict[str, str]): The output files of the sample, by fastp role.
+    *checkpoint: The input fingerprint, parameter hash and fastp version
+        of the sample, as recorded in the journal.
+
+    Returns:
+    dict: The record of the job.
+    """
+    record = job()
+    produced = {role: fp for role, fp in outputs.items() if os.path.exists(fp)}
+    journal.record(sample_id, produced, *checkpoint)
+    return record
+
+
+def _tolerate_failure(job: Callable) -> dict:
+    """Run the job, returning its failure as its record instead of raising it."""
+    try:
+        return job()
+    except Exception as e:
+        return {"source": "failed", "error": str(e)}
+
+
+def _report_failures(records: pd.DataFrame):
+    """Report the samples fastp failed on, unless it failed on all of them.
+
+    Parameters:
+    records (pd.DataFrame): The records of all the sample jobs, indexed
+        by sample ID.
+    """
+    failed = records.loc[records["source"] == "failed", "error"]
+    if failed.empty:
+        return
+    if len(failed) == len(records):
+        raise RuntimeError(
+            f"Processing failed for all samples. The first error was:\n\n"
+            f"{failed.iloc[0]}"
+        )
+    for sample_id, error in failed.items():
+        print(f"Processing of sample {sample_id} failed:\n\n{error}\n")
+    warn(
+        "Processing failed for the following samples, which were left out of "
+        "the output (see the errors above): %s" % ", ".join(failed.index)
+    )
+
+
+def _read_fastp_version(json_fp: str) -> str:
+    """Read the fastp version from the beginning of a fastp JSON report."""
+    with open(json_fp) as f:
+        match = re.search(r'"fastp_version":\s*"([^"]+)"', f.read(4096))
+    return match.group(1) if match else None
+
+
+def _tabulate_timings(records: pd.DataFrame) -> pd.DataFrame:
+    """Tabulate the resources used by fastp for every processed sample.
+
+    Parameters:
+    records (pd.DataFrame): The records of all the sample jobs, indexed
+        by sample ID.
+
+    Returns:
+    pd.DataFrame: The timing table of samples processed by fastp, with
+        the throughput in reads and megabytes (of input) per second.
+    """
+    timings = records.loc[records["source"] == "fastp", TIMING_COLUMNS].copy()
+    timings["reads_per_second"] = (
+        timings["reads_before_filtering"] / timings["wall_time"]
+    )
+    timings["mb_per_second"] = timings["bytes_read"] / 1e6 / timings["wall_time"]
+    timings.index.name = "sample-id"
+    return timings
+
+
+def _summarize_timings(timings: pd.DataFrame, elapsed: float) -> str:
+    """Summarize the resources used by fastp across all samples.
+
+    Parameters:
+    timings (pd.DataFrame): The timing table (see _tabulate_timings).
+    elapsed (float): The wall time of the whole run, in seconds.
+
+    Returns:
+    str: The human-readable summary.
+    """
+    if timings.empty:
+        return f"No samples were processed by fastp (total time: {elapsed:.1f} s)."
+
+    cpu_time = (timings["user_time"] + timings["system_time"]).sum()
+    slowest = timings["wall_time"].idxmax()
+    return (
+        f"Processed {len(timings)} sample(s) with fastp in {elapsed:.1f} s: "
+        f"{cpu_time:.1f} s of CPU time, peak memory "
+        f"{timings['max_rss'].max() / 1024**2:.1f} MB, median throughput "
+        f"{timings['reads_per_second'].median():.0f} reads/s "
+        f"({timings['mb_per_second'].median():.1f} MB/s). "
+        f"Slowest sample: {slowest} ({timings.loc[slowest, 'wall_time']:.1f} s)."
+    )
+
+
+def _manifest_from_plan(plan: pd.DataFrame, path: str) -> pd.DataFrame:
+    """Build the manifest of processed sequences from an executed run plan.
+
+    Parameters:
+    plan (pd.DataFrame): The executed run plan, with the output file
+        names and the number of reads left in every sample.
+    path (str): The directory containing the processed sequences.
+
+    Returns:
+    pd.DataFrame: The manifest of the non-empty samples, indexed by sample
+        ID, with the paths to the forward and reverse reads.
+    """
+    manifest = plan.loc[plan["reads_after_filtering"] > 0, ["forward", "reverse"]]
+    return manifest.apply(
+        lambda col: col.map(
+            lambda fn: os.path.join(str(path), fn) if isinstance(fn, str) else None
+        )
+    ).astype(object)
+
+
+def _find_reusable_samples(
+    plan: pd.DataFrame,
+    previous_sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    previous_reports: FastpJsonDirectoryFormat,
+    fastp_version: str,
+) -> Dict[str, Dict[str, str]]:
+    """Find samples whose results can be reused from a previous run.
+
+    A sample can be reused if its input fingerprint and processing
+    parameters match those recorded in the previous run plan and it was
+    processed with the same version of fastp. Samples missing from the
+    previous sequences were empty after processing - only their report
+    is reused.
+
+    Parameters:
+    plan (pd.DataFrame): The current run plan, with the input fingerprint
+        and parameter hash of every sample.
+    previous_sequences (CasavaOneEightSingleLanePerSampleDirFmt):
+        The sequences processed in the previous run.
+    previous_reports (FastpJsonDirectoryFormat): The reports of the previous run.
+    fastp_version (str): The version of the current fastp executable.
+
+    Returns:
+    Dict[str, Dict[str, str]]: The previous output files of every reusable
+        sample, by fastp role.
+    """
+    previous_plan_fp = os.path.join(str(previous_reports), "run_plan.tsv")
+    if not os.path.isfile(previous_plan_fp):
+        warn(
+            "The previous reports do not contain a run plan - all samples "
+            "will be processed again."
+        )
+        return {}
+
+    previous_plan = _read_sample_table(previous_plan_fp)
+    if not {"input_fingerprint", "params_hash"}.issubset(previous_plan.columns):
+        warn(
+            "The previous run plan does not contain input fingerprints - all "
+            "samples will be processed again."
+        )
+        return {}
+
+    if {"forward", "reverse"}.issubset(previous_plan.columns):
+        previous_manifest = _manifest_from_plan(previous_plan, previous_sequences.path)
+    else:
+        previous_manifest = previous_sequences.manifest
+    reusable = {}
+    for sample_id in plan.index.intersection(previous_plan.index):
+        current, previous = plan.loc[sample_id], previous_plan.loc[sample_id]
+        if (
+            current["input_fingerprint"] != previous["input_fingerprint"]
+            or current["params_hash"] != previous["params_hash"]
+        ):
+            continue
+
+        json_fp = os.path.join(str(previous_reports), f"{sample_id}.json")
+        if not os.path.isfile(json_fp) or _read_fastp_version(json_fp) != fastp_version:
+            continue
+
+        reusable[sample_id] = {"json": json_fp}
+        if sample_id in previous_manifest.index:
+            row = previous_manifest.loc[sample_id]
+            reusable[sample_id]["out1"] = row["forward"]
+            if "reverse" in row and row["reverse"] is not None:
+                reusable[sample_id]["out2"] = row["reverse"]
+    return reusable
+
+
+def _fastp_cmd(
+    inputs: List[str],
+    outputs: Dict[str, str],
+    params: dict,
+    threads: int,
+    html_fp: str = os.devnull,
+) -> List[str]:
+    """Build the fastp command processing a single sample.
+
+    Parameters:
+    inputs (List[str]): The forward and (for paired-end reads) reverse reads.
+    outputs (Dict[str, str]): The output files, by fastp role. Processed
+        reads are not written if the "out1" role is missing, only the
+        JSON report is.
+    params (dict): The parameters of process_seqs.
+    threads (int): The number of threads used by fastp.
+    html_fp (str): The HTML report, discarded by default.
+
+    Returns:
+    List[str]: The fastp command.
+    """
+    cmd = ["fastp", "--in1", inputs[0]]
+    if "out1" in outputs:
+        cmd.extend(["--out1", outputs["out1"]])
+    cmd.extend(["--json", outputs["json"], "--html", html_fp])
+
+    kwargs = {k: v for k, v in params.items() if k not in RUN_PARAMS}
+    for param, value in {**kwargs, "thread": threads}.items():
+        add_param(cmd, param, value)
+
+    if len(inputs) > 1:
+        add_param(cmd, "in2", inputs[1], "--in2")
+        add_param(cmd, "out2", outputs.get("out2"), "--out2")
+        add_param(cmd, "trim_front2", params["trim_front2"])
+        add_param(cmd, "trim_tail2", params["trim_tail2"])
+        add_param(cmd, "max_len2", params["max_len2"])
+        add_param(cmd, "adapter_sequence_r2", params["adapter_sequence_r2"])
+    return cmd
+
+
+def _run_fastp(
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    params: dict,
+    previous_sequences: CasavaOneEightSingleLanePerSampleDirFmt = None,
+    previous_reports: FastpJsonDirectoryFormat = None,
+):
     """Run fastp on the sequences.
 
+    Samples are processed according to the plan created by _plan_fastp_runs.
+    Once all of them are finished, the output file names of every sample are
+    added to the plan, which is then saved next to the JSON reports - the
+    manifest of the processed sequences can be built from it directly (see
+    _manifest_from_plan), without listing the output directory. If the
+    results of a previous run are provided, only new or changed samples are
+    processed. Samples sequenced on several lanes are processed by a single
+    fastp run, reading all of their lanes (concatenated into a temporary
+    file) and writing a single output.
+
     Parameters:
     sequences (CasavaOneEightSingleLanePerSampleDirFmt):
         The sequences to process.
     params (dict): The parameters to pass to fastp.
+    previous_sequences (CasavaOneEightSingleLanePerSampleDirFmt):
+        The sequences processed in a previous run.
+    previous_reports (FastpJsonDirectoryFormat): The reports of a previous run.
+
+    Returns:
+    Tuple[CasavaOneEightSingleLanePerSampleDirFmt, FastpJsonDirectoryFormat,
+        pd.DataFrame]: The processed sequences (without the empty samples,
+        unless they should be kept),
+        the JSON reports and the executed run plan.
     """
-    kwargs = {
-        k: v
-        for k, v in params.items()
-        if k
-        not in [
-            "trim_front2",
-            "trim_tail2",
-            "max_len2",
-            "adapter_sequence_r2",
-        ]
-    }
+    manifest = _lane_manifest(sequences)
+    threads = params.get("thread", 1)
+    n_jobs, _ = _split_core_budget(threads, params.get("n_jobs", 1), len(manifest))
+    plan = _plan_fastp_runs(
+        manifest, threads, n_jobs, params.get("shard_size", 0) * 1024**3
+    )
+    if params.get("dedup") and (plan["shards"] > 1).any():
+        raise ValueError(
+            "Samples split into shards cannot be deduplicated, as duplicates in "
+            "different shards would not be found - please either disable dedup "
+            "or increase the shard size above the size of the largest sample."
+        )
+
+    cache, fastp_version = None, None
+    if (
+        params.get("cache_dir")
+        or params.get("work_dir")
+        or previous_reports is not None
+    ):
+        fastp_version = get_fastp_version()
+    if params.get("cache_dir"):
+        cache = FastpResultCache(
+            params["cache_dir"], params.get("cache_max_size", 100) * 1024**3
+        )
 
     output_sequences = CasavaOneEightSingleLanePerSampleDirFmt()
     json_reports = FastpJsonDirectoryFormat()
-    for sample_id, row in sequences.manifest.iterrows():
-        input_fp = row["forward"]
-        output_fp = os.path.join(
-            output_sequences.path, os.path.basename(row["forward"])
-        )
-        report_fp = os.path.join(str(json_reports), f"{sample_id}.html")
-        json_fp = os.path.join(str(json_reports), f"{sample_id}.json")
-        cmd = [
-            "fastp",
-            "--in1",
-            input_fp,
-            "--out1",
-            output_fp,
-            "--json",
-            json_fp,
-            "--html",
-            report_fp,
-        ]
+    # reads are staged next to the output directory (on the same filesystem),
+    # or on the scratch storage, and only moved there once we know the sample
+    # is not empty
+    if params.get("stage_to_scratch"):
+        staging_dir = tempfile.mkdtemp(
+            prefix="q2-fastp-", dir=params.get("scratch_dir") or None
+        )
+    else:
+        staging_dir = tempfile.mkdtemp(dir=os.path.dirname(str(output_sequences)))
+    output_compressor = params.get("output_compressor", "fastp")
+    if output_compressor in OUTPUT_COMPRESSORS and not shutil.which(output_compressor):
+        raise ValueError(
+            f"The output compressor {output_compressor} was not found - please "
+            "install it or use a different output compressor."
+        )
+    cmds, inputs, outputs, destinations, compressors = {}, {}, {}, {}, {}
+    lanes = {}
+    for sample_id, row in manifest.iterrows():
+        if params.get("keep_html_reports"):
+            report_fp = os.path.join(str(json_reports), f"{sample_id}.html")
+        else:
+            report_fp = os.devnull
+        reads = {"out1": row["forward"]}
+        if row["reverse"] is not None:
+            reads["out2"] = row["reverse"]
+
+        # the lanes of samples sequenced on several lanes are concatenated
+        # and written to a single output file, named after the first lane
+        inputs[sample_id] = [fp for lane_fps in reads.values() for fp in lane_fps]
+        fastp_inputs = []
+        for role, lane_fps in reads.items():
+            if len(lane_fps) == 1:
+                fastp_inputs.append(lane_fps[0])
+            else:
+                fp = os.path.join(staging_dir, f"{sample_id}.{role}.lanes.fastq.gz")
+                lanes.setdefault(sample_id, {})[fp] = lane_fps
+                fastp_inputs.append(fp)
+        outputs[sample_id] = {
+            role: os.path.join(staging_dir, os.path.basename(lane_fps[0]))
+            for role, lane_fps in reads.items()
+        }
+        outputs[sample_id]["json"] = os.path.join(
+            str(json_reports), f"{sample_id}.json"
+        )
+        fastp_outputs = outputs[sample_id]
+        fastp_threads = plan.loc[sample_id, "threads"]
+        if output_compressor != "fastp":
+            # fastp writes uncompressed reads if the file names do not end
+            # with .gz - here, into the pipes read by the compressors
+            fastp_outputs = {
+                role: fp if role == "json" else fp[: -len(".gz")]
+                for role, fp in outputs[sample_id].items()
+            }
+            pipes = {
+                fastp_outputs[role]: fp
+                for role, fp in outputs[sample_id].items()
+                if role != "json"
+            }
+            fastp_threads, compressor_threads = _split_compression_threads(
+                fastp_threads, len(pipes), output_compressor
+            )
+            compressors[sample_id] = _OutputCompressor(
+                output_compressor,
+                pipes,
+                params.get("compression", 2),
+                compressor_threads,
+            )
+        cmds[sample_id] = _fastp_cmd(
+            fastp_inputs,
+            fastp_outputs,
+            params,
+            fastp_threads,
+            html_fp=report_fp,
+        )
+        destinations[sample_id] = {
+            role: os.path.join(output_sequences.path, os.path.basename(fp))
+            for role, fp in outputs[sample_id].items()
+            if role != "json"
+        }
 
-        # add common params
-        for param, value in kwargs.items():
-            add_param(cmd, param, value)
+    plan["input_fingerprint"] = [fingerprint_files(inputs[s]) for s in plan.index]
+    plan["params_hash"] = [
+        hash_cmd(cmds[s] + _key_args(compressors.get(s), plan.loc[s, "shards"]))
+        for s in plan.index
+    ]
 
-        if "reverse" in row and row["reverse"] is not None:
-            input_fp2 = row["reverse"]
-            output_fp2 = os.path.join(
-                output_sequences.path, os.path.basename(row["reverse"])
+    reusable = {}
+    if previous_reports is not None:
+        reusable = _find_reusable_samples(
+            plan, previous_sequences, previous_reports, fastp_version
+        )
+        plan.loc[list(reusable), "threads"] = 1
+        print(
+            f"Reusing the results of {len(reusable)} out of {len(plan)} samples "
+            "from the previous run."
+        )
+
+    journal, resumed = None, {}
+    if params.get("work_dir"):
+        journal = CheckpointJournal(params["work_dir"])
+        resumed = {
+            sample_id: kept
+            for sample_id, kept in journal.find_completed(plan, fastp_version).items()
+            if sample_id not in reusable
+        }
+        plan.loc[list(resumed), "threads"] = 1
+        if resumed:
+            print(
+                f"Resuming the run: {len(resumed)} out of {len(plan)} samples "
+                "were already processed in the work directory."
             )
-            add_param(cmd, "in2", input_fp2, "--in2")
-            add_param(cmd, "out2", output_fp2, "--out2")
-            add_param(cmd, "trim_front2", params["trim_front2"])
-            add_param(cmd, "trim_tail2", params["trim_tail2"])
-            add_param(cmd, "max_len2", params["max_len2"])
-            add_param(cmd, "adapter_sequence_r2", params["adapter_sequence_r2"])
-
-        run_command(cmd)
-    return output_sequences, json_reports
+
+    to_run = [
+        sample_id
+        for sample_id in plan.index
+        if sample_id not in reusable and sample_id not in resumed
+    ]
+    if to_run:
+        # the commands of all samples only differ in their files and threads,
+        # so the warning and a single command are only shown once per run
+        print(EXTERNAL_CMD_WARNING)
+        print(f"\nCommand (first of {len(to_run)}):", end=" ")
+        print(" ".join(cmds[to_run[0]]), end="\n\n")
+        print("The output of fastp is only shown for the samples it fails on.\n")
+
+    stager = None
+    if params.get("stage_to_scratch"):
+        stager = ScratchStager(
+            staging_dir,
+            {sample_id: inputs[sample_id] for sample_id in to_run},
+            params.get("scratch_max_size", 50) * 1024**3,
+            params.get("prefetch_samples", 2),
+        )
+
+    progress = _Progress(len(plan))
+    jobs = []
+    for sample_id in plan.index:
+        if sample_id in resumed:
+            job = partial(
+                _reuse_sample, resumed[sample_id], outputs[sample_id], "checkpoint"
+            )
+        elif sample_id in reusable:
+            job = partial(_reuse_sample, reusable[sample_id], outputs[sample_id])
+        else:
+            run = _run_sample
+            if stager is not None:
+                run = partial(_run_staged_sample, stager, sample_id)
+            job = partial(
+                run,
+                cmds[sample_id],
+                inputs[sample_id],
+                outputs[sample_id],
+                os.path.join(staging_dir, f"{sample_id}.fastp.log"),
+                cache,
+                fastp_version,
+                compressors.get(sample_id),
+                lanes=lanes.get(sample_id),
+                shards=plan.loc[sample_id, "shards"],
+            )
+        if journal is not None and sample_id not in resumed:
+            job = partial(
+                _checkpoint_sample,
+                job,
+                journal,
+                sample_id,
+                outputs[sample_id],
+                plan.loc[sample_id, "input_fingerprint"],
+                plan.loc[sample_id, "params_hash"],
+                fastp_version,
+            )
+        job = partial(
+            _finalize_sample,
+            job,
+            outputs[sample_id],
+            destinations[sample_id],
+            params.get("keep_empty_samples", False),
+            partial(stager.move_outputs, sample_id) if stager else None,
+        )
+        if stager is not None:
+            job = partial(_release_staged_outputs, stager, sample_id, job)
+        if params.get("on_sample_failure", "abort") == "skip":
+            job = partial(_tolerate_failure, job)
+        jobs.append(partial(progress.run, job))
+
+    start = time.perf_counter()
+    try:
+        records = _run_jobs(
+            jobs,
+            plan["threads"].tolist(),
+            n_jobs,
+            threads,
+            timeout=params.get("sample_timeout", 0) * 60 or None,
+        )
+    finally:
+        # waits until all the outputs are moved off the scratch storage
+        if stager is not None:
+            stager.close()
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    records = pd.DataFrame(records, index=plan.index).reindex(
+        columns=["source", "error", "reads_after_filtering", *TIMING_COLUMNS]
+    )
+    _report_failures(records)
+    plan["source"] = records["source"]
+    plan["reads_after_filtering"] = records["reads_after_filtering"]
+    # only the outputs which were written (e.g. not those of failed or
+    # skipped empty samples) are listed
+    for col, role in (("forward", "out1"), ("reverse", "out2")):
+        plan[col] = [
+            (
+                os.path.basename(destinations[sample_id][role])
+                if role in destinations[sample_id]
+                and os.path.exists(destinations[sample_id][role])
+                else None
+            )
+            for sample_id in plan.index
+        ]
+
+    if cache is not None:
+        cache.evict()
+        print(cache.summary())
+
+    timings = _tabulate_timings(records)
+    timings.to_csv(os.path.join(str(json_reports), "timings.tsv"), sep="\t")
+    print(_summarize_timings(timings, time.perf_counter() - start))
+
+    plan.to_csv(os.path.join(str(json_reports), "run_plan.tsv"), sep="\t")
+    return output_sequences, json_reports, plan
 
 
 def process_seqs(
     sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    previous_sequences: CasavaOneEightSingleLanePerSampleDirFmt = None,
+    previous_reports: FastpJsonDirectoryFormat = None,
     trim_front1: int = 0,
     trim_tail1: int = 0,
     max_len1: int = 0,
@@ -145,6 +1490,7 @@ def process_seqs(
     length_required: int = 15,
     compression: int = 2,
     thread: int = 1,
+    n_jobs: int = 1,
     dedup: bool = False,
     dup_calc_accuracy: int = 3,
     dont_eval_duplication: bool = False,
@@ -164,6 +1510,19 @@ def process_seqs(
     cut_right: bool = False,
     overrepresentation_analysis: bool = False,
     overrepresentation_sampling: int = 20,
+    cache_dir: str = None,
+    cache_max_size: int = 100,
+    keep_html_reports: bool = False,
+    keep_empty_samples: bool = False,
+    output_compressor: str = "fastp",
+    stage_to_scratch: bool = False,
+    scratch_dir: str = None,
+    scratch_max_size: int = 50,
+    prefetch_samples: int = 2,
+    work_dir: str = None,
+    on_sample_failure: str = "abort",
+    shard_size: int = 0,
+    sample_timeout: int = 0,
 ) -> (CasavaOneEightSingleLanePerSampleDirFmt, FastpJsonDirectoryFormat):
     kwargs = {
         k: v
@@ -171,19 +1530,165 @@ def process_seqs(
         if k
         not in [
             "sequences",
+            "previous_sequences",
+            "previous_reports",
         ]
     }
 
-    output_sequences, json_reports = _run_fastp(sequences, kwargs)
+    if (previous_sequences is None) != (previous_reports is None):
+        raise ValueError(
+            "Both the previously processed sequences and their reports need to "
+            "be provided to only process new or changed samples."
+        )
+
+    output_sequences, json_reports, plan = _run_fastp(
+        sequences,
+        kwargs,
+        previous_sequences=previous_sequences,
+        previous_reports=previous_reports,
+    )
+
+    # reads of the empty samples were already dropped during processing
+    if not keep_empty_samples:
+        processed = plan["source"] != "failed"
+        _find_empty_samples(plan.loc[processed, "reads_after_filtering"].to_dict())
+
+    return output_sequences, json_reports
+
+
+def _is_empty_fastq(fp: str) -> bool:
+    with gzip.open(fp, "rb") as f:
+        return f.read(1) == b""
+
 
-    # remove the HTML reports
-    for f in glob.glob(os.path.join(str(json_reports), "*.html")):
-        os.remove(f)
+def collate_processed_sequences(
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    on_duplicate_ids: str = "error",
+) -> CasavaOneEightSingleLanePerSampleDirFmt:
+    collated_sequences = CasavaOneEightSingleLanePerSampleDirFmt()
+
+    # list all inputs before transferring anything, so that duplicated
+    # samples are found up front
+    samples, ids = {}, []
+    for seqs in sequences:
+        manifest = seqs.manifest
+        ids.extend(manifest.index)
+        for sample_id, row in manifest.iterrows():
+            # samples are deduplicated by ID, as their file names may differ
+            if sample_id not in samples or on_duplicate_ids != "keep_first":
+                samples[sample_id] = [
+                    fp for fp in (row["forward"], row["reverse"]) if pd.notna(fp)
+                ]
+    _find_duplicates(ids, on_duplicate_ids, "set of sequences")
 
-    # remove the empty samples
+    # samples processed with keep_empty_samples are dropped only now
     empty_samples = _find_empty_samples(
-        output_sequences, sequences.manifest.index.tolist()
+        {
+            sample_id: 0 if _is_empty_fastq(fps[0]) else 1
+            for sample_id, fps in samples.items()
+        }
     )
-    output_sequences = _remove_samples(output_sequences, empty_samples)
+    empty_samples = set(empty_samples)
+    files = {
+        os.path.basename(fp): fp
+        for sample_id, fps in samples.items()
+        if sample_id not in empty_samples
+        for fp in fps
+    }
 
-    return output_sequences, json_reports
+    _transfer_files(files, str(collated_sequences.path))
+    return collated_sequences
+
+
+def process_seqs_partitioned(
+    ctx,
+    sequences,
+    previous_sequences=None,
+    previous_reports=None,
+    num_partitions=None,
+    trim_front1=0,
+    trim_tail1=0,
+    max_len1=0,
+    trim_front2=0,
+    trim_tail2=0,
+    max_len2=0,
+    disable_quality_filtering=False,
+    n_base_limit=5,
+    qualified_quality_phred=15,
+    unqualified_percent_limit=40,
+    length_required=15,
+    compression=2,
+    thread=1,
+    n_jobs=1,
+    dedup=False,
+    dup_calc_accuracy=3,
+    dont_eval_duplication=False,
+    disable_adapter_trimming=False,
+    adapter_sequence="",
+    adapter_sequence_r2="",
+    poly_g_min_len=10,
+    poly_x_min_len=10,
+    overlap_len_require=30,
+    overlap_diff_limit=5,
+    overlap_diff_percent_limit=20,
+    correction=False,
+    cut_window_size=4,
+    cut_mean_quality=20,
+    cut_front=False,
+    cut_tail=False,
+    cut_right=False,
+    overrepresentation_analysis=False,
+    overrepresentation_sampling=20,
+    cache_dir=None,
+    cache_max_size=100,
+    keep_html_reports=False,
+    output_compressor="fastp",
+    stage_to_scratch=False,
+    scratch_dir=None,
+    scratch_max_size=50,
+    prefetch_samples=2,
+    work_dir=None,
+    on_sample_failure="abort",
+    shard_size=0,
+    sample_timeout=0,
+):
+    kwargs = {
+        k: v
+        for k, v in locals().items()
+        if k
+        not in [
+            "ctx",
+            "sequences",
+            "previous_sequences",
+            "previous_reports",
+            "num_partitions",
+        ]
+    }
+
+    if sequences.type <= SampleData[PairedEndSequencesWithQuality]:
+        partition_method = ctx.get_action("demux", "partition_samples_paired")
+    else:
+        partition_method = ctx.get_action("demux", "partition_samples_single")
+    process = ctx.get_action("fastp", "process_seqs")
+    collate_sequences = ctx.get_action("fastp", "collate_processed_sequences")
+    collate_reports = ctx.get_action("fastp", "collate_fastp_reports")
+
+    (partitioned_seqs,) = partition_method(sequences, num_partitions)
+
+    processed_seqs, reports = [], []
+    for seqs in partitioned_seqs.values():
+        # a partition may consist of empty samples only, so these are
+        # kept until all partitions are collated
+        _processed_seqs, _reports = process(
+            seqs,
+            previous_sequences=previous_sequences,
+            previous_reports=previous_reports,
+            keep_empty_samples=True,
+            **kwargs,
+        )
+        processed_seqs.append(_processed_seqs)
+        reports.append(_reports)
+
+    (collated_seqs,) = collate_sequences(processed_seqs)
+    (collated_reports,) = collate_reports(reports)
+    return collated_seqs, collated_reports
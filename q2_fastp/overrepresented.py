@@ -0,0 +1,240 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .types import FastpJsonDirectoryFormat
+
+# the number of hash functions (rows) of the count-min sketches
+SKETCH_DEPTH = 4
+
+# the columns of the table of the most widespread sequences
+INDEX_COLUMNS = ["samples", "sample_percent", "reads"]
+
+
+class OverrepresentedIndex:
+    """Count the samples in which sequences are overrepresented, project-wide.
+
+    Every sequence found in the overrepresented sequences of a sample is
+    counted in two count-min sketches - once per sample in the first, and
+    by its number of reads in the second. The sketches never grow, so
+    their counts are estimates: they can be overestimated when sequences
+    share buckets, but never underestimated. Next to the sketches, the
+    top_k sequences found in the most samples are tracked by name.
+
+    Samples are only ever counted once: adding a sample which is already
+    indexed is a no-op, so an index can be updated with overlapping sets
+    of reports.
+
+    Parameters:
+    stage (str): The stage of the reports whose overrepresented sequences
+        are indexed - "before_filtering" or "after_filtering".
+    top_k (int): The number of the most widespread sequences tracked.
+    width (int): The number of buckets in every row of the sketches.
+    """
+
+    def __init__(
+        self, stage: str = "before_filtering", top_k: int = 1000, width: int = 65536
+    ):
+        self.stage = stage
+        self.top_k = top_k
+        self.sample_sketch = np.zeros((SKETCH_DEPTH, width), dtype=np.uint32)
+        self.read_sketch = np.zeros((SKETCH_DEPTH, width), dtype=np.uint64)
+        self.sample_ids = []
+        self.top = {}
+        self._indexed = set()
+        self._weakest = None
+
+    @property
+    def width(self) -> int:
+        return self.sample_sketch.shape[1]
+
+    def _buckets(self, sequence: str) -> Tuple[np.ndarray, np.ndarray]:
+        # a stable hash, unlike hash(), split into the two halves combined
+        # into the bucket of every row (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(sequence.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        buckets = [(h1 + row * h2) % self.width for row in range(SKETCH_DEPTH)]
+        return np.arange(SKETCH_DEPTH), np.array(buckets)
+
+    def estimate(self, sequence: str) -> Tuple[int, int]:
+        """Estimate the number of samples and reads of a sequence."""
+        buckets = self._buckets(sequence)
+        return (
+            int(self.sample_sketch[buckets].min()),
+            int(self.read_sketch[buckets].min()),
+        )
+
+    def _track(self, sequence: str):
+        """Track the sequence by name if it is among the most widespread.
+
+        The least widespread tracked sequence is looked up only when it
+        may have changed, not for every sequence which is counted.
+        """
+        counts = self.estimate(sequence)
+        if sequence not in self.top and len(self.top) >= self.top_k:
+            if self._weakest is None:
+                self._weakest = min(self.top, key=lambda seq: self.top[seq][0])
+            if counts[0] <= self.top[self._weakest][0]:
+                return
+            del self.top[self._weakest]
+            self._weakest = None
+        elif sequence == self._weakest:
+            self._weakest = None
+        self.top[sequence] = counts
+
+    def add_sample(self, sample_id: str, sequences: Dict[str, int]) -> bool:
+        """Count the overrepresented sequences of a sample.
+
+        Parameters:
+        sample_id (str): The sample.
+        sequences (Dict[str, int]): The number of reads of every
+            overrepresented sequence of the sample.
+
+        Returns:
+        bool: Whether the sample was added - False if it was indexed before.
+        """
+        if sample_id in self._indexed:
+            return False
+        self._indexed.add(sample_id)
+        self.sample_ids.append(sample_id)
+        for sequence, reads in sequences.items():
+            buckets = self._buckets(sequence)
+            self.sample_sketch[buckets] += 1
+            self.read_sketch[buckets] += reads
+            self._track(sequence)
+        return True
+
+    def merge(self, other: "OverrepresentedIndex"):
+        """Add the samples of another index, built with the same settings.
+
+        Sequences tracked by neither of the indexes are not tracked after
+        merging, even if they are among the most widespread ones overall.
+        """
+        if (self.stage, self.width) != (other.stage, other.width):
+            raise ValueError(
+                "Only indexes of the same stage and sketch width can be merged, "
+                f"not {self.stage} ({self.width}) and {other.stage} ({other.width})."
+            )
+        shared = self._indexed.intersection(other.sample_ids)
+        if shared:
+            raise ValueError(
+                "The following samples are present in more than one index: "
+                f"{', '.join(sorted(shared))}"
+            )
+        self.sample_sketch += other.sample_sketch
+        self.read_sketch += other.read_sketch
+        self.sample_ids.extend(other.sample_ids)
+        self._indexed.update(other.sample_ids)
+
+        candidates = list(self.top) + [seq for seq in other.top if seq not in self.top]
+        self.top, self._weakest = {}, None
+        for sequence in candidates:
+            self._track(sequence)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Tabulate the tracked sequences, the most widespread first."""
+        # the counts are estimated again, as they may have grown since the
+        # sequences were last seen
+        table = pd.DataFrame.from_dict(
+            {seq: self.estimate(seq) for seq in self.top},
+            orient="index",
+            columns=["samples", "reads"],
+            dtype="int64",
+        )
+        table["sample_percent"] = 100 * table["samples"] / max(len(self.sample_ids), 1)
+        table = table.sort_values(["samples", "reads"], ascending=False)
+        table.index.name = "sequence"
+        return table[INDEX_COLUMNS]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        sequences = list(self.top)
+        return {
+            "stage": np.array(self.stage),
+            "top_k": np.array(self.top_k),
+            "sample_sketch": self.sample_sketch,
+            "read_sketch": self.read_sketch,
+            "sample_ids": np.array(self.sample_ids, dtype=str),
+            "sequences": np.array(sequences, dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "OverrepresentedIndex":
+        index = cls(
+            str(arrays["stage"]),
+            int(arrays["top_k"]),
+            arrays["sample_sketch"].shape[1],
+        )
+        index.sample_sketch = arrays["sample_sketch"].astype(np.uint32)
+        index.read_sketch = arrays["read_sketch"].astype(np.uint64)
+        index.sample_ids = arrays["sample_ids"].astype(object).tolist()
+        index._indexed = set(index.sample_ids)
+        for sequence in arrays["sequences"].astype(object):
+            index._track(sequence)
+        return index
+
+
+def _read_overrepresented(fp: str, stage: str) -> Dict[str, int]:
+    """Read the overrepresented sequences of both reads from a fastp report."""
+    with open(fp) as f:
+        report = json.load(f)
+    sequences = {}
+    for read in ("read1", "read2"):
+        section = report.get(f"{read}_{stage}", {})
+        for sequence, reads in section.get("overrepresented_sequences", {}).items():
+            sequences[sequence] = sequences.get(sequence, 0) + reads
+    return sequences
+
+
+def index_overrepresented_sequences(
+    reports: FastpJsonDirectoryFormat,
+    index: OverrepresentedIndex = None,
+    stage: str = "before_filtering",
+    top_k: int = 1000,
+    sketch_width: int = 65536,
+    n_jobs: int = 1,
+) -> OverrepresentedIndex:
+    if index is None:
+        index = OverrepresentedIndex(stage, top_k, sketch_width)
+
+    fps = {
+        fp.stem: str(fp)
+        for fp in sorted(reports.path.glob("*.json"))
+        if fp.stem not in index._indexed
+    }
+    if n_jobs == 1 or len(fps) < 2:
+        sections = [_read_overrepresented(fp, index.stage) for fp in fps.values()]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chunksize = max(len(fps) // (n_jobs * 4), 1)
+            sections = list(
+                executor.map(
+                    _read_overrepresented,
+                    fps.values(),
+                    [index.stage] * len(fps),
+                    chunksize=chunksize,
+                )
+            )
+    for sample_id, sequences in zip(fps, sections):
+        index.add_sample(sample_id, sequences)
+    return index
+
+
+def collate_overrepresented_indexes(
+    indexes: List[OverrepresentedIndex],
+) -> OverrepresentedIndex:
+    collated = OverrepresentedIndex.from_arrays(indexes[0].to_arrays())
+    for index in indexes[1:]:
+        collated.merge(index)
+    return collated
@@ -5,20 +5,57 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import importlib
+
 from q2_types.per_sample_sequences import (
     PairedEndSequencesWithQuality,
     SequencesWithQuality,
 )
 from q2_types.sample_data import SampleData
-from qiime2.core.type import Bool, Int, Range, Str, TypeMap
-from qiime2.plugin import Citations, Plugin, List
+from qiime2.core.type import Bool, Choices, Int, Range, Str, TypeMap
+from qiime2.plugin import Citations, List, Metadata, Plugin
 
-from q2_fastp import __version__, visualize, collate_fastp_reports
-from q2_fastp.fastp import process_seqs
-from q2_fastp.types import FastpJsonDirectoryFormat, FastpJsonFormat, FastpJSONReports
+from q2_fastp import (
+    __version__,
+    collate_fastp_reports,
+    collate_fastp_summaries,
+    summarize_reports,
+    visualize,
+)
+from q2_fastp.fastp import (
+    collate_processed_sequences,
+    process_seqs,
+    process_seqs_partitioned,
+)
+from q2_fastp.overrepresented import (
+    collate_overrepresented_indexes,
+    index_overrepresented_sequences,
+)
+from q2_fastp.preview import preview_processing
+from q2_fastp.stats import summarize_sequences
+from q2_fastp.sweep import sweep_processing
+from q2_fastp.types import (
+    FastpHtmlFormat,
+    FastpJsonDirectoryFormat,
+    FastpJsonFormat,
+    FastpJSONReports,
+    FastpOverrepresentedIndex,
+    FastpOverrepresentedIndexDirectoryFormat,
+    FastpOverrepresentedIndexFormat,
+    FastpRunPlanFormat,
+    FastpSummary,
+    FastpSummaryDirectoryFormat,
+    FastpSummaryFormat,
+    FastpTimingsFormat,
+)
 
 citations = Citations.load("citations.bib", package="q2_fastp")
 
+DUPLICATE_IDS_DESCRIPTION = (
+    "What to do with samples present in more than one of the inputs: raise "
+    "an error, or keep the sample from the first or the last input containing it."
+)
+
 plugin = Plugin(
     name="fastp",
     version=__version__,
@@ -40,144 +77,604 @@ plugin = Plugin(
     }
 )
 
+process_seqs_params = {
+    "trim_front1": Int % Range(0, None),
+    "trim_tail1": Int % Range(0, None),
+    "trim_front2": Int % Range(0, None),
+    "trim_tail2": Int % Range(0, None),
+    "max_len1": Int % Range(0, None),
+    "max_len2": Int % Range(0, None),
+    "disable_quality_filtering": Bool,
+    "n_base_limit": Int % Range(0, None),
+    "qualified_quality_phred": Int % Range(0, None),
+    "unqualified_percent_limit": Int % Range(0, 100),
+    "length_required": Int % Range(0, None),
+    "compression": Int % Range(1, 12),
+    "thread": Int % Range(1, None),
+    "n_jobs": Int % Range(1, None),
+    "dedup": Bool,
+    "dup_calc_accuracy": Int % Range(0, 6, inclusive_end=True),
+    "dont_eval_duplication": Bool,
+    "disable_adapter_trimming": Bool,
+    "adapter_sequence": Str,
+    "adapter_sequence_r2": Str,
+    "poly_g_min_len": Int % Range(0, None),
+    "poly_x_min_len": Int % Range(0, None),
+    "correction": Bool,
+    "overlap_len_require": Int % Range(0, None),
+    "overlap_diff_limit": Int % Range(0, None),
+    "overlap_diff_percent_limit": Int % Range(0, 100),
+    "cut_front": Bool,
+    "cut_tail": Bool,
+    "cut_right": Bool,
+    "cut_window_size": Int % Range(1, None),
+    "cut_mean_quality": Int % Range(1, 36),
+    "overrepresentation_analysis": Bool,
+    "overrepresentation_sampling": Int % Range(0, 10000),
+    "cache_dir": Str,
+    "cache_max_size": Int % Range(1, None),
+    "keep_html_reports": Bool,
+    "output_compressor": Str % Choices(["fastp", "pigz", "bgzip", "none"]),
+    "stage_to_scratch": Bool,
+    "scratch_dir": Str,
+    "scratch_max_size": Int % Range(1, None),
+    "prefetch_samples": Int % Range(0, None),
+    "work_dir": Str,
+    "on_sample_failure": Str % Choices(["abort", "skip"]),
+    "shard_size": Int % Range(0, None),
+    "sample_timeout": Int % Range(0, None),
+}
+
+process_seqs_input_descriptions = {
+    "sequences": "Input sequences.",
+    "previous_sequences": (
+        "Sequences processed by a previous run of this action. If provided "
+        "together with the previous reports, only samples which are new or "
+        "whose input or parameters changed are processed again - results "
+        "of all the other samples are reused."
+    ),
+    "previous_reports": "Fastp JSON reports of a previous run of this action.",
+}
+
+process_seqs_output_descriptions = {
+    "processed_sequences": "Sequences processed by fastp.",
+    "reports": (
+        "Fastp JSON reports, together with the plan according to which "
+        "the samples were processed and the resources used by fastp for "
+        "every sample."
+    ),
+}
+
+process_seqs_param_descriptions = {
+    "trim_front1": "Number of bases to trim from the front of forward read.",
+    "trim_tail1": "Number of bases to trim from the tail of forward read.",
+    "max_len1": (
+        "If forward read is longer than max_len1, then trim it at its "
+        "tail to make it as long as max_len1"
+    ),
+    "trim_front2": "Number of bases to trim from the front of reverse read.",
+    "trim_tail2": "Number of bases to trim from the tail of reverse read.",
+    "max_len2": (
+        "If reverse read is longer than max_len2, then trim it at its "
+        "tail to make it as long as max_len2"
+    ),
+    "disable_quality_filtering": "Disable quality filtering.",
+    "n_base_limit": "The maximum number of N bases allowed in a read.",
+    "qualified_quality_phred": "The quality value that a base is qualified.",
+    "unqualified_percent_limit": (
+        "The maximum percentage of unqualified bases " "allowed in a read."
+    ),
+    "length_required": "The minimum length required for a read to be kept.",
+    "compression": (
+        "The compression level for the output files. Levels above 9 are "
+        "only supported by fastp itself - other output compressors use "
+        "level 9 instead."
+    ),
+    "thread": (
+        "The total number of threads to use. When several samples are "
+        "processed concurrently, the threads are distributed between "
+        "the running fastp processes according to the input size of "
+        "every sample."
+    ),
+    "n_jobs": "The maximum number of samples to process concurrently.",
+    "dedup": "Enable duplication removal.",
+    "dup_calc_accuracy": "The accuracy for duplication calculation.",
+    "dont_eval_duplication": "Disable duplication evaluation.",
+    "disable_adapter_trimming": "Disable adapter trimming.",
+    "adapter_sequence": "The adapter sequence for read 1.",
+    "adapter_sequence_r2": "The adapter sequence for read 2.",
+    "poly_g_min_len": "The minimum length of polyG tail to be detected.",
+    "poly_x_min_len": "The minimum length of polyX tail to be detected.",
+    "correction": "Enable base correction in overlapped regions.",
+    "overlap_len_require": (
+        "The minimum length to detect overlapped region " "of PE reads."
+    ),
+    "overlap_diff_limit": (
+        "The maximum number of mismatched bases to detect "
+        "overlapped region of PE reads."
+    ),
+    "overlap_diff_percent_limit": (
+        "The maximum percentage of mismatched bases "
+        "to detect overlapped region of PE reads."
+    ),
+    "cut_window_size": (
+        "The window size option shared by cut_front, cut_tail " "or cut_sliding."
+    ),
+    "cut_mean_quality": (
+        "The mean quality requirement option shared by cut_front, "
+        "cut_tail or cut_sliding."
+    ),
+    "cut_front": "Move a sliding window from front (5') to tail.",
+    "cut_tail": "Move a sliding window from tail (3') to front.",
+    "cut_right": "Move a sliding window from front to tail.",
+    "overrepresentation_analysis": "Enable overrepresentation analysis.",
+    "overrepresentation_sampling": (
+        "The sampling number for overrepresentation analysis. Smaller is slower."
+    ),
+    "cache_dir": (
+        "Directory in which the results of every fastp run should be "
+        "cached. Samples whose input files, processing parameters and fastp "
+        "version match a cached run are not processed again. The cache is "
+        "disabled if not provided."
+    ),
+    "cache_max_size": (
+        "The maximum size of the cache (in GB). The least recently used "
+        "results are removed once this size is exceeded."
+    ),
+    "keep_html_reports": (
+        "Keep the HTML reports generated by fastp next to the JSON reports. "
+        "Only available for samples which were processed by fastp in this "
+        "run (rather than reused from the cache or a previous run)."
+    ),
+    "output_compressor": (
+        "The compressor of the processed reads. fastp compresses them "
+        "itself, which often makes writing the reads its bottleneck. pigz "
+        "compresses them using the threads of the sample next to fastp, "
+        "bgzip writes blocked gzip (BGZF) files which downstream tools can "
+        "decompress in parallel and none writes gzip files without any "
+        "compression - the fastest option when the reads are processed "
+        "further on the same machine, at the cost of disk space. pigz and "
+        "bgzip need to be installed separately."
+    ),
+    "stage_to_scratch": (
+        "Copy the inputs of every sample to local scratch storage before "
+        "processing it, and write the outputs there before moving them to "
+        "their destination in the background. Useful when the inputs are "
+        "located on a network filesystem."
+    ),
+    "scratch_dir": (
+        "The scratch directory used to stage the inputs and outputs. "
+        "Defaults to the temporary directory (TMPDIR)."
+    ),
+    "scratch_max_size": (
+        "The maximum space (in GB) used on the scratch storage. Every "
+        "staged sample reserves twice the size of its inputs, for the "
+        "inputs and the outputs, until its outputs are moved."
+    ),
+    "prefetch_samples": (
+        "The number of samples whose inputs are staged ahead, while the "
+        "previous samples are processed."
+    ),
+    "work_dir": (
+        "A persistent directory keeping the outputs of every processed "
+        "sample, together with a journal of the processed samples. A run "
+        "using the same work directory only processes the samples which "
+        "were not finished (or whose input or parameters changed), so that "
+        "a failed or interrupted run can be resumed."
+    ),
+    "on_sample_failure": (
+        "What to do when fastp fails on a sample: abort the whole run, or "
+        "skip the sample - it is left out of the output and all the failed "
+        "samples are reported at the end of the run."
+    ),
+    "shard_size": (
+        "Split the samples larger than this (in GB of input) into shards of "
+        "about this size, processed by concurrent fastp processes and joined "
+        "back afterwards, so that very large samples can use more threads "
+        "than a single fastp process. Split samples are first decompressed "
+        "into temporary files next to the outputs, which need about four "
+        "times their input size of free space. fastp evaluates every shard "
+        "on its own (e.g. detecting the adapters and overrepresented "
+        "sequences), so that shards of samples with few reads may be "
+        "trimmed differently. The reads of split samples are not kept in "
+        "their original order, their reports do not include the duplication "
+        "rate and their HTML reports are not written. Samples cannot be "
+        "deduplicated when split. 0 disables splitting."
+    ),
+    "sample_timeout": (
+        "The time (in minutes) after which the processing of a sample is "
+        "stopped and the sample counts as failed (see on_sample_failure). "
+        "0 means no limit. Whatever the limit, all fastp processes are "
+        "killed once the run is interrupted (e.g. with Ctrl-C or by a job "
+        "scheduler)."
+    ),
+}
+
 plugin.methods.register_function(
     function=process_seqs,
-    inputs={"sequences": I_fastp_in},
+    inputs={
+        "sequences": I_fastp_in,
+        "previous_sequences": SampleData[
+            SequencesWithQuality | PairedEndSequencesWithQuality
+        ],
+        "previous_reports": FastpJSONReports,
+    },
     parameters={
-        "trim_front1": Int % Range(0, None),
-        "trim_tail1": Int % Range(0, None),
-        "trim_front2": Int % Range(0, None),
-        "trim_tail2": Int % Range(0, None),
-        "max_len1": Int % Range(0, None),
-        "max_len2": Int % Range(0, None),
-        "disable_quality_filtering": Bool,
-        "n_base_limit": Int % Range(0, None),
-        "qualified_quality_phred": Int % Range(0, None),
-        "unqualified_percent_limit": Int % Range(0, 100),
-        "length_required": Int % Range(0, None),
-        "compression": Int % Range(1, 12),
-        "thread": Int % Range(1, None),
-        "dedup": Bool,
-        "dup_calc_accuracy": Int % Range(0, 6, inclusive_end=True),
-        "dont_eval_duplication": Bool,
-        "disable_adapter_trimming": Bool,
-        "adapter_sequence": Str,
-        "adapter_sequence_r2": Str,
-        "poly_g_min_len": Int % Range(0, None),
-        "poly_x_min_len": Int % Range(0, None),
-        "correction": Bool,
-        "overlap_len_require": Int % Range(0, None),
-        "overlap_diff_limit": Int % Range(0, None),
-        "overlap_diff_percent_limit": Int % Range(0, 100),
-        "cut_front": Bool,
-        "cut_tail": Bool,
-        "cut_right": Bool,
-        "cut_window_size": Int % Range(1, None),
-        "cut_mean_quality": Int % Range(1, 36),
-        "overrepresentation_analysis": Bool,
-        "overrepresentation_sampling": Int % Range(0, 10000),
+        **process_seqs_params,
+        "keep_empty_samples": Bool,
     },
     outputs=[
         ("processed_sequences", I_fastp_out),
         ("reports", FastpJSONReports),
     ],
-    input_descriptions={"sequences": "Input sequences."},
+    input_descriptions=process_seqs_input_descriptions,
     parameter_descriptions={
-        "trim_front1": "Number of bases to trim from the front of forward read.",
-        "trim_tail1": "Number of bases to trim from the tail of forward read.",
-        "max_len1": (
-            "If forward read is longer than max_len1, then trim it at its "
-            "tail to make it as long as max_len1"
-        ),
-        "trim_front2": "Number of bases to trim from the front of reverse read.",
-        "trim_tail2": "Number of bases to trim from the tail of reverse read.",
-        "max_len2": (
-            "If reverse read is longer than max_len2, then trim it at its "
-            "tail to make it as long as max_len2"
-        ),
-        "disable_quality_filtering": "Disable quality filtering.",
-        "n_base_limit": "The maximum number of N bases allowed in a read.",
-        "qualified_quality_phred": "The quality value that a base is qualified.",
-        "unqualified_percent_limit": (
-            "The maximum percentage of unqualified bases " "allowed in a read."
-        ),
-        "length_required": "The minimum length required for a read to be kept.",
-        "compression": "The compression level for the output files.",
-        "thread": "The number of threads to use.",
-        "dedup": "Enable duplication removal.",
-        "dup_calc_accuracy": "The accuracy for duplication calculation.",
-        "dont_eval_duplication": "Disable duplication evaluation.",
-        "disable_adapter_trimming": "Disable adapter trimming.",
-        "adapter_sequence": "The adapter sequence for read 1.",
-        "adapter_sequence_r2": "The adapter sequence for read 2.",
-        "poly_g_min_len": "The minimum length of polyG tail to be detected.",
-        "poly_x_min_len": "The minimum length of polyX tail to be detected.",
-        "correction": "Enable base correction in overlapped regions.",
-        "overlap_len_require": (
-            "The minimum length to detect overlapped region " "of PE reads."
-        ),
-        "overlap_diff_limit": (
-            "The maximum number of mismatched bases to detect "
-            "overlapped region of PE reads."
-        ),
-        "overlap_diff_percent_limit": (
-            "The maximum percentage of mismatched bases "
-            "to detect overlapped region of PE reads."
+        **process_seqs_param_descriptions,
+        "keep_empty_samples": (
+            "Keep the samples without any reads left after processing, as "
+            "empty files. By default, they are removed."
         ),
-        "cut_window_size": (
-            "The window size option shared by cut_front, cut_tail " "or cut_sliding."
-        ),
-        "cut_mean_quality": (
-            "The mean quality requirement option shared by cut_front, "
-            "cut_tail or cut_sliding."
-        ),
-        "cut_front": "Move a sliding window from front (5') to tail.",
-        "cut_tail": "Move a sliding window from tail (3') to front.",
-        "cut_right": "Move a sliding window from front to tail.",
-        "overrepresentation_analysis": "Enable overrepresentation analysis.",
-        "overrepresentation_sampling": (
-            "The sampling number for overrepresentation analysis. Smaller is slower."
-        ),
-    },
-    output_descriptions={
-        "processed_sequences": "Sequences processed by fastp.",
-        "reports": "Fastp JSON reports.",
     },
+    output_descriptions=process_seqs_output_descriptions,
     name="Process sequences with fastp.",
     description="Uses fastp to process input sequences with various "
     "quality control options.",
     citations=[citations["chen2023fastp"]],
 )
 
+# the parameters affecting the outcome of fastp rather than the run itself
+processing_params = {
+    k: v
+    for k, v in process_seqs_params.items()
+    if k
+    not in [
+        "cache_dir",
+        "cache_max_size",
+        "keep_html_reports",
+        "stage_to_scratch",
+        "scratch_dir",
+        "scratch_max_size",
+        "prefetch_samples",
+        "work_dir",
+        "on_sample_failure",
+        "shard_size",
+        "sample_timeout",
+    ]
+}
+processing_param_descriptions = {
+    k: v for k, v in process_seqs_param_descriptions.items() if k in processing_params
+}
+
+plugin.visualizers.register_function(
+    function=preview_processing,
+    inputs={
+        "sequences": SampleData[SequencesWithQuality | PairedEndSequencesWithQuality]
+    },
+    parameters={
+        **processing_params,
+        "reads_to_process": Int % Range(1, None),
+    },
+    input_descriptions={"sequences": "Input sequences."},
+    parameter_descriptions={
+        **processing_param_descriptions,
+        "reads_to_process": "The number of reads to process from every sample.",
+    },
+    name="Preview processing sequences with fastp.",
+    description=(
+        "Process only the first reads of every sample with fastp and "
+        "extrapolate the results to estimate the read retention, run time "
+        "and output size of processing all reads with the same parameters, "
+        "per sample and for all samples together."
+    ),
+    citations=[citations["chen2023fastp"]],
+)
+
+plugin.visualizers.register_function(
+    function=sweep_processing,
+    inputs={
+        "sequences": SampleData[SequencesWithQuality | PairedEndSequencesWithQuality]
+    },
+    parameters={
+        "parameter_sets": Metadata,
+        "thread": Int % Range(1, None),
+        "n_jobs": Int % Range(1, None),
+        "stage_inputs": Bool,
+    },
+    input_descriptions={"sequences": "Input sequences."},
+    parameter_descriptions={
+        "parameter_sets": (
+            "The parameter sets to compare, one per row. Columns are named "
+            "after the parameters of process_seqs, empty cells stand for "
+            "the default value of the parameter."
+        ),
+        "thread": process_seqs_param_descriptions["thread"],
+        "n_jobs": (
+            "The maximum number of fastp processes running concurrently, "
+            "across all samples and parameter sets."
+        ),
+        "stage_inputs": (
+            "Decompress the reads once, to RAM-backed storage if it has "
+            "enough space, and share them between all parameter sets - rather "
+            "than letting fastp decompress them again for every set."
+        ),
+    },
+    name="Compare the outcome of processing sequences with several parameters.",
+    description=(
+        "Process all samples with each of the parameter sets, within a single "
+        "pool of fastp processes, and compare the read retention and quality "
+        "across the sets. Processed reads are not written, only the reports."
+    ),
+    citations=[citations["chen2023fastp"]],
+)
+
+plugin.visualizers.register_function(
+    function=summarize_sequences,
+    inputs={
+        "sequences": SampleData[SequencesWithQuality | PairedEndSequencesWithQuality]
+    },
+    parameters={"n_jobs": Int % Range(1, None)},
+    input_descriptions={"sequences": "Input sequences."},
+    parameter_descriptions={
+        "n_jobs": "The number of processes reading the sequence files.",
+    },
+    name="Summarize sequences without fastp.",
+    description=(
+        "Compute quick summary statistics of the sequences - read counts, "
+        "read length distributions, GC content and the mean quality at "
+        "every position - directly from the reads, without running fastp. "
+        "Useful for sanity checks, e.g. of processed sequences."
+    ),
+)
 plugin.visualizers.register_function(
     function=visualize,
-    inputs={"reports": FastpJSONReports},
-    parameters={},
-    input_descriptions={"reports": "Fastp JSON reports."},
-    parameter_descriptions={},
+    inputs={
+        "reports": FastpJSONReports,
+        "overrepresented_index": FastpOverrepresentedIndex,
+    },
+    parameters={
+        "engine": Str % Choices(["multiqc", "native"]),
+        "n_jobs": Int % Range(1, None),
+    },
+    input_descriptions={
+        "reports": "Fastp JSON reports.",
+        "overrepresented_index": (
+            "An index of the overrepresented sequences of the project. The "
+            "most widespread sequences are listed below the sample table. "
+            "Only used by the native engine."
+        ),
+    },
+    parameter_descriptions={
+        "engine": (
+            "The engine generating the visualization. MultiQC generates its "
+            "full report, including the per-cycle plots - please cite MultiQC "
+            "(Ewels et al., 2016) when using it. The native engine shows the "
+            "summary statistics of all samples in a single table and scales "
+            "to thousands of samples."
+        ),
+        "n_jobs": (
+            "The number of processes reading the reports. Only used by the "
+            "native engine."
+        ),
+    },
     name="Visualize the fastp reports.",
     description=(
-        "Generate a MultiQC visualization of the JSON reports generated by fastp."
+        "Summarize the JSON reports generated by fastp, either using "
+        "MultiQC or natively."
     ),
-    citations=[citations["multiqc2016"]],
+    citations=[],
 )
 
 plugin.methods.register_function(
     function=collate_fastp_reports,
     inputs={"reports": List[FastpJSONReports]},
-    parameters={},
+    parameters={
+        "on_duplicate_ids": Str % Choices(["error", "keep_first", "keep_last"]),
+    },
     outputs={
         "collated_reports": FastpJSONReports,
     },
+    parameter_descriptions={"on_duplicate_ids": DUPLICATE_IDS_DESCRIPTION},
     name="Collate fastp reports.",
-    description="Collate fastp reports into a single artifact.",
+    description=(
+        "Collate fastp reports into a single artifact. Reports are hard-linked "
+        "where possible and copied otherwise."
+    ),
+)
+
+(
+    I_collate_in,
+    I_collate_out,
+) = TypeMap(
+    {
+        List[SampleData[SequencesWithQuality]]: SampleData[SequencesWithQuality],
+        List[SampleData[PairedEndSequencesWithQuality]]: SampleData[
+            PairedEndSequencesWithQuality
+        ],
+    }
+)
+
+plugin.methods.register_function(
+    function=collate_processed_sequences,
+    inputs={"sequences": I_collate_in},
+    parameters={
+        "on_duplicate_ids": Str % Choices(["error", "keep_first", "keep_last"]),
+    },
+    outputs={"collated_sequences": I_collate_out},
+    input_descriptions={"sequences": "Sequences processed by fastp."},
+    parameter_descriptions={"on_duplicate_ids": DUPLICATE_IDS_DESCRIPTION},
+    name="Collate processed sequences.",
+    description=(
+        "Collate sequences processed by fastp into a single artifact. Samples "
+        "without any reads (kept when processing with keep_empty_samples) are "
+        "removed. Sequences are hard-linked where possible and copied otherwise."
+    ),
+)
+
+plugin.pipelines.register_function(
+    function=process_seqs_partitioned,
+    inputs={
+        "sequences": I_fastp_in,
+        "previous_sequences": SampleData[
+            SequencesWithQuality | PairedEndSequencesWithQuality
+        ],
+        "previous_reports": FastpJSONReports,
+    },
+    parameters={
+        **process_seqs_params,
+        "num_partitions": Int % Range(1, None),
+    },
+    outputs=[
+        ("processed_sequences", I_fastp_out),
+        ("reports", FastpJSONReports),
+    ],
+    input_descriptions=process_seqs_input_descriptions,
+    parameter_descriptions={
+        **process_seqs_param_descriptions,
+        "num_partitions": (
+            "The number of partitions to split the samples into. Every "
+            "partition is processed by a separate process_seqs run, which "
+            "can be executed on a separate worker when running in parallel. "
+            "Defaults to one partition per sample."
+        ),
+    },
+    output_descriptions=process_seqs_output_descriptions,
+    name="Process sequences with fastp in partitions.",
+    description=(
+        "Split the samples into partitions, process every partition with "
+        "fastp and collate the processed sequences and the reports. Run it "
+        "in parallel to spread the partitions across the available workers."
+    ),
+    citations=[citations["chen2023fastp"]],
+)
+
+plugin.methods.register_function(
+    function=summarize_reports,
+    inputs={"reports": FastpJSONReports},
+    parameters={"n_jobs": Int % Range(1, None)},
+    outputs={"summary": FastpSummary},
+    input_descriptions={"reports": "Fastp JSON reports."},
+    parameter_descriptions={
+        "n_jobs": "The number of processes reading the reports.",
+    },
+    output_descriptions={
+        "summary": (
+            "The summary statistics of every sample: read and base counts, "
+            "quality and GC content before and after filtering, filtering "
+            "results, duplication rate, insert size and adapter trimming."
+        ),
+    },
+    name="Summarize fastp reports.",
+    description=(
+        "Extract the summary statistics from the JSON reports generated by "
+        "fastp into a single, compact table. The summary can be used as "
+        "metadata, e.g. to tabulate the statistics or to filter samples."
+    ),
+)
+
+plugin.methods.register_function(
+    function=collate_fastp_summaries,
+    inputs={"summaries": List[FastpSummary]},
+    parameters={
+        "on_duplicate_ids": Str % Choices(["error", "keep_first", "keep_last"]),
+    },
+    parameter_descriptions={"on_duplicate_ids": DUPLICATE_IDS_DESCRIPTION},
+    outputs={"collated_summary": FastpSummary},
+    name="Collate fastp summaries.",
+    description="Collate summaries of fastp reports into a single artifact.",
+)
+
+plugin.methods.register_function(
+    function=index_overrepresented_sequences,
+    inputs={
+        "reports": FastpJSONReports,
+        "index": FastpOverrepresentedIndex,
+    },
+    parameters={
+        "stage": Str % Choices(["before_filtering", "after_filtering"]),
+        "top_k": Int % Range(1, None),
+        "sketch_width": Int % Range(1024, None),
+        "n_jobs": Int % Range(1, None),
+    },
+    outputs={"overrepresented_index": FastpOverrepresentedIndex},
+    input_descriptions={
+        "reports": "Fastp JSON reports.",
+        "index": (
+            "An existing index to update with the samples of the reports. "
+            "Samples already present in the index are not counted again, and "
+            "the settings of the index take precedence over the parameters."
+        ),
+    },
+    parameter_descriptions={
+        "stage": (
+            "Index the overrepresented sequences found in the reads before or "
+            "after filtering. Reports only contain overrepresented sequences "
+            "if fastp was run with overrepresentation_analysis."
+        ),
+        "top_k": "The number of the most widespread sequences listed by name.",
+        "sketch_width": (
+            "The number of counters in every row of the count-min sketches. "
+            "Wider sketches use more memory, but overestimate the counts of "
+            "sequences less often."
+        ),
+        "n_jobs": "The number of processes reading the reports.",
+    },
+    output_descriptions={
+        "overrepresented_index": (
+            "The estimated number of samples and reads of every "
+            "overrepresented sequence, with the most widespread sequences "
+            "listed by name."
+        ),
+    },
+    name="Index overrepresented sequences across samples.",
+    description=(
+        "Count the samples in which every sequence is overrepresented, across "
+        "the whole project, in fixed-size count-min sketches - memory use does "
+        "not grow with the number of samples or distinct sequences. Sequences "
+        "widespread across samples usually point to adapters, primers or "
+        "contaminants rather than to the biology of single samples."
+    ),
+)
+
+plugin.methods.register_function(
+    function=collate_overrepresented_indexes,
+    inputs={"indexes": List[FastpOverrepresentedIndex]},
+    parameters={},
+    outputs={"collated_index": FastpOverrepresentedIndex},
+    input_descriptions={
+        "indexes": (
+            "Indexes of disjoint sets of samples, built with the same stage "
+            "and sketch width."
+        ),
+    },
+    name="Collate indexes of overrepresented sequences.",
+    description=(
+        "Collate indexes of overrepresented sequences into a single index, "
+        "e.g. the indexes of partitions of the samples."
+    ),
 )
 
 plugin.register_formats(
+    FastpHtmlFormat,
     FastpJsonFormat,
+    FastpOverrepresentedIndexFormat,
+    FastpRunPlanFormat,
+    FastpSummaryFormat,
+    FastpTimingsFormat,
     FastpJsonDirectoryFormat,
+    FastpOverrepresentedIndexDirectoryFormat,
+    FastpSummaryDirectoryFormat,
+)
+plugin.register_semantic_types(
+    FastpJSONReports, FastpOverrepresentedIndex, FastpSummary
 )
-plugin.register_semantic_types(FastpJSONReports)
 plugin.register_semantic_type_to_format(
     FastpJSONReports, artifact_format=FastpJsonDirectoryFormat
 )
+plugin.register_semantic_type_to_format(
+    FastpSummary, artifact_format=FastpSummaryDirectoryFormat
+)
+plugin.register_semantic_type_to_format(
+    FastpOverrepresentedIndex, artifact_format=FastpOverrepresentedIndexDirectoryFormat
+)
+
+importlib.import_module("q2_fastp.types._transformer")
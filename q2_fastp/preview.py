@@ -0,0 +1,228 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import zlib
+from typing import List, Tuple
+
+import pandas as pd
+import q2templates
+from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+
+from .fastp import _count_reads, _lane_manifest, _run_fastp
+from .utils import _read_sample_table
+from .visualization import TEMPLATES, _write_sample_table
+
+SCAN_BLOCK_SIZE = 64 * 1024
+
+# the columns of the sample table, with their headers
+PREVIEW_COLUMNS = {
+    "input_size": "Input size (MB)",
+    "previewed_reads": "Previewed reads",
+    "estimated_reads": "Estimated reads",
+    "retention": "Retention (%)",
+    "estimated_output_reads": "Estimated reads after filtering",
+    "estimated_time": "Estimated time (s)",
+    "estimated_output_size": "Estimated output size (MB)",
+}
+
+
+def _scan_reads(fp: str, n_reads: int) -> Tuple[int, int]:
+    """Count the reads at the beginning of a gzipped FASTQ file.
+
+    The file is decompressed block by block until n_reads reads were found.
+
+    Parameters:
+    fp (str): The gzipped FASTQ file.
+    n_reads (int): The number of reads to look for.
+
+    Returns:
+    Tuple[int, int]: The number of reads found (at most n_reads, fewer only
+        if the file is shorter) and the approximate number of compressed
+        bytes holding them.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+    lines, consumed = 0, 0
+    with open(fp, "rb") as f:
+        while lines < 4 * n_reads:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            data, rest = b"", block
+            while rest:
+                data += decompressor.decompress(rest)
+                # gzip files may consist of several concatenated members
+                rest = decompressor.unused_data if decompressor.eof else b""
+                if decompressor.eof:
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+
+            missing = 4 * n_reads - lines
+            if data.count(b"\n") < missing:
+                lines += data.count(b"\n")
+                consumed += len(block)
+                continue
+            # only count the share of the block holding the missing reads
+            end = -1
+            for _ in range(missing):
+                end = data.index(b"\n", end + 1)
+            lines += missing
+            consumed += round(len(block) * (end + 1) / len(data))
+    return min(lines // 4, n_reads), consumed
+
+
+def _estimate_sample(fp: str, n_reads: int) -> Tuple[int, int]:
+    """Estimate the total number of reads in a gzipped FASTQ file.
+
+    The number of reads is extrapolated from the compressed size of the
+    first n_reads reads - it is exact for files with fewer reads.
+
+    Returns:
+    Tuple[int, int]: The number of reads previewed and the estimated
+        number of reads in the whole file.
+    """
+    previewed, consumed = _scan_reads(fp, n_reads)
+    size = os.path.getsize(fp)
+    if previewed < n_reads or consumed >= size:
+        return previewed, previewed
+    return previewed, round(previewed * size / consumed)
+
+
+def _estimate_lanes(lane_fps: List[str], n_reads: int) -> Tuple[int, int]:
+    """Estimate the total number of reads in the lane files of a sample.
+
+    fastp reads the lanes one after another, so it previews at most n_reads
+    reads of all the lanes together.
+
+    Returns:
+    Tuple[int, int]: The number of reads previewed and the estimated
+        number of reads in all the lanes.
+    """
+    estimates = [_estimate_sample(fp, n_reads) for fp in lane_fps]
+    previewed = min(sum(previewed for previewed, _ in estimates), n_reads)
+    return previewed, sum(estimated for _, estimated in estimates)
+
+
+def _estimate_run(
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt, params: dict
+) -> pd.DataFrame:
+    """Estimate the outcome and the cost of processing the sequences.
+
+    fastp processes only the first reads of every sample and its results
+    are extrapolated to the estimated number of reads in the sample.
+
+    Parameters:
+    sequences (CasavaOneEightSingleLanePerSampleDirFmt):
+        The sequences to preview the processing of.
+    params (dict): The parameters to pass to fastp, including the number
+        of reads to preview (reads_to_process).
+
+    Returns:
+    pd.DataFrame: The estimates for every sample (see PREVIEW_COLUMNS).
+    """
+    # the same inputs as processed by _run_fastp, with all the lanes
+    manifest = _lane_manifest(sequences)
+    estimates = pd.DataFrame(
+        [
+            _estimate_lanes(row["forward"], params["reads_to_process"])
+            for _, row in manifest.iterrows()
+        ],
+        columns=["previewed_reads", "estimated_reads"],
+        index=manifest.index,
+    )
+    estimates["input_size"] = [
+        sum(os.path.getsize(fp) for lane_fps in row.dropna() for fp in lane_fps) / 1e6
+        for _, row in manifest.iterrows()
+    ]
+
+    _, json_reports, plan = _run_fastp(sequences, params)
+    timings = _read_sample_table(os.path.join(str(json_reports), "timings.tsv"))
+    reads_before = {
+        sample_id: _count_reads(
+            os.path.join(str(json_reports), f"{sample_id}.json"), "before_filtering"
+        )
+        for sample_id in plan.index
+    }
+
+    scale = estimates["estimated_reads"] / estimates["previewed_reads"].clip(lower=1)
+    estimates["retention"] = (
+        100 * plan["reads_after_filtering"] / pd.Series(reads_before).clip(lower=1)
+    )
+    estimates["estimated_output_reads"] = (
+        estimates["estimated_reads"] * estimates["retention"] / 100
+    )
+    estimates["estimated_time"] = timings["wall_time"] * scale
+    estimates["estimated_cpu_time"] = (
+        timings["user_time"] + timings["system_time"]
+    ) * scale
+    estimates["estimated_output_size"] = timings["bytes_written"] * scale / 1e6
+    estimates.index.name = "sample-id"
+    return estimates
+
+
+def preview_processing(
+    output_dir: str,
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    reads_to_process: int = 100000,
+    trim_front1: int = 0,
+    trim_tail1: int = 0,
+    max_len1: int = 0,
+    trim_front2: int = 0,
+    trim_tail2: int = 0,
+    max_len2: int = 0,
+    disable_quality_filtering: bool = False,
+    n_base_limit: int = 5,
+    qualified_quality_phred: int = 15,
+    unqualified_percent_limit: int = 40,
+    length_required: int = 15,
+    compression: int = 2,
+    thread: int = 1,
+    n_jobs: int = 1,
+    dedup: bool = False,
+    dup_calc_accuracy: int = 3,
+    dont_eval_duplication: bool = False,
+    disable_adapter_trimming: bool = False,
+    adapter_sequence: str = "",
+    adapter_sequence_r2: str = "",
+    poly_g_min_len: int = 10,
+    poly_x_min_len: int = 10,
+    overlap_len_require: int = 30,
+    overlap_diff_limit: int = 5,
+    overlap_diff_percent_limit: int = 20,
+    correction: bool = False,
+    cut_window_size: int = 4,
+    cut_mean_quality: int = 20,
+    cut_front: bool = False,
+    cut_tail: bool = False,
+    cut_right: bool = False,
+    overrepresentation_analysis: bool = False,
+    overrepresentation_sampling: int = 20,
+    output_compressor: str = "fastp",
+) -> None:
+    params = {k: v for k, v in locals().items() if k not in ["output_dir", "sequences"]}
+    estimates = _estimate_run(sequences, params)
+    estimates.to_csv(os.path.join(output_dir, "preview.tsv"), sep="\t")
+
+    table = estimates[list(PREVIEW_COLUMNS)].astype("float64").round(2)
+    _write_sample_table(table.rename(columns=PREVIEW_COLUMNS), output_dir)
+
+    reads = estimates["estimated_reads"].sum()
+    output_reads = estimates["estimated_output_reads"].sum()
+    context = {
+        "n_samples": len(estimates),
+        "reads_to_process": f"{reads_to_process:,}",
+        "estimated_reads": f"{reads:,.0f}",
+        "estimated_output_reads": f"{output_reads:,.0f}",
+        "retention": f"{100 * output_reads / reads:.2f}" if reads else "n/a",
+        "estimated_time": f"{estimates['estimated_time'].sum() / 3600:.2f}",
+        "estimated_cpu_time": f"{estimates['estimated_cpu_time'].sum() / 3600:.2f}",
+        "estimated_output_size": (
+            f"{estimates['estimated_output_size'].sum() / 1e3:.2f}"
+        ),
+    }
+    q2templates.render(
+        [os.path.join(TEMPLATES, "preview", "index.html")], output_dir, context=context
+    )
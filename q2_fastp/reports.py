@@ -0,0 +1,255 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from .types import FastpJsonDirectoryFormat
+from .types._format import _read_report_head
+
+_STAGE_FIELDS = [
+    "total_reads",
+    "total_bases",
+    "q20_rate",
+    "q30_rate",
+    "read1_mean_length",
+    "read2_mean_length",
+    "gc_content",
+]
+
+# the summary statistics extracted from every report, by their location in it
+REPORT_FIELDS = {
+    "fastp_version": ("summary", "fastp_version"),
+    "sequencing": ("summary", "sequencing"),
+    **{
+        f"{field}_{stage}": ("summary", stage, field)
+        for stage in ("before_filtering", "after_filtering")
+        for field in _STAGE_FIELDS
+    },
+    **{
+        field: ("filtering_result", field)
+        for field in [
+            "passed_filter_reads",
+            "low_quality_reads",
+            "too_many_N_reads",
+            "too_short_reads",
+            "too_long_reads",
+            "corrected_reads",
+            "corrected_bases",
+        ]
+    },
+    "duplication_rate": ("duplication", "rate"),
+    "insert_size_peak": ("insert_size", "peak"),
+    "insert_size_unknown": ("insert_size", "unknown"),
+    "adapter_trimmed_reads": ("adapter_cutting", "adapter_trimmed_reads"),
+    "adapter_trimmed_bases": ("adapter_cutting", "adapter_trimmed_bases"),
+}
+
+
+# the per-read statistics of a report, by their stage
+_READ_STATS = [
+    f"read{read}_{stage}"
+    for read in (1, 2)
+    for stage in ("before_filtering", "after_filtering")
+]
+
+
+def _weighted_mean(values: list, weights: list) -> float:
+    return float(np.average(values, weights=weights)) if sum(weights) else values[0]
+
+
+def _sum_counts(counts: List[dict]) -> dict:
+    """Sum up dictionaries of counts (e.g. of k-mers), key by key."""
+    merged = {}
+    for shard_counts in counts:
+        for key, count in shard_counts.items():
+            merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+def _merge_counts(sections: List[dict]) -> dict:
+    """Sum up the counts of a report section, keeping its other values."""
+    merged = {}
+    for key, value in sections[0].items():
+        if isinstance(value, dict):
+            merged[key] = _sum_counts([section.get(key, {}) for section in sections])
+        elif isinstance(value, int):
+            merged[key] = sum(section.get(key, 0) for section in sections)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _sum_histograms(histograms: List[list]) -> list:
+    merged = np.zeros(max(len(h) for h in histograms), dtype=np.int64)
+    for histogram in histograms:
+        merged[: len(histogram)] += histogram
+    return merged.tolist()
+
+
+def _mean_curves(curves: List[dict], weights: List[int]) -> dict:
+    """Average the per-cycle curves, weighted by the reads of every shard.
+
+    Every cycle is averaged over the shards with reads reaching it.
+    """
+    merged = {}
+    for key in dict.fromkeys(key for shard_curves in curves for key in shard_curves):
+        length = max(len(c.get(key, [])) for c in curves)
+        totals, sums = np.zeros(length), np.zeros(length)
+        for shard_curves, weight in zip(curves, weights):
+            curve = shard_curves.get(key, [])
+            sums[: len(curve)] += np.asarray(curve, dtype=float) * weight
+            totals[: len(curve)] += weight
+        merged[key] = (sums / np.maximum(totals, 1)).round(6).tolist()
+    return merged
+
+
+def _merge_stage(stages: List[dict]) -> dict:
+    """Merge the summaries of a single filtering stage.
+
+    Counts are summed up, rates are recalculated from the summed counts
+    and the mean lengths and GC content are weighted by the reads and
+    bases of every shard, respectively.
+    """
+    reads = [stage.get("total_reads", 0) for stage in stages]
+    bases = [stage.get("total_bases", 0) for stage in stages]
+    merged = {}
+    for key, value in stages[0].items():
+        values = [stage[key] for stage in stages]
+        counts = key.replace("_rate", "_bases")
+        if key.endswith("_rate") and counts in stages[0]:
+            merged[key] = sum(stage[counts] for stage in stages) / max(sum(bases), 1)
+        elif key.endswith("_mean_length"):
+            merged[key] = round(_weighted_mean(values, reads))
+        elif key == "gc_content":
+            merged[key] = _weighted_mean(values, bases)
+        elif isinstance(value, int):
+            merged[key] = sum(values)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _merge_read_stats(stats: List[dict]) -> dict:
+    """Merge the per-read statistics (curves, k-mers, ...) of a stage."""
+    reads = [shard_stats.get("total_reads", 0) for shard_stats in stats]
+    merged = {}
+    for key, value in stats[0].items():
+        values = [shard_stats.get(key, {}) for shard_stats in stats]
+        if key.endswith("_curves"):
+            merged[key] = _mean_curves(values, reads)
+        elif key in ("kmer_count", "overrepresented_sequences"):
+            merged[key] = _sum_counts(values)
+        elif key == "total_cycles":
+            merged[key] = max(values)
+        elif isinstance(value, int):
+            merged[key] = sum(values)
+        else:
+            merged[key] = value
+    return merged
+
+
+def merge_reports(reports: List[dict], command: str = None) -> dict:
+    """Merge the fastp reports of the shards of a single sample.
+
+    Counts are summed up and everything derived from them is recalculated
+    for the whole sample. The duplication rate is left out: duplicates of
+    reads in different shards are not found, so the rates of the shards
+    cannot be combined into the rate of the sample.
+
+    Parameters:
+    reports (List[dict]): The parsed reports of all shards of the sample.
+    command (str): The command processing the whole sample, reported
+        instead of the commands of the shards.
+
+    Returns:
+    dict: The report of the whole sample, with its sections ordered as
+        in the reports written by fastp.
+    """
+    first = reports[0]
+    merged = {}
+    for section, value in first.items():
+        values = [report.get(section, {}) for report in reports]
+        if section == "summary":
+            merged[section] = {
+                key: (
+                    _merge_stage([v[key] for v in values])
+                    if isinstance(stage, dict)
+                    else stage
+                )
+                for key, stage in value.items()
+            }
+        elif section in ("filtering_result", "adapter_cutting"):
+            merged[section] = _merge_counts(values)
+        elif section == "insert_size":
+            histogram = _sum_histograms([v["histogram"] for v in values])
+            merged[section] = {
+                "peak": int(np.argmax(histogram)),
+                "unknown": sum(v["unknown"] for v in values),
+                "histogram": histogram,
+            }
+        elif section in _READ_STATS:
+            merged[section] = _merge_read_stats(values)
+        elif section == "duplication":
+            continue
+        elif section == "command" and command is not None:
+            merged[section] = command
+        else:
+            merged[section] = value
+    return merged
+
+
+def _parse_report(fp: str) -> list:
+    """Extract the summary statistics (see REPORT_FIELDS) from a fastp report.
+
+    Statistics missing from the report (e.g. the insert size of single-end
+    reads) are None.
+    """
+    report = _read_report_head(fp)
+    values = []
+    for path in REPORT_FIELDS.values():
+        value = report
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        values.append(value)
+    return values
+
+
+def parse_reports(fps: List[str], n_jobs: int = 1) -> pd.DataFrame:
+    """Extract the summary statistics from the fastp reports.
+
+    Parameters:
+    fps (List[str]): The fastp JSON reports, named after their samples.
+    n_jobs (int): The number of processes parsing the reports.
+
+    Returns:
+    pd.DataFrame: The summary statistics (see REPORT_FIELDS) of every
+        sample, indexed by sample ID.
+    """
+    if n_jobs == 1 or len(fps) < 2:
+        rows = [_parse_report(fp) for fp in fps]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chunksize = max(len(fps) // (n_jobs * 4), 1)
+            rows = list(executor.map(_parse_report, fps, chunksize=chunksize))
+
+    sample_ids = [os.path.basename(fp)[: -len(".json")] for fp in fps]
+    summary = pd.DataFrame(
+        rows, columns=list(REPORT_FIELDS), index=pd.Index(sample_ids, name="id")
+    )
+    return summary.convert_dtypes()
+
+
+def summarize_reports(
+    reports: FastpJsonDirectoryFormat, n_jobs: int = 1
+) -> pd.DataFrame:
+    fps = sorted(str(fp) for fp in reports.path.glob("*.json"))
+    return parse_reports(fps, n_jobs=n_jobs)
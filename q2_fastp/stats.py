@@ -0,0 +1,293 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import q2templates
+from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+
+from .fastp import _lane_manifest
+from .visualization import TEMPLATES, _write_sample_table
+
+# the number of decompressed bytes processed at a time
+STATS_BLOCK_SIZE = 4 * 1024**2
+QUALITY_OFFSET = 33
+# setting this bit turns upper-case bases into lower-case ones
+LOWER_CASE_BIT = 0x20
+
+# the columns of the sample table, with their headers
+STATS_COLUMNS = {
+    "reads": "Reads",
+    "mean_length_forward": "Mean length (forward)",
+    "mean_length_reverse": "Mean length (reverse)",
+    "min_length": "Min length",
+    "max_length": "Max length",
+    "gc_content": "GC content (%)",
+    "q30_rate": "Q30 bases (%)",
+    "mean_quality": "Mean quality",
+}
+
+
+def _read_records(fp: str) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Read the complete records of a gzipped FASTQ file in large batches.
+
+    The file is decompressed STATS_BLOCK_SIZE bytes at a time - the lines
+    of a record split between two blocks are carried over to the next one.
+
+    Yields:
+    Tuple[np.ndarray, np.ndarray]: The bytes of the complete records of the
+        batch and the positions of the line breaks ending their lines.
+    """
+    rest = b""
+    with gzip.open(fp, "rb") as f:
+        while True:
+            block = f.read(STATS_BLOCK_SIZE)
+            data = rest + block
+            if not block and data and not data.endswith(b"\n"):
+                data += b"\n"
+            buffer = np.frombuffer(data, dtype=np.uint8)
+            newlines = np.flatnonzero(buffer == ord("\n"))
+            complete = len(newlines) - len(newlines) % 4
+            if not block and complete < len(newlines):
+                raise ValueError(f"The last record of {fp} is incomplete.")
+            if complete:
+                end = newlines[complete - 1] + 1
+                yield buffer[:end], newlines[:complete]
+                rest = data[end:]
+            else:
+                rest = data
+            if not block:
+                return
+
+
+def _add_counts(total: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Add up per-length or per-position counts of different lengths."""
+    added = np.zeros(max(len(total), len(counts)), dtype=np.result_type(total, counts))
+    added[: len(total)] += total
+    added[: len(counts)] += counts
+    return added
+
+
+def _gather_reads(
+    buffer: np.ndarray,
+    seq_starts: np.ndarray,
+    qual_starts: np.ndarray,
+    lengths: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Gather the bases and quality scores of a batch of reads.
+
+    Batches of reads of a single length (the usual case) are gathered into
+    a matrix, with a read per row - otherwise the bases of all the reads
+    are gathered one after another, together with their positions.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The bases, the
+        quality scores and the sum and number of the quality scores at
+        every position.
+    """
+    if lengths.min() == lengths.max():
+        columns = np.arange(lengths[0])
+        bases = buffer[seq_starts[:, None] + columns]
+        qualities = buffer[qual_starts[:, None] + columns] - QUALITY_OFFSET
+        sums = qualities.sum(axis=0, dtype=np.int64)
+        return bases, qualities, sums, np.full(len(columns), len(lengths))
+
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.arange(len(offsets)) - offsets
+    bases = buffer[np.repeat(seq_starts, lengths) + positions]
+    qualities = buffer[np.repeat(qual_starts, lengths) + positions] - QUALITY_OFFSET
+    sums = np.bincount(positions, weights=qualities).astype(np.int64)
+    return bases, qualities, sums, np.bincount(positions)
+
+
+def _fastq_stats(fp: str) -> dict:
+    """Compute the statistics of a gzipped FASTQ file.
+
+    The reads are processed in batches of complete records, so memory use
+    is bounded by the block size (and the longest read), not by the size
+    of the file.
+
+    Parameters:
+    fp (str): The gzipped FASTQ file.
+
+    Returns:
+    dict: The number of reads and bases, of G/C bases and of bases with
+        a quality of at least 30, the histogram of the read lengths and
+        the sum and number of the quality scores at every position.
+    """
+    stats = {
+        "reads": 0,
+        "bases": 0,
+        "gc_bases": 0,
+        "q30_bases": 0,
+        "length_histogram": np.zeros(0, dtype=np.int64),
+        "quality_sums": np.zeros(0, dtype=np.int64),
+        "quality_counts": np.zeros(0, dtype=np.int64),
+    }
+    for buffer, newlines in _read_records(fp):
+        seq_starts, seq_ends = newlines[0::4] + 1, newlines[1::4]
+        qual_starts, qual_ends = newlines[2::4] + 1, newlines[3::4]
+        lengths = seq_ends - seq_starts
+        if not np.array_equal(lengths, qual_ends - qual_starts):
+            raise ValueError(
+                f"The sequence and quality lengths of a record in {fp} differ."
+            )
+
+        bases, qualities, sums, counts = _gather_reads(
+            buffer, seq_starts, qual_starts, lengths
+        )
+        bases |= LOWER_CASE_BIT
+
+        stats["reads"] += len(lengths)
+        stats["bases"] += int(lengths.sum())
+        stats["gc_bases"] += int(
+            np.count_nonzero(bases == ord("g")) + np.count_nonzero(bases == ord("c"))
+        )
+        stats["q30_bases"] += int(np.count_nonzero(qualities >= 30))
+        stats["length_histogram"] = _add_counts(
+            stats["length_histogram"], np.bincount(lengths)
+        )
+        stats["quality_sums"] = _add_counts(stats["quality_sums"], sums)
+        stats["quality_counts"] = _add_counts(stats["quality_counts"], counts)
+    return stats
+
+
+def _merge_stats(stats: List[dict]) -> dict:
+    """Add up the statistics (see _fastq_stats) of several files."""
+    merged = dict(stats[0])
+    for file_stats in stats[1:]:
+        for key, value in file_stats.items():
+            if isinstance(value, np.ndarray):
+                merged[key] = _add_counts(merged[key], value)
+            else:
+                merged[key] += value
+    return merged
+
+
+def _collect_stats(manifest: pd.DataFrame, n_jobs: int = 1) -> dict:
+    """Compute the statistics of all the files of the sequences.
+
+    The statistics of the lanes of a sample are added up.
+
+    Parameters:
+    manifest (pd.DataFrame): The lane files of every sample (see
+        fastp._lane_manifest).
+    n_jobs (int): The number of processes reading the files.
+
+    Returns:
+    dict: The statistics (see _fastq_stats) of every sample and direction
+        ("forward" or "reverse") of its reads.
+    """
+    files = [
+        ((sample_id, direction), fp)
+        for sample_id, row in manifest.iterrows()
+        for direction, fps in row.items()
+        if isinstance(fps, list)
+        for fp in fps
+    ]
+    fps = [fp for _, fp in files]
+    if n_jobs == 1 or len(files) < 2:
+        stats = [_fastq_stats(fp) for fp in fps]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            stats = list(executor.map(_fastq_stats, fps))
+
+    lanes = {}
+    for (key, _), file_stats in zip(files, stats):
+        lanes.setdefault(key, []).append(file_stats)
+    return {key: _merge_stats(lane_stats) for key, lane_stats in lanes.items()}
+
+
+def _tabulate_stats(stats: dict) -> pd.DataFrame:
+    """Tabulate the statistics of every sample (see STATS_COLUMNS)."""
+    rows = {}
+    for (sample_id, direction), file_stats in stats.items():
+        row = rows.setdefault(
+            sample_id,
+            {"bases": 0, "gc_bases": 0, "q30_bases": 0, "quality_sum": 0.0},
+        )
+        if direction == "forward":
+            row["reads"] = file_stats["reads"]
+        row[f"mean_length_{direction}"] = file_stats["bases"] / max(
+            file_stats["reads"], 1
+        )
+        lengths = np.flatnonzero(file_stats["length_histogram"])
+        if len(lengths):
+            row["min_length"] = min(row.get("min_length", lengths[0]), lengths[0])
+            row["max_length"] = max(row.get("max_length", lengths[-1]), lengths[-1])
+        row["bases"] += file_stats["bases"]
+        row["gc_bases"] += file_stats["gc_bases"]
+        row["q30_bases"] += file_stats["q30_bases"]
+        row["quality_sum"] += file_stats["quality_sums"].sum()
+
+    table = pd.DataFrame.from_dict(rows, orient="index")
+    bases = table["bases"].clip(lower=1)
+    table["gc_content"] = 100 * table["gc_bases"] / bases
+    table["q30_rate"] = 100 * table["q30_bases"] / bases
+    table["mean_quality"] = table["quality_sum"] / bases
+    table = table.reindex(columns=["bases", "gc_bases", "q30_bases", *STATS_COLUMNS])
+    table.index.name = "sample-id"
+    return table
+
+
+def _tabulate_curves(stats: dict, key: str) -> pd.DataFrame:
+    """Sum up per-length or per-position counts over samples, by direction."""
+    curves = {}
+    for (_, direction), file_stats in stats.items():
+        curves[direction] = _add_counts(
+            curves.get(direction, np.zeros(0)), file_stats[key]
+        )
+    length = max(len(curve) for curve in curves.values())
+    return pd.DataFrame(
+        {
+            direction: np.pad(curve, (0, length - len(curve)))
+            for direction, curve in curves.items()
+        }
+    )
+
+
+def summarize_sequences(
+    output_dir: str,
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    n_jobs: int = 1,
+) -> None:
+    stats = _collect_stats(_lane_manifest(sequences), n_jobs=n_jobs)
+    table = _tabulate_stats(stats)
+    table.to_csv(os.path.join(output_dir, "sequence-stats.tsv"), sep="\t")
+
+    lengths = _tabulate_curves(stats, "length_histogram")
+    lengths.index.name = "length"
+    lengths = lengths.loc[lengths.sum(axis=1) > 0].astype("int64")
+    lengths.to_csv(os.path.join(output_dir, "read-lengths.tsv"), sep="\t")
+
+    qualities = _tabulate_curves(stats, "quality_sums") / _tabulate_curves(
+        stats, "quality_counts"
+    ).clip(lower=1)
+    qualities.index = pd.RangeIndex(1, len(qualities) + 1, name="position")
+    qualities.round(4).to_csv(os.path.join(output_dir, "mean-quality.tsv"), sep="\t")
+
+    sample_table = table[list(STATS_COLUMNS)].astype("float64").round(2)
+    _write_sample_table(sample_table.rename(columns=STATS_COLUMNS), output_dir)
+
+    bases = table["bases"].sum()
+    context = {
+        "n_samples": len(table),
+        "reads": f"{table['reads'].sum():,}",
+        "bases": f"{bases:,}",
+        "gc_content": (
+            f"{100 * table['gc_bases'].sum() / bases:.2f}" if bases else "n/a"
+        ),
+        "q30_rate": f"{100 * table['q30_bases'].sum() / bases:.2f}" if bases else "n/a",
+    }
+    q2templates.render(
+        [os.path.join(TEMPLATES, "stats", "index.html")], output_dir, context=context
+    )
@@ -0,0 +1,406 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import gzip
+import inspect
+import os
+import shutil
+import tempfile
+import time
+from functools import partial
+from typing import Dict, List
+
+import pandas as pd
+import q2templates
+from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+from qiime2 import Metadata
+
+from .fastp import (
+    _concatenated_lanes,
+    _fastp_cmd,
+    _lane_manifest,
+    _plan_fastp_runs,
+    _Progress,
+    _run_jobs,
+    _run_sample,
+    _split_core_budget,
+    process_seqs,
+)
+from .reports import parse_reports
+from .utils import EXTERNAL_CMD_WARNING
+from .visualization import TEMPLATES
+
+# RAM-backed storage used for the decompressed inputs, if it has enough space
+RAM_STAGING_DIR = "/dev/shm"
+# the assumed ratio between the decompressed and compressed size of FASTQ files
+STAGING_EXPANSION = 4
+
+# the parameters of process_seqs which can be swept over
+SWEEP_PARAMS = [
+    param
+    for param in inspect.signature(process_seqs).parameters
+    if param
+    not in [
+        "sequences",
+        "previous_sequences",
+        "previous_reports",
+        "compression",
+        "thread",
+        "n_jobs",
+        "cache_dir",
+        "cache_max_size",
+        "keep_html_reports",
+        "keep_empty_samples",
+        "output_compressor",
+        "stage_to_scratch",
+        "scratch_dir",
+        "scratch_max_size",
+        "prefetch_samples",
+        "work_dir",
+        "on_sample_failure",
+        "shard_size",
+        "sample_timeout",
+    ]
+]
+
+# the columns of the comparison table holding read counts
+COUNT_COLUMNS = [
+    "reads_before_filtering",
+    "reads_after_filtering",
+    "adapter_trimmed_reads",
+    "low_quality_reads",
+    "too_many_N_reads",
+    "too_short_reads",
+]
+
+# the columns of the comparison table, with their headers
+COMPARISON_COLUMNS = {
+    "reads_before_filtering": "Reads (raw)",
+    "reads_after_filtering": "Reads (filtered)",
+    "retention": "Passed filter (%)",
+    "min_sample_retention": "Lowest passed filter of a sample (%)",
+    "q30_rate_after_filtering": "Q30 rate (filtered)",
+    "mean_length_after_filtering": "Mean read length (filtered)",
+    "duplication_rate": "Duplication rate",
+    "adapter_trimmed_reads": "Adapter-trimmed reads",
+    "low_quality_reads": "Low quality reads",
+    "too_many_N_reads": "Too many N reads",
+    "too_short_reads": "Too short reads",
+    "fastp_time": "fastp time (s)",
+}
+
+
+def _cast_param(value, default):
+    """Cast a metadata value to the type of the parameter's default value."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(default, bool):
+        if str(value).lower() not in ["true", "false", "1", "0"]:
+            raise ValueError(value)
+        return str(value).lower() in ["true", "1"]
+    if isinstance(default, int):
+        return int(value)
+    return str(value)
+
+
+def _parse_parameter_sets(parameter_sets: pd.DataFrame) -> Dict[str, dict]:
+    """Build the full processing parameters of every parameter set.
+
+    Parameters:
+    parameter_sets (pd.DataFrame): The parameter sets, one per row, with
+        the swept parameters as columns. Missing values stand for the
+        default value of the parameter.
+
+    Returns:
+    Dict[str, dict]: The parameters of process_seqs for every set, by set ID.
+    """
+    defaults = {
+        param: p.default
+        for param, p in inspect.signature(process_seqs).parameters.items()
+        if param in SWEEP_PARAMS
+    }
+    unknown = sorted(set(parameter_sets.columns) - set(defaults))
+    if unknown:
+        raise ValueError(
+            f"The following columns of the parameter sets are not parameters "
+            f"which can be swept over: {', '.join(unknown)}. Valid parameters "
+            f"are: {', '.join(SWEEP_PARAMS)}."
+        )
+
+    sets = {}
+    for set_id, row in parameter_sets.iterrows():
+        params = dict(defaults)
+        for param, value in row.dropna().items():
+            try:
+                params[param] = _cast_param(value, defaults[param])
+            except ValueError:
+                raise ValueError(
+                    f'Invalid value "{value}" of the parameter "{param}" in the '
+                    f'parameter set "{set_id}".'
+                )
+        sets[set_id] = params
+    return sets
+
+
+def _choose_staging_dir(required: int) -> str:
+    """Choose where to stage the decompressed inputs.
+
+    RAM-backed storage is used if it exists and has enough free space,
+    otherwise the default temporary directory is.
+    """
+    if os.path.isdir(RAM_STAGING_DIR) and os.access(RAM_STAGING_DIR, os.W_OK):
+        if shutil.disk_usage(RAM_STAGING_DIR).free > required:
+            return RAM_STAGING_DIR
+    return tempfile.gettempdir()
+
+
+def _decompress(srcs: List[str], dst: str) -> str:
+    """Decompress the lane files of a sample into a single file."""
+    with open(dst, "wb") as fout:
+        for src in srcs:
+            with gzip.open(src, "rb") as fin:
+                shutil.copyfileobj(fin, fout, 1024**2)
+    return dst
+
+
+def _stage_inputs(
+    manifest: pd.DataFrame, staging_dir: str, n_jobs: int
+) -> Dict[str, List[str]]:
+    """Decompress the reads of every sample once, for all parameter sets.
+
+    Parameters:
+    manifest (pd.DataFrame): The lane files of every sample (see
+        fastp._lane_manifest).
+    staging_dir (str): The directory to decompress the reads into.
+    n_jobs (int): The number of files decompressed concurrently.
+
+    Returns:
+    Dict[str, List[str]]: The decompressed forward and (for paired-end
+        reads) reverse reads of every sample, with all of its lanes.
+    """
+    inputs = {
+        sample_id: row.dropna().tolist() for sample_id, row in manifest.iterrows()
+    }
+    files = [lane_fps for reads in inputs.values() for lane_fps in reads]
+    staged = [
+        os.path.join(staging_dir, f"{i}-{os.path.basename(lane_fps[0])[: -len('.gz')]}")
+        for i, lane_fps in enumerate(files)
+    ]
+    _run_jobs(
+        [partial(_decompress, lane_fps, fp) for lane_fps, fp in zip(files, staged)],
+        [1] * len(files),
+        n_jobs,
+        n_jobs,
+    )
+    staged = iter(staged)
+    return {
+        sample_id: [next(staged) for _ in reads] for sample_id, reads in inputs.items()
+    }
+
+
+def _run_sweep(
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    parameter_sets: Dict[str, dict],
+    reports_dir: str,
+    thread: int = 1,
+    n_jobs: int = 1,
+    stage_inputs: bool = True,
+) -> pd.DataFrame:
+    """Run fastp on every sample with every parameter set.
+
+    All (sample, parameter set) jobs are scheduled through a single pool,
+    largest samples first. Only the JSON reports are written - one
+    directory per parameter set, numbered in the order of the sets. The
+    lanes of samples sequenced on several lanes are processed together.
+
+    Parameters:
+    sequences (CasavaOneEightSingleLanePerSampleDirFmt): The sequences.
+    parameter_sets (Dict[str, dict]): The parameters of every set.
+    reports_dir (str): The directory to write the reports into.
+    thread (int): The total number of threads available to the sweep.
+    n_jobs (int): The maximum number of concurrent fastp processes.
+    stage_inputs (bool): Decompress the inputs once before the sweep,
+        rather than letting fastp decompress them for every set.
+
+    Returns:
+    pd.DataFrame: The records of all jobs, indexed by the parameter set
+        and the sample ID.
+    """
+    manifest = _lane_manifest(sequences)
+    n_jobs, _ = _split_core_budget(thread, n_jobs, len(manifest) * len(parameter_sets))
+    plan = _plan_fastp_runs(manifest, thread, n_jobs)
+    set_dirs = {
+        set_id: os.path.join(reports_dir, str(i))
+        for i, set_id in enumerate(parameter_sets)
+    }
+    for set_dir in set_dirs.values():
+        os.makedirs(set_dir)
+
+    required = STAGING_EXPANSION * plan["input_size"].sum()
+    with tempfile.TemporaryDirectory(dir=_choose_staging_dir(required)) as temp_dir:
+        lanes = {}
+        if stage_inputs:
+            inputs = _stage_inputs(manifest, temp_dir, n_jobs)
+        else:
+            # the lanes are concatenated once, for all parameter sets
+            inputs = {}
+            for sample_id, row in manifest.iterrows():
+                inputs[sample_id] = []
+                for direction, lane_fps in row.dropna().items():
+                    fp = lane_fps[0]
+                    if len(lane_fps) > 1:
+                        fp = os.path.join(
+                            temp_dir, f"{sample_id}.{direction}.lanes.fastq.gz"
+                        )
+                        lanes[fp] = lane_fps
+                    inputs[sample_id].append(fp)
+
+        keys, jobs, threads = [], [], []
+        progress = _Progress(len(plan) * len(parameter_sets))
+        for sample_id in plan.index:
+            for set_id, params in parameter_sets.items():
+                outputs = {"json": os.path.join(set_dirs[set_id], f"{sample_id}.json")}
+                cmd = _fastp_cmd(
+                    inputs[sample_id], outputs, params, plan.loc[sample_id, "threads"]
+                )
+                if not jobs:
+                    print(EXTERNAL_CMD_WARNING)
+                    print(
+                        f"\nCommand (first of {len(plan) * len(parameter_sets)}):",
+                        " ".join(cmd),
+                        end="\n\n",
+                    )
+                log_fp = os.path.join(
+                    temp_dir, f"{os.path.basename(set_dirs[set_id])}-{sample_id}.log"
+                )
+                job = partial(_run_sample, cmd, inputs[sample_id], outputs, log_fp)
+                keys.append((set_id, sample_id))
+                jobs.append(partial(progress.run, job))
+                threads.append(plan.loc[sample_id, "threads"])
+
+        start = time.perf_counter()
+        with _concatenated_lanes(lanes):
+            records = _run_jobs(jobs, threads, n_jobs, thread)
+        print(f"Finished the sweep in {time.perf_counter() - start:.1f} s.")
+
+    index = pd.MultiIndex.from_tuples(keys, names=["parameter-set", "sample-id"])
+    return pd.DataFrame(records, index=index)
+
+
+def _compare_sets(summary: pd.DataFrame, records: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate the statistics of all samples for every parameter set.
+
+    Parameters:
+    summary (pd.DataFrame): The summary statistics of every sample (see
+        REPORT_FIELDS), indexed by the parameter set and the sample ID.
+    records (pd.DataFrame): The records of all jobs, indexed the same way.
+
+    Returns:
+    pd.DataFrame: The comparison table (see COMPARISON_COLUMNS), indexed
+        by the parameter set.
+    """
+    numeric = summary.drop(columns=["fastp_version", "sequencing"]).astype("float64")
+    numeric["retention"] = (
+        100
+        * numeric["total_reads_after_filtering"]
+        / numeric["total_reads_before_filtering"]
+    )
+    numeric["weighted_q30"] = (
+        numeric["q30_rate_after_filtering"] * numeric["total_bases_after_filtering"]
+    )
+    numeric["weighted_duplication"] = (
+        numeric["duplication_rate"] * numeric["total_reads_before_filtering"]
+    )
+    numeric["fastp_time"] = records["wall_time"]
+
+    sets = numeric.groupby(level="parameter-set", sort=False)
+    totals = sets.sum(min_count=1)
+    comparison = pd.DataFrame(
+        {
+            "reads_before_filtering": totals["total_reads_before_filtering"],
+            "reads_after_filtering": totals["total_reads_after_filtering"],
+            "retention": 100
+            * totals["total_reads_after_filtering"]
+            / totals["total_reads_before_filtering"],
+            "min_sample_retention": sets["retention"].min(),
+            "q30_rate_after_filtering": totals["weighted_q30"]
+            / totals["total_bases_after_filtering"],
+            "mean_length_after_filtering": totals["total_bases_after_filtering"]
+            / totals["total_reads_after_filtering"],
+            "duplication_rate": totals["weighted_duplication"]
+            / totals["total_reads_before_filtering"],
+            "adapter_trimmed_reads": totals["adapter_trimmed_reads"],
+            "low_quality_reads": totals["low_quality_reads"],
+            "too_many_N_reads": totals["too_many_N_reads"],
+            "too_short_reads": totals["too_short_reads"],
+            "fastp_time": totals["fastp_time"],
+        }
+    )
+    return comparison
+
+
+def sweep_processing(
+    output_dir: str,
+    sequences: CasavaOneEightSingleLanePerSampleDirFmt,
+    parameter_sets: Metadata,
+    thread: int = 1,
+    n_jobs: int = 1,
+    stage_inputs: bool = True,
+) -> None:
+    parameter_sets = parameter_sets.to_dataframe()
+    sets = _parse_parameter_sets(parameter_sets)
+
+    with tempfile.TemporaryDirectory() as reports_dir:
+        records = _run_sweep(
+            sequences,
+            sets,
+            reports_dir,
+            thread=thread,
+            n_jobs=n_jobs,
+            stage_inputs=stage_inputs,
+        )
+        summary = pd.concat(
+            {
+                set_id: parse_reports(
+                    sorted(
+                        os.path.join(reports_dir, str(i), f)
+                        for f in os.listdir(os.path.join(reports_dir, str(i)))
+                    ),
+                    n_jobs=n_jobs,
+                )
+                for i, set_id in enumerate(sets)
+            },
+            names=["parameter-set", "sample-id"],
+        )
+
+    # the swept parameters, with the defaults filled in
+    swept = pd.DataFrame.from_dict(sets, orient="index")[parameter_sets.columns]
+    comparison = swept.join(_compare_sets(summary, records))
+    comparison.index.name = "parameter-set"
+    comparison.to_csv(os.path.join(output_dir, "sweep.tsv"), sep="\t")
+    summary.to_csv(os.path.join(output_dir, "sweep-samples.tsv"), sep="\t")
+
+    formatters = {
+        COMPARISON_COLUMNS[col]: (
+            "{:,.0f}".format if col in COUNT_COLUMNS else "{:,.4f}".format
+        )
+        for col in COMPARISON_COLUMNS
+    }
+    context = {
+        "n_samples": records.index.get_level_values("sample-id").nunique(),
+        "n_sets": len(sets),
+        "staged": stage_inputs,
+        "table": comparison.rename(columns=COMPARISON_COLUMNS).to_html(
+            classes="table table-striped table-hover table-condensed",
+            border=0,
+            formatters=formatters,
+            na_rep="",
+        ),
+    }
+    q2templates.render(
+        [os.path.join(TEMPLATES, "sweep", "index.html")], output_dir, context=context
+    )
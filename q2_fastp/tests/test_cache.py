@@ -0,0 +1,165 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp._cache import (
+    FastpResultCache,
+    fingerprint_files,
+    get_fastp_version,
+    hash_cmd,
+    hash_file,
+    normalize_cmd,
+)
+
+
+class TestCache(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        self.cache = FastpResultCache(self.cache_dir, 1024**3)
+        self.input_fp = self.get_data_path("reads/sample1_00_L001_R1_001.fastq.gz")
+        self.cmd = [
+            "fastp",
+            "--in1",
+            self.input_fp,
+            "--out1",
+            "/tmp/a/sample1_00_L001_R1_001.fastq.gz",
+            "--json",
+            "/tmp/b/sample1.json",
+            "--thread",
+            "4",
+            "--length_required",
+            "15",
+        ]
+
+    def _write_outputs(self, name, content=b"data"):
+        outputs = {}
+        for role in ("out1", "json"):
+            fp = os.path.join(self.temp_dir.name, f"{name}-{role}")
+            with open(fp, "wb") as f:
+                f.write(content)
+            outputs[role] = fp
+        return outputs
+
+    @patch("q2_fastp._cache.run_command")
+    def test_get_fastp_version(self, mock_run):
+        mock_run.return_value = MagicMock(stderr="fastp 0.23.4\n", stdout="")
+        self.assertEqual(get_fastp_version(), "0.23.4")
+
+    def test_normalize_cmd(self):
+        obs = normalize_cmd(self.cmd)
+        self.assertListEqual(
+            obs, ["fastp", "--in1", "--out1", "--json", "--length_required", "15"]
+        )
+
+    def test_key_ignores_paths_and_threads(self):
+        other_cmd = [
+            "fastp",
+            "--in1",
+            self.input_fp,
+            "--out1",
+            "/tmp/c/sample1_00_L001_R1_001.fastq.gz",
+            "--json",
+            "/tmp/d/sample1.json",
+            "--thread",
+            "1",
+            "--length_required",
+            "15",
+        ]
+        self.assertEqual(
+            self.cache.key([self.input_fp], self.cmd, "fastp 0.23.4"),
+            self.cache.key([self.input_fp], other_cmd, "fastp 0.23.4"),
+        )
+
+    def test_key_depends_on_params_version_and_content(self):
+        key = self.cache.key([self.input_fp], self.cmd, "fastp 0.23.4")
+        other_cmd = self.cmd[:-1] + ["30"]
+        other_input = self.get_data_path("reads/sample2_00_L001_R1_001.fastq.gz")
+
+        self.assertNotEqual(
+            key, self.cache.key([self.input_fp], other_cmd, "fastp 0.23.4")
+        )
+        self.assertNotEqual(
+            key, self.cache.key([self.input_fp], self.cmd, "fastp 0.24.0")
+        )
+        self.assertNotEqual(
+            key, self.cache.key([other_input], self.cmd, "fastp 0.23.4")
+        )
+        self.assertNotEqual(hash_file(self.input_fp), hash_file(other_input))
+
+    def test_fingerprint_files(self):
+        fp = os.path.join(self.temp_dir.name, "reads.fastq.gz")
+        with open(fp, "wb") as f:
+            f.write(b"x" * 200000)
+        obs = fingerprint_files([fp])
+        self.assertEqual(obs, fingerprint_files([fp]))
+
+        with open(fp, "r+b") as f:
+            f.seek(100000)
+            f.write(b"y")
+        self.assertNotEqual(obs, fingerprint_files([fp]))
+
+    def test_hash_cmd(self):
+        other_cmd = list(self.cmd)
+        other_cmd[other_cmd.index("--thread") + 1] = "1"
+        self.assertEqual(hash_cmd(self.cmd), hash_cmd(other_cmd))
+        self.assertNotEqual(hash_cmd(self.cmd), hash_cmd(self.cmd[:-1] + ["30"]))
+
+    def test_store_restore(self):
+        outputs = self._write_outputs("run1", b"trimmed")
+        self.cache.store("abcdef", outputs)
+
+        restored = {
+            role: os.path.join(self.temp_dir.name, f"restored-{role}")
+            for role in outputs
+        }
+        self.assertTrue(self.cache.restore("abcdef", restored))
+        for fp in restored.values():
+            with open(fp, "rb") as f:
+                self.assertEqual(f.read(), b"trimmed")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+    def test_restore_miss(self):
+        restored = {"out1": os.path.join(self.temp_dir.name, "restored")}
+        self.assertFalse(self.cache.restore("abcdef", restored))
+        self.assertFalse(os.path.exists(restored["out1"]))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_evict_least_recently_used(self):
+        cache = FastpResultCache(self.cache_dir, 20)
+        for i, key in enumerate(["aa1", "bb2", "cc3"]):
+            cache.store(key, self._write_outputs(key, b"x" * 5))
+            entry = os.path.join(self.cache_dir, key[:2], key)
+            os.utime(entry, (time.time() - 100 + i, time.time() - 100 + i))
+
+        # use the oldest entry so that the second one is evicted instead
+        cache.restore("aa1", {"out1": os.path.join(self.temp_dir.name, "restored")})
+        cache.evict()
+
+        self.assertEqual(cache.evicted, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "aa", "aa1")))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, "bb", "bb2")))
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "cc", "cc3")))
+        self.assertEqual(cache.size(), 20)
+
+    def test_summary(self):
+        self.cache.store("abcdef", self._write_outputs("run1"))
+        self.assertIn(
+            "0 hit(s), 0 miss(es), 0 entry(ies) evicted", self.cache.summary()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
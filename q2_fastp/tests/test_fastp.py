@@ -5,21 +5,92 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import gzip
+import json
 import os
 import shutil
+import subprocess
 import unittest
-from unittest.mock import patch, call, MagicMock, ANY
+from functools import partial
+from unittest.mock import ANY, MagicMock, PropertyMock, call, patch
 
+import pandas as pd
 from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
 from qiime2.plugin.testing import TestPluginBase
 
+from q2_fastp._scratch import ScratchStager
 from q2_fastp.fastp import (
+    _count_reads,
+    _finalize_sample,
     _find_empty_samples,
-    _remove_samples,
+    _find_reusable_samples,
+    _lane_manifest,
+    _manifest_from_plan,
+    _OutputCompressor,
+    _plan_fastp_runs,
+    _Progress,
     _run_fastp,
+    _run_jobs,
+    _shard_cmd,
+    _split_compression_threads,
+    _split_core_budget,
+    _summarize_timings,
+    _tabulate_timings,
+    collate_processed_sequences,
     process_seqs,
+    process_seqs_partitioned,
 )
 from q2_fastp.types import FastpJsonDirectoryFormat
+from q2_fastp.utils import EXTERNAL_CMD_WARNING, run_command
+
+
+def _fake_outputs(outputs, reads=10):
+    """Create the outputs of a fastp run, as fastp would."""
+    for role, fp in outputs.items():
+        with open(fp, "w") as f:
+            if role == "json":
+                json.dump(
+                    {
+                        "summary": {
+                            "fastp_version": "0.23.4",
+                            "before_filtering": {"total_reads": 2 * reads + 10},
+                            "after_filtering": {"total_reads": reads},
+                        }
+                    },
+                    f,
+                )
+            else:
+                f.write("reads")
+    return {"source": "fastp"}
+
+
+def _fake_fastp(cmd, reads=10, **kwargs):
+    """Mimic fastp by creating the output files of the given command."""
+    roles = {"--out1": "out1", "--out2": "out2", "--json": "json"}
+    _fake_outputs(
+        {role: cmd[cmd.index(opt) + 1] for opt, role in roles.items() if opt in cmd},
+        reads=reads,
+    )
+    return {"wall_time": 2.0, "user_time": 1.5, "system_time": 0.5, "max_rss": 1024}
+
+
+def _fake_shard_fastp(cmd, **kwargs):
+    """Mimic fastp processing a shard, passing the reads of its files through.
+
+    The commands splitting the sample into shards are run as they are.
+    """
+    if cmd[0] != "fastp":
+        return run_command(cmd, **kwargs)
+    records = {}
+    for in_opt, out_opt in (("--in1", "--out1"), ("--in2", "--out2")):
+        if in_opt in cmd:
+            with open(cmd[cmd.index(in_opt) + 1], "rb") as src:
+                records[out_opt] = src.readlines()
+            with gzip.open(cmd[cmd.index(out_opt) + 1], "wb") as dst:
+                dst.writelines(records[out_opt])
+    reads = sum(len(lines) for lines in records.values()) // 4
+    _fake_outputs({"json": cmd[cmd.index("--json") + 1]}, reads=reads)
+    return {"wall_time": 1.0, "user_time": 1.0, "system_time": 0.5, "max_rss": 1024}
 
 
 class TestFastp(TestPluginBase):
@@ -35,47 +106,100 @@ class TestFastp(TestPluginBase):
             self.get_data_path("reads-paired"), mode="r"
         )
 
-    def test_find_empty_samples(self):
-        # make sample1 empty
-        os.truncate(os.path.join(self.reads_dir, "sample1_00_L001_R1_001.fastq.gz"), 0)
+    def test_count_reads(self):
+        self.assertEqual(
+            _count_reads(self.get_data_path("reports/set1/sample1.json")), 2555308
+        )
 
-        empty_samples = _find_empty_samples(
-            self.reads, ["sample1", "sample2", "sample3", "sample4"]
+    def test_count_reads_before_filtering(self):
+        self.assertEqual(
+            _count_reads(
+                self.get_data_path("reports/set1/sample1.json"), "before_filtering"
+            ),
+            3000004,
         )
-        self.assertEqual(empty_samples, ["sample1"])
 
-    def test_find_empty_samples_all(self):
-        # make all samples empty
-        ids = ["sample1", "sample2", "sample3", "sample4"]
-        for sample in ids:
-            os.truncate(
-                os.path.join(self.reads_dir, f"{sample}_00_L001_R1_001.fastq.gz"), 0
+    def test_count_reads_full_parse(self):
+        fp = os.path.join(self.temp_dir.name, "sample1.json")
+        with open(fp, "w") as f:
+            json.dump(
+                {"summary": {"after_filtering": {"total_bases": 0, "total_reads": 0}}},
+                f,
             )
+        self.assertEqual(_count_reads(fp), 0)
+
+    def test_find_empty_samples(self):
+        with self.assertWarnsRegex(UserWarning, "will be removed.*: sample1$"):
+            empty_samples = _find_empty_samples(
+                {"sample1": 0, "sample10": 5, "sample2": 3}
+            )
+        self.assertEqual(empty_samples, ["sample1"])
 
+    def test_find_empty_samples_all(self):
         with self.assertRaisesRegex(
             ValueError, "All samples are empty after processing with fastp"
         ):
-            _find_empty_samples(self.reads, ids)
+            _find_empty_samples({"sample1": 0, "sample2": 0})
 
-    def test_remove_samples(self):
-        empty_samples = ["sample1"]
-        _remove_samples(self.reads, empty_samples)
+    def _staged_outputs(self):
+        staging_dir = os.path.join(self.temp_dir.name, "staging")
+        os.makedirs(staging_dir)
+        outputs = {
+            "out1": os.path.join(staging_dir, "sample1_R1.fastq.gz"),
+            "out2": os.path.join(staging_dir, "sample1_R2.fastq.gz"),
+            "json": os.path.join(self.temp_dir.name, "sample1.json"),
+        }
+        destinations = {
+            "out1": os.path.join(self.temp_dir.name, "sample1_R1.fastq.gz"),
+            "out2": os.path.join(self.temp_dir.name, "sample1_R2.fastq.gz"),
+        }
+        return outputs, destinations
 
-        # check that sample1 files are removed
-        self.assertFalse(
-            os.path.exists(
-                os.path.join(self.reads_dir, "sample1_00_L001_R1_001.fastq.gz")
-            )
+    def test_finalize_sample_empty(self):
+        outputs, destinations = self._staged_outputs()
+        job = MagicMock(side_effect=lambda: _fake_outputs(outputs, reads=0))
+
+        obs = _finalize_sample(job, outputs, destinations)
+
+        self.assertDictEqual(
+            obs,
+            {
+                "source": "fastp",
+                "reads_before_filtering": 10,
+                "reads_after_filtering": 0,
+            },
         )
+        for role in ("out1", "out2"):
+            self.assertFalse(os.path.exists(outputs[role]))
+            self.assertFalse(os.path.exists(destinations[role]))
+        self.assertTrue(os.path.exists(outputs["json"]))
 
-        # check that sample2 files still exist
-        self.assertTrue(
-            os.path.exists(
-                os.path.join(self.reads_dir, "sample2_00_L001_R1_001.fastq.gz")
-            )
+    def test_finalize_sample(self):
+        outputs, destinations = self._staged_outputs()
+        job = MagicMock(side_effect=lambda: _fake_outputs(outputs, reads=7))
+
+        obs = _finalize_sample(job, outputs, destinations)
+
+        self.assertEqual(obs["reads_after_filtering"], 7)
+        for role in ("out1", "out2"):
+            self.assertFalse(os.path.exists(outputs[role]))
+            self.assertTrue(os.path.exists(destinations[role]))
+
+    def test_finalize_sample_reused_empty(self):
+        outputs, destinations = self._staged_outputs()
+        # only the report of an empty sample is kept by a previous run
+        job = MagicMock(
+            side_effect=lambda: _fake_outputs({"json": outputs["json"]}, reads=0)
         )
 
-    @patch("q2_fastp.fastp.run_command")
+        obs = _finalize_sample(job, outputs, destinations, keep_empty=True)
+
+        self.assertEqual(obs["reads_after_filtering"], 0)
+        for role in ("out1", "out2"):
+            with gzip.open(destinations[role], "rb") as f:
+                self.assertEqual(f.read(), b"")
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
     def test_run_fastp(self, mock_run_command):
 
         params = {
@@ -94,7 +218,7 @@ class TestFastp(TestPluginBase):
             "thread": 1,
         }
 
-        obs_seqs, obs_reports = _run_fastp(self.reads_paired, params)
+        obs_seqs, obs_reports, _ = _run_fastp(self.reads_paired, params)
 
         self.assertIsInstance(obs_seqs, CasavaOneEightSingleLanePerSampleDirFmt)
         self.assertIsInstance(obs_reports, FastpJsonDirectoryFormat)
@@ -108,11 +232,11 @@ class TestFastp(TestPluginBase):
                         self.reads_paired.path, f"{s}_00_L001_R1_001.fastq.gz"
                     ),
                     "--out1",
-                    os.path.join(obs_seqs.path, f"{s}_00_L001_R1_001.fastq.gz"),
+                    ANY,
                     "--json",
                     os.path.join(obs_reports.path, f"{s}.json"),
                     "--html",
-                    os.path.join(obs_reports.path, f"{s}.html"),
+                    os.devnull,
                     "--trim_front1",
                     "2",
                     "--trim_tail1",
@@ -136,41 +260,966 @@ class TestFastp(TestPluginBase):
                         self.reads_paired.path, f"{s}_00_L001_R2_001.fastq.gz"
                     ),
                     "--out2",
-                    os.path.join(obs_seqs.path, f"{s}_00_L001_R2_001.fastq.gz"),
+                    ANY,
                     "--trim_front2",
                     "3",
                     "--trim_tail2",
                     "3",
                     "--max_len2",
                     "0",
-                ]
+                ],
+                verbose=False,
+                resources=True,
+                stdout=ANY,
+                stderr=subprocess.STDOUT,
             )
             for s in ["sample1", "sample2"]
         ]
         mock_run_command.assert_has_calls(calls, any_order=True)
+        self.assertSetEqual(
+            {fp.name for fp in obs_seqs.path.iterdir()},
+            {
+                f"{s}_00_L001_R{r}_001.fastq.gz"
+                for s in ["sample1", "sample2"]
+                for r in (1, 2)
+            },
+        )
+        # reads are staged outside of the output directory
+        for c in mock_run_command.call_args_list:
+            cmd = c.args[0]
+            self.assertNotEqual(
+                os.path.dirname(cmd[cmd.index("--out1") + 1]), str(obs_seqs.path)
+            )
+
+    @patch("q2_fastp.fastp.run_command")
+    def test_run_fastp_empty_samples_not_written(self, mock_run_command):
+        mock_run_command.side_effect = lambda cmd, **kwargs: _fake_fastp(
+            cmd, reads=0 if "sample1" in cmd[2] else 10
+        )
+
+        obs_seqs, obs_reports, plan = _run_fastp(self.reads, {"thread": 1})
+
+        self.assertSetEqual(
+            {fp.name for fp in obs_seqs.path.iterdir()},
+            {f"sample{i}_00_L001_R1_001.fastq.gz" for i in (2, 3, 4)},
+        )
+        self.assertSetEqual(
+            {fp.name for fp in obs_reports.path.iterdir()},
+            {f"sample{i}.json" for i in (1, 2, 3, 4)} | {"run_plan.tsv", "timings.tsv"},
+        )
+        self.assertEqual(plan.loc["sample1", "reads_after_filtering"], 0)
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_run_fastp_keep_html(self, mock_run_command):
+        _, obs_reports, _ = _run_fastp(
+            self.reads, {"thread": 1, "keep_html_reports": True}
+        )
+        for c in mock_run_command.call_args_list:
+            cmd = c.args[0]
+            self.assertEqual(
+                os.path.dirname(cmd[cmd.index("--html") + 1]), str(obs_reports.path)
+            )
+            self.assertNotIn("--keep_html_reports", cmd)
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_run_fastp_prints_warning_once(self, mock_run_command):
+        with patch("builtins.print") as mock_print:
+            _run_fastp(self.reads, {"thread": 1})
+
+        printed = [" ".join(map(str, c.args)) for c in mock_print.call_args_list]
+        self.assertEqual(sum(EXTERNAL_CMD_WARNING in p for p in printed), 1)
+        self.assertIn("Processed 4/4 samples (100%)", "\n".join(printed))
+        for c in mock_run_command.call_args_list:
+            self.assertFalse(c.kwargs["verbose"])
+
+    @patch("q2_fastp.fastp.run_command")
+    def test_run_fastp_failure_shows_log(self, mock_run_command):
+        def _failing_fastp(cmd, stdout, **kwargs):
+            stdout.write("".join(f"line {i}\n" for i in range(30)))
+            stdout.write("ERROR: igzip: encountered while decompressing file\n")
+            stdout.flush()
+            raise subprocess.CalledProcessError(255, cmd)
+
+        mock_run_command.side_effect = _failing_fastp
+        with self.assertRaisesRegex(RuntimeError, "return code 255") as cm:
+            _run_fastp(self.reads, {"thread": 1})
+
+        self.assertIn("ERROR: igzip", str(cm.exception))
+        self.assertIn("line 29", str(cm.exception))
+        self.assertNotIn("line 10\n", str(cm.exception))
+        self.assertIn("fastp --in1", str(cm.exception))
+
+    def test_progress(self):
+        progress = _Progress(3, interval=3600)
+        with patch("builtins.print") as mock_print:
+            self.assertEqual(progress.run(lambda: 1), 1)
+            progress.update()
+            mock_print.assert_not_called()
+            progress.update()
+
+        mock_print.assert_called_once()
+        self.assertIn("Processed 3/3 samples (100%)", mock_print.call_args.args[0])
+
+    def test_split_core_budget(self):
+        self.assertEqual(_split_core_budget(8, 1, 10), (1, 8))
+        self.assertEqual(_split_core_budget(8, 4, 10), (4, 2))
+        self.assertEqual(_split_core_budget(8, 3, 10), (3, 2))
+
+    def test_split_core_budget_more_jobs_than_samples(self):
+        self.assertEqual(_split_core_budget(8, 4, 2), (2, 4))
+
+    def test_split_core_budget_more_jobs_than_threads(self):
+        self.assertEqual(_split_core_budget(2, 4, 10), (4, 1))
+
+    def test_run_jobs_parallel(self):
+        jobs = [partial(lambda i: i * 2, i) for i in range(5)]
+        obs = _run_jobs(jobs, [1] * 5, 3, 3)
+        self.assertListEqual(obs, [0, 2, 4, 6, 8])
+
+    def test_run_jobs_parallel_error(self):
+        def _run(cmd):
+            if cmd[-1] in ("sample1", "sample3"):
+                raise subprocess.CalledProcessError(1, cmd)
+
+        cmds = [["fastp", "--in1", f"sample{i}"] for i in range(5)]
+        jobs = [partial(_run, cmd) for cmd in cmds]
+
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            _run_jobs(jobs, [1] * 5, 2, 2)
+        self.assertEqual(cm.exception.cmd, cmds[1])
+
+    def _make_manifest(self, sizes):
+        manifest = pd.DataFrame(
+            {"forward": [f"{s}.fastq.gz" for s in sizes], "reverse": None},
+            index=pd.Index(list(sizes), name="sample-id"),
+        )
+        return manifest
+
+    @patch("os.path.getsize")
+    def test_plan_fastp_runs_even(self, mock_getsize):
+        mock_getsize.return_value = 100
+        manifest = self._make_manifest({"s1": 100, "s2": 100, "s3": 100})
+
+        obs = _plan_fastp_runs(manifest, 8, 4)
+
+        self.assertListEqual(obs.index.tolist(), ["s1", "s2", "s3"])
+        self.assertListEqual(obs["launch_order"].tolist(), [1, 2, 3])
+        self.assertListEqual(obs["threads"].tolist(), [2, 2, 2])
+        self.assertListEqual(obs["input_size"].tolist(), [100, 100, 100])
+
+    @patch("os.path.getsize")
+    def test_plan_fastp_runs_skewed(self, mock_getsize):
+        sizes = {"small1": 10, "huge": 5000, "small2": 10, "medium": 20}
+        mock_getsize.side_effect = lambda fp: sizes[fp.split(".")[0]]
+        manifest = self._make_manifest(sizes)
+
+        obs = _plan_fastp_runs(manifest, 16, 8)
+
+        self.assertListEqual(obs.index.tolist(), ["huge", "medium", "small1", "small2"])
+        self.assertDictEqual(
+            obs["threads"].to_dict(),
+            {"huge": 16, "medium": 5, "small1": 3, "small2": 3},
+        )
+
+    @patch("os.path.getsize")
+    def test_plan_fastp_runs_single_job(self, mock_getsize):
+        sizes = {"small1": 10, "huge": 5000, "small2": 10, "medium": 20}
+        mock_getsize.side_effect = lambda fp: sizes[fp.split(".")[0]]
+        manifest = self._make_manifest(sizes)
+
+        obs = _plan_fastp_runs(manifest, 8, 1)
+
+        self.assertListEqual(obs.index.tolist(), ["huge", "medium", "small1", "small2"])
+        self.assertListEqual(obs["threads"].tolist(), [8, 8, 8, 8])
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_run_fastp_concurrent(self, mock_run_command):
+        params = {"thread": 8, "n_jobs": 4}
+
+        _, obs_reports, _ = _run_fastp(self.reads, params)
+
+        self.assertEqual(mock_run_command.call_count, 4)
+        for c in mock_run_command.call_args_list:
+            cmd = c.args[0]
+            self.assertEqual(cmd[cmd.index("--thread") + 1], "2")
+            self.assertNotIn("--n_jobs", cmd)
+
+        plan = pd.read_csv(
+            os.path.join(obs_reports.path, "run_plan.tsv"), sep="\t", index_col=0
+        )
+        self.assertSetEqual(
+            set(plan.index), {"sample1", "sample2", "sample3", "sample4"}
+        )
+        self.assertListEqual(plan["threads"].tolist(), [2, 2, 2, 2])
+
+    @patch("q2_fastp.fastp.get_fastp_version", return_value="0.23.4")
+    @patch("q2_fastp.fastp.run_command")
+    def test_run_fastp_cached(self, mock_run_command, mock_version):
+        mock_run_command.side_effect = _fake_fastp
+        params = {
+            "thread": 2,
+            "n_jobs": 2,
+            "cache_dir": os.path.join(self.temp_dir.name, "cache"),
+        }
+
+        _run_fastp(self.reads, params)
+        self.assertEqual(mock_run_command.call_count, 4)
+
+        obs_seqs, obs_reports, _ = _run_fastp(self.reads, params)
+        self.assertEqual(mock_run_command.call_count, 4)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(obs_seqs.path, "sample1_00_L001_R1_001.fastq.gz")
+            )
+        )
+        self.assertTrue(os.path.exists(os.path.join(obs_reports.path, "sample1.json")))
+        plan = pd.read_csv(
+            os.path.join(obs_reports.path, "run_plan.tsv"), sep="\t", index_col=0
+        )
+        self.assertTrue((plan["source"] == "cache").all())
+
+    @patch("q2_fastp.fastp.get_fastp_version", return_value="0.23.4")
+    @patch("q2_fastp.fastp.run_command")
+    def test_run_fastp_incremental(self, mock_run_command, mock_version):
+        # sample3 is empty after processing
+        mock_run_command.side_effect = lambda cmd, **kwargs: _fake_fastp(
+            cmd, reads=0 if "sample3" in cmd[2] else 10
+        )
+        params = {"thread": 1, "length_required": 15}
+        prev_seqs, prev_reports, _ = _run_fastp(self.reads, params)
+        self.assertEqual(mock_run_command.call_count, 4)
+
+        # change the input of sample2
+        with open(
+            os.path.join(self.reads_dir, "sample2_00_L001_R1_001.fastq.gz"), "ab"
+        ) as f:
+            f.write(b"more reads")
+        mock_run_command.reset_mock()
+
+        obs_seqs, obs_reports, plan = _run_fastp(
+            self.reads,
+            params,
+            previous_sequences=prev_seqs,
+            previous_reports=prev_reports,
+        )
+
+        mock_run_command.assert_called_once()
+        self.assertIn(
+            os.path.join(self.reads_dir, "sample2_00_L001_R1_001.fastq.gz"),
+            mock_run_command.call_args.args[0],
+        )
+        self.assertEqual(plan.loc["sample3", "reads_after_filtering"], 0)
+        self.assertDictEqual(
+            plan["source"].to_dict(),
+            {
+                "sample1": "previous",
+                "sample2": "fastp",
+                "sample3": "previous",
+                "sample4": "previous",
+            },
+        )
+        self.assertSetEqual(
+            {fp.name for fp in obs_seqs.path.iterdir()},
+            {f"sample{i}_00_L001_R1_001.fastq.gz" for i in (1, 2, 4)},
+        )
+        self.assertSetEqual(
+            {fp.name for fp in obs_reports.path.iterdir()},
+            {f"sample{i}.json" for i in (1, 2, 3, 4)} | {"run_plan.tsv", "timings.tsv"},
+        )
+
+    def test_find_reusable_samples(self):
+        prev_reports_dir = os.path.join(self.temp_dir.name, "prev-reports")
+        shutil.copytree(self.get_data_path("reports/set1"), prev_reports_dir)
+        plan = pd.DataFrame(
+            {"input_fingerprint": ["abc", "abc"], "params_hash": ["def", "def"]},
+            index=pd.Index(["sample1", "sample2"], name="sample-id"),
+        )
+        plan.to_csv(os.path.join(prev_reports_dir, "run_plan.tsv"), sep="\t")
+        prev_reports = FastpJsonDirectoryFormat(prev_reports_dir, "r")
+        plan.loc["sample2", "params_hash"] = "xyz"
+
+        obs = _find_reusable_samples(plan, self.reads, prev_reports, "0.23.4")
+
+        self.assertDictEqual(
+            obs,
+            {
+                "sample1": {
+                    "json": os.path.join(prev_reports_dir, "sample1.json"),
+                    "out1": os.path.join(
+                        self.reads_dir, "sample1_00_L001_R1_001.fastq.gz"
+                    ),
+                }
+            },
+        )
+        self.assertDictEqual(
+            _find_reusable_samples(plan, self.reads, prev_reports, "0.24.0"), {}
+        )
+
+    def test_tabulate_timings(self):
+        records = pd.DataFrame(
+            {
+                "source": ["fastp", "cache", "fastp"],
+                "reads_after_filtering": [5, 5, 5],
+                "wall_time": [2.0, None, 4.0],
+                "user_time": [1.0, None, 3.0],
+                "system_time": [0.5, None, 0.5],
+                "max_rss": [1024, None, 2048],
+                "bytes_read": [4e6, None, 2e6],
+                "bytes_written": [1e6, None, 1e6],
+                "reads_before_filtering": [1000, 10, 2000],
+            },
+            index=pd.Index(["s1", "s2", "s3"], name="sample-id"),
+        )
+
+        obs = _tabulate_timings(records)
+
+        self.assertListEqual(obs.index.tolist(), ["s1", "s3"])
+        self.assertListEqual(obs["reads_per_second"].tolist(), [500.0, 500.0])
+        self.assertListEqual(obs["mb_per_second"].tolist(), [2.0, 0.5])
+        self.assertIn(
+            "Processed 2 sample(s) with fastp in 5.0 s: 5.0 s of CPU time",
+            _summarize_timings(obs, 5.0),
+        )
+        self.assertIn("Slowest sample: s3 (4.0 s)", _summarize_timings(obs, 5.0))
+
+    def test_summarize_timings_empty(self):
+        self.assertIn(
+            "No samples were processed by fastp",
+            _summarize_timings(pd.DataFrame(columns=["wall_time"]), 1.0),
+        )
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_run_fastp_timings(self, mock_run_command):
+        _, obs_reports, _ = _run_fastp(self.reads, {"thread": 1})
+
+        timings = pd.read_csv(
+            os.path.join(obs_reports.path, "timings.tsv"), sep="\t", index_col=0
+        )
+        self.assertSetEqual(
+            set(timings.index), {"sample1", "sample2", "sample3", "sample4"}
+        )
+        self.assertTrue((timings["wall_time"] == 2.0).all())
+        self.assertTrue((timings["reads_per_second"] == 15.0).all())
+        self.assertTrue((timings["bytes_read"] > 0).all())
+
+    def test_manifest_from_plan(self):
+        plan = pd.DataFrame(
+            {
+                "reads_after_filtering": [10, 0, 5],
+                "forward": ["s1_R1.fastq.gz", None, "s3_R1.fastq.gz"],
+                "reverse": ["s1_R2.fastq.gz", None, "s3_R2.fastq.gz"],
+            },
+            index=pd.Index(["s1", "s2", "s3"], name="sample-id"),
+        )
+
+        obs = _manifest_from_plan(plan, "/data")
+
+        exp = pd.DataFrame(
+            {
+                "forward": ["/data/s1_R1.fastq.gz", "/data/s3_R1.fastq.gz"],
+                "reverse": ["/data/s1_R2.fastq.gz", "/data/s3_R2.fastq.gz"],
+            },
+            index=pd.Index(["s1", "s3"], name="sample-id"),
+            dtype=object,
+        )
+        pd.testing.assert_frame_equal(obs, exp)
+
+    def test_manifest_from_plan_single_end(self):
+        plan = pd.DataFrame(
+            {
+                "reads_after_filtering": [10],
+                "forward": ["s1_R1.fastq.gz"],
+                "reverse": [float("nan")],
+            },
+            index=pd.Index(["s1"], name="sample-id"),
+        )
+
+        obs = _manifest_from_plan(plan, "/data")
+
+        self.assertEqual(obs.loc["s1", "forward"], "/data/s1_R1.fastq.gz")
+        self.assertIsNone(obs.loc["s1", "reverse"])
+
+    def test_find_reusable_samples_manifest_from_plan(self):
+        prev_reports_dir = os.path.join(self.temp_dir.name, "prev-reports")
+        shutil.copytree(self.get_data_path("reports/set1"), prev_reports_dir)
+        plan = pd.DataFrame(
+            {
+                "input_fingerprint": ["abc"],
+                "params_hash": ["def"],
+                "reads_after_filtering": [10],
+                "forward": ["sample1_00_L001_R1_001.fastq.gz"],
+                "reverse": [None],
+            },
+            index=pd.Index(["sample1"], name="sample-id"),
+        )
+        plan.to_csv(os.path.join(prev_reports_dir, "run_plan.tsv"), sep="\t")
+        prev_reports = FastpJsonDirectoryFormat(prev_reports_dir, "r")
+        prev_seqs = MagicMock(path="/prev")
+        manifest = PropertyMock()
+        type(prev_seqs).manifest = manifest
+
+        obs = _find_reusable_samples(plan, prev_seqs, prev_reports, "0.23.4")
+
+        manifest.assert_not_called()
+        self.assertDictEqual(
+            obs,
+            {
+                "sample1": {
+                    "json": os.path.join(prev_reports_dir, "sample1.json"),
+                    "out1": "/prev/sample1_00_L001_R1_001.fastq.gz",
+                }
+            },
+        )
+
+    def test_find_reusable_samples_numeric_ids(self):
+        prev_reports_dir = os.path.join(self.temp_dir.name, "prev-reports")
+        os.makedirs(prev_reports_dir)
+        shutil.copy(
+            self.get_data_path("reports/set1/sample1.json"),
+            os.path.join(prev_reports_dir, "01.json"),
+        )
+        plan = pd.DataFrame(
+            {
+                "input_fingerprint": ["abc"],
+                "params_hash": ["def"],
+                "reads_after_filtering": [10],
+                "forward": ["01_00_L001_R1_001.fastq.gz"],
+                "reverse": [None],
+            },
+            index=pd.Index(["01"], name="sample-id"),
+        )
+        plan.to_csv(os.path.join(prev_reports_dir, "run_plan.tsv"), sep="\t")
+        prev_reports = FastpJsonDirectoryFormat(prev_reports_dir, "r")
+
+        obs = _find_reusable_samples(
+            plan, MagicMock(path="/prev"), prev_reports, "0.23.4"
+        )
+
+        self.assertDictEqual(
+            obs,
+            {
+                "01": {
+                    "json": os.path.join(prev_reports_dir, "01.json"),
+                    "out1": "/prev/01_00_L001_R1_001.fastq.gz",
+                }
+            },
+        )
+
+    def test_find_reusable_samples_without_plan(self):
+        prev_reports = FastpJsonDirectoryFormat(self.get_data_path("reports/set1"), "r")
+        plan = pd.DataFrame(
+            {"input_fingerprint": ["abc"], "params_hash": ["def"]},
+            index=pd.Index(["sample1"], name="sample-id"),
+        )
+        with self.assertWarnsRegex(UserWarning, "do not contain a run plan"):
+            obs = _find_reusable_samples(plan, self.reads, prev_reports, "0.23.4")
+        self.assertDictEqual(obs, {})
+
+    def test_process_seqs_incomplete_previous(self):
+        with self.assertRaisesRegex(ValueError, "Both the previously processed"):
+            process_seqs(self.reads, previous_sequences=self.reads)
 
     @patch("q2_fastp.fastp._run_fastp")
     @patch("q2_fastp.fastp._find_empty_samples")
-    @patch("q2_fastp.fastp._remove_samples")
-    def test_process_seqs(self, mock_remove, mock_find_empty, mock_run):
+    def test_process_seqs(self, mock_find_empty, mock_run):
         mock_output_seqs = MagicMock()
         mock_json_reports = MagicMock()
+        plan = pd.DataFrame(
+            {"source": ["fastp", "fastp"], "reads_after_filtering": [5, 0]},
+            index=pd.Index(["sample1", "sample2"], name="sample-id"),
+        )
 
-        mock_run.return_value = (mock_output_seqs, mock_json_reports)
-        mock_find_empty.return_value = []
-        mock_remove.return_value = mock_output_seqs
+        mock_run.return_value = (mock_output_seqs, mock_json_reports, plan)
+        mock_find_empty.return_value = ["sample2"]
 
         output_sequences, json_reports = process_seqs(self.reads_paired)
 
-        mock_run.assert_called_once_with(self.reads_paired, ANY)
-        mock_find_empty.assert_called_once_with(
-            mock_output_seqs, ["sample1", "sample2"]
+        mock_run.assert_called_once_with(
+            self.reads_paired,
+            ANY,
+            previous_sequences=None,
+            previous_reports=None,
         )
-        mock_remove.assert_called_once_with(mock_output_seqs, [])
+        mock_find_empty.assert_called_once_with({"sample1": 5, "sample2": 0})
 
         self.assertIs(output_sequences, mock_output_seqs)
         self.assertIs(json_reports, mock_json_reports)
 
+    @patch("q2_fastp.fastp._find_empty_samples")
+    @patch("q2_fastp.fastp.run_command")
+    def test_process_seqs_keep_empty_samples(self, mock_run_command, mock_find_empty):
+        mock_run_command.side_effect = lambda cmd, **kwargs: _fake_fastp(
+            cmd, reads=0 if "sample2" in cmd[2] else 10
+        )
+        obs_seqs, _ = process_seqs(self.reads, keep_empty_samples=True)
+
+        mock_find_empty.assert_not_called()
+        self.assertIn(
+            "sample2_00_L001_R1_001.fastq.gz",
+            {fp.name for fp in obs_seqs.path.iterdir()},
+        )
+
+    def _compress(self, name, data, write=True, **kwargs):
+        pipe = os.path.join(self.temp_dir.name, "reads.fastq")
+        output_fp = os.path.join(self.temp_dir.name, "reads.fastq.gz")
+        compressor = _OutputCompressor(name, {pipe: output_fp}, 6, 2)
+        with open(os.devnull, "w") as log, patch.object(
+            _OutputCompressor, "command", **kwargs
+        ):
+            with compressor.running(log):
+                if write:
+                    with open(pipe, "wb") as f:
+                        f.write(data)
+        self.assertFalse(os.path.exists(pipe))
+        return output_fp
+
+    def test_output_compressor_none(self):
+        output_fp = self._compress("none", b"@r1\nACGT\n+\nIIII\n" * 1000)
+
+        with gzip.open(output_fp, "rb") as f:
+            self.assertEqual(f.read(), b"@r1\nACGT\n+\nIIII\n" * 1000)
+        # the blocks are stored rather than compressed
+        self.assertGreater(os.path.getsize(output_fp), 16 * 1000)
+
+    def test_output_compressor_external(self):
+        output_fp = self._compress(
+            "pigz", b"@r1\nACGT\n+\nIIII\n" * 1000, return_value=["gzip", "-c"]
+        )
+
+        with gzip.open(output_fp, "rb") as f:
+            self.assertEqual(f.read(), b"@r1\nACGT\n+\nIIII\n" * 1000)
+        self.assertLess(os.path.getsize(output_fp), 16 * 1000)
+
+    def test_output_compressor_pipe_never_opened(self):
+        output_fp = self._compress("none", b"", write=False)
+
+        with gzip.open(output_fp, "rb") as f:
+            self.assertEqual(f.read(), b"")
+
+    def test_output_compressor_fails(self):
+        with self.assertRaisesRegex(RuntimeError, "pigz failed with return code 1"):
+            self._compress("pigz", b"reads" * 100000, return_value=["false"])
+
+    def test_output_compressor_none_fails(self):
+        with patch("gzip.open", side_effect=OSError("No space left on device")):
+            with self.assertRaisesRegex(RuntimeError, "failed: No space left"):
+                self._compress("none", b"reads" * 100000)
+
+    def test_split_compression_threads(self):
+        self.assertEqual(_split_compression_threads(8, 2, "pigz"), (4, 2))
+        self.assertEqual(_split_compression_threads(8, 1, "bgzip"), (4, 4))
+        self.assertEqual(_split_compression_threads(1, 2, "pigz"), (1, 1))
+        self.assertEqual(_split_compression_threads(8, 2, "none"), (8, 1))
+
+    def test_output_compressor_command(self):
+        compressor = _OutputCompressor("bgzip", {}, 12, 4)
+        self.assertListEqual(
+            compressor.command(), ["bgzip", "-c", "-l", "9", "-@", "4"]
+        )
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_process_seqs_output_compressor(self, mock_run_command):
+        obs_seqs, obs_reports = process_seqs(self.reads, output_compressor="none")
+
+        cmd = mock_run_command.call_args.args[0]
+        self.assertTrue(cmd[cmd.index("--out1") + 1].endswith(".fastq"))
+        with gzip.open(obs_seqs.path / "sample1_00_L001_R1_001.fastq.gz", "rb") as f:
+            self.assertEqual(f.read(), b"reads")
+
+        plan = pd.read_csv(obs_reports.path / "run_plan.tsv", sep="\t", index_col=0)
+        _, default_reports = process_seqs(self.reads)
+        default_plan = pd.read_csv(
+            default_reports.path / "run_plan.tsv", sep="\t", index_col=0
+        )
+        # changing the compressor invalidates the results of previous runs
+        self.assertTrue((plan["params_hash"] != default_plan["params_hash"]).all())
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_process_seqs_stage_to_scratch(self, mock_run_command):
+        scratch_dir = os.path.join(self.temp_dir.name, "scratch")
+        os.makedirs(scratch_dir)
+
+        obs_seqs, _ = process_seqs(
+            self.reads, stage_to_scratch=True, scratch_dir=scratch_dir, n_jobs=2
+        )
+
+        for c in mock_run_command.call_args_list:
+            cmd = c.args[0]
+            for opt in ("--in1", "--out1"):
+                self.assertTrue(cmd[cmd.index(opt) + 1].startswith(scratch_dir))
+        self.assertSetEqual(
+            {fp.name for fp in obs_seqs.path.iterdir()},
+            {f"sample{i}_00_L001_R1_001.fastq.gz" for i in range(1, 5)},
+        )
+        # nothing is left behind on the scratch storage
+        self.assertListEqual(os.listdir(scratch_dir), [])
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_process_seqs_stage_to_scratch_fails_after_fastp(self, mock_run_command):
+        scratch_dir = os.path.join(self.temp_dir.name, "scratch")
+        os.makedirs(scratch_dir)
+        stagers = []
+
+        class _RecordingStager(ScratchStager):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                stagers.append(self)
+
+        def _fail_on_sample2(json_fp, *args):
+            if "sample2" in json_fp:
+                raise ValueError("The report is truncated.")
+            return _count_reads(json_fp, *args)
+
+        with patch("q2_fastp.fastp.ScratchStager", _RecordingStager), patch(
+            "q2_fastp.fastp._count_reads", side_effect=_fail_on_sample2
+        ), self.assertWarnsRegex(UserWarning, "left out of the output.*sample2"):
+            obs_seqs, _ = process_seqs(
+                self.reads,
+                stage_to_scratch=True,
+                scratch_dir=scratch_dir,
+                on_sample_failure="skip",
+            )
+
+        # fastp succeeded, so only counting the reads failed
+        self.assertEqual(mock_run_command.call_count, 4)
+        self.assertEqual(len(list(obs_seqs.path.glob("*.fastq.gz"))), 3)
+        self.assertEqual(stagers[0].used, 0)
+        self.assertSetEqual(stagers[0].unmoved, set())
+
+    @patch("q2_fastp.fastp.get_fastp_version", return_value="0.23.4")
+    def test_process_seqs_resume_from_work_dir(self, mock_version):
+        work_dir = os.path.join(self.temp_dir.name, "work")
+
+        def _fail_on_sample3(cmd, **kwargs):
+            if "sample3" in cmd[2]:
+                raise subprocess.CalledProcessError(1, cmd)
+            return _fake_fastp(cmd, **kwargs)
+
+        with patch("q2_fastp.fastp.run_command", side_effect=_fail_on_sample3):
+            with self.assertRaisesRegex(RuntimeError, "fastp failed"):
+                process_seqs(self.reads, work_dir=work_dir)
+
+        with patch(
+            "q2_fastp.fastp.run_command", side_effect=_fake_fastp
+        ) as mock_run_command:
+            obs_seqs, obs_reports = process_seqs(self.reads, work_dir=work_dir)
+
+        # only the samples which did not finish before are processed again
+        processed = {c.args[0][2] for c in mock_run_command.call_args_list}
+        self.assertIn(self.reads.manifest.loc["sample3", "forward"], processed)
+        self.assertLess(len(processed), 4)
+        plan = pd.read_csv(obs_reports.path / "run_plan.tsv", sep="\t", index_col=0)
+        self.assertEqual(plan.loc["sample3", "source"], "fastp")
+        self.assertIn("checkpoint", plan["source"].tolist())
+        self.assertEqual(len(list(obs_seqs.path.glob("*.fastq.gz"))), 4)
+
+    def test_process_seqs_skip_failed_samples(self):
+        def _fail_on_sample3(cmd, **kwargs):
+            if "sample3" in cmd[2]:
+                raise subprocess.CalledProcessError(1, cmd)
+            return _fake_fastp(cmd, **kwargs)
+
+        with patch("q2_fastp.fastp.run_command", side_effect=_fail_on_sample3):
+            with self.assertWarnsRegex(UserWarning, "left out of the output.*sample3"):
+                obs_seqs, obs_reports = process_seqs(
+                    self.reads, on_sample_failure="skip"
+                )
+
+        self.assertSetEqual(
+            {fp.name for fp in obs_seqs.path.glob("*.fastq.gz")},
+            {f"sample{i}_00_L001_R1_001.fastq.gz" for i in (1, 2, 4)},
+        )
+        plan = pd.read_csv(obs_reports.path / "run_plan.tsv", sep="\t", index_col=0)
+        self.assertEqual(plan.loc["sample3", "source"], "failed")
+
+    def test_run_fastp_plan_lists_written_outputs(self):
+        def _fail_on_sample3(cmd, **kwargs):
+            if "sample3" in cmd[2]:
+                raise subprocess.CalledProcessError(1, cmd)
+            return _fake_fastp(cmd, **kwargs)
+
+        params = {"on_sample_failure": "skip", "keep_empty_samples": True}
+        with patch("q2_fastp.fastp.run_command", side_effect=_fail_on_sample3):
+            with self.assertWarnsRegex(UserWarning, "left out of the output"):
+                _, _, plan = _run_fastp(self.reads, params)
+
+        self.assertIsNone(plan.loc["sample3", "forward"])
+        self.assertEqual(
+            plan.loc["sample1", "forward"], "sample1_00_L001_R1_001.fastq.gz"
+        )
+
+    @patch(
+        "q2_fastp.fastp.run_command",
+        side_effect=subprocess.CalledProcessError(1, "fastp"),
+    )
+    def test_process_seqs_skip_failed_samples_all_failed(self, mock_run_command):
+        with self.assertRaisesRegex(RuntimeError, "failed for all samples"):
+            process_seqs(self.reads, on_sample_failure="skip")
+
+    def _multi_lane_reads(self):
+        path = os.path.join(self.temp_dir.name, "lanes")
+        os.makedirs(path)
+        for lane in (1, 2):
+            for direction in (1, 2):
+                fp = os.path.join(
+                    path, f"sample_a_S1_L00{lane}_R{direction}_001.fastq.gz"
+                )
+                with gzip.open(fp, "wt") as f:
+                    f.write(f"@lane{lane}\nACGT\n+\nIIII\n")
+        shutil.copy(
+            self.get_data_path("reads/sample1_00_L001_R1_001.fastq.gz"),
+            os.path.join(path, "sample1_00_L001_R1_001.fastq.gz"),
+        )
+        return CasavaOneEightSingleLanePerSampleDirFmt(path, mode="r")
+
+    def test_lane_manifest(self):
+        obs = _lane_manifest(self._multi_lane_reads())
+
+        self.assertListEqual(obs.index.tolist(), ["sample1", "sample_a"])
+        self.assertListEqual(
+            [os.path.basename(fp) for fp in obs.loc["sample_a", "reverse"]],
+            ["sample_a_S1_L001_R2_001.fastq.gz", "sample_a_S1_L002_R2_001.fastq.gz"],
+        )
+        self.assertEqual(len(obs.loc["sample1", "forward"]), 1)
+        self.assertIsNone(obs.loc["sample1", "reverse"])
+
+    @patch("os.path.getsize")
+    def test_plan_fastp_runs_shards(self, mock_getsize):
+        sizes = {"small1": 10, "huge": 5000, "small2": 10, "medium": 20}
+        mock_getsize.side_effect = lambda fp: sizes[fp.split(".")[0]]
+        manifest = self._make_manifest(sizes)
+
+        obs = _plan_fastp_runs(manifest, 32, 8, shard_size=1000)
+
+        self.assertDictEqual(
+            obs["shards"].to_dict(), {"huge": 5, "medium": 1, "small1": 1, "small2": 1}
+        )
+        self.assertDictEqual(
+            obs["threads"].to_dict(),
+            {"huge": 32, "medium": 11, "small1": 5, "small2": 5},
+        )
+
+    def test_shard_cmd(self):
+        cmd = [
+            "fastp", "--in1", "/in/s_R1.fastq.gz", "--out1", "/out/s_R1.fastq.gz",
+            "--json", "/out/s.json", "--html", "/out/s.html", "--thread", "8",
+            "--in2", "/in/s_R2.fastq.gz", "--out2", "/out/s_R2.fastq.gz",
+        ]  # fmt: skip
+
+        obs_cmd, obs_outputs = _shard_cmd(cmd, 1, 3, "/shards")
+
+        self.assertListEqual(
+            obs_cmd,
+            [
+                "fastp", "--in1", "/shards/in1-1.fastq",
+                "--out1", "/out/shard1-s_R1.fastq.gz",
+                "--json", "/out/shard1-s.json", "--html", os.devnull,
+                "--thread", "2", "--in2", "/shards/in2-1.fastq",
+                "--out2", "/out/shard1-s_R2.fastq.gz", "--dont_eval_duplication",
+            ],
+        )  # fmt: skip
+        self.assertDictEqual(
+            obs_outputs,
+            {
+                "--out1": "/out/shard1-s_R1.fastq.gz",
+                "--out2": "/out/shard1-s_R2.fastq.gz",
+                "--json": "/out/shard1-s.json",
+            },
+        )
+
+    @patch("q2_fastp.fastp.SHARD_BATCH_READS", 7)
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_shard_fastp)
+    def test_process_seqs_shards(self, mock_run_command):
+        obs_seqs, obs_reports = process_seqs(
+            self.reads_paired, thread=3, shard_size=1e-9
+        )
+
+        # a process per shard, besides gzip and awk splitting every file
+        fastp_calls = [
+            args for args, _ in mock_run_command.call_args_list if args[0][0] == "fastp"
+        ]
+        self.assertEqual(len(fastp_calls), 6)
+        self.assertEqual(mock_run_command.call_count, 6 + 2 * 4)
+        plan = pd.read_csv(obs_reports.path / "run_plan.tsv", sep="\t", index_col=0)
+        self.assertListEqual(plan["shards"].tolist(), [3, 3])
+        for sample_id in ("sample1", "sample2"):
+            reads = {}
+            for direction in (1, 2):
+                fn = f"{sample_id}_00_L001_R{direction}_001.fastq.gz"
+                with gzip.open(self.get_data_path(f"reads-paired/{fn}"), "rt") as f:
+                    exp = f.readlines()
+                with gzip.open(obs_seqs.path / fn, "rt") as f:
+                    reads[direction] = f.readlines()
+                self.assertCountEqual(reads[direction][0::4], exp[0::4])
+            # pairs are kept together
+            self.assertListEqual(
+                [name.split("/")[0] for name in reads[1][0::4]],
+                [name.split("/")[0] for name in reads[2][0::4]],
+            )
+            with open(obs_reports.path / f"{sample_id}.json") as f:
+                report = json.load(f)
+            self.assertEqual(report["summary"]["after_filtering"]["total_reads"], 200)
+        self.assertFalse(list(obs_seqs.path.glob("shard*")))
+
+    @patch("q2_fastp.fastp.SHARD_BATCH_READS", 7)
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_shard_fastp)
+    def test_process_seqs_shards_more_reverse_reads(self, mock_run_command):
+        reads_dir = os.path.join(self.temp_dir.name, "reads-paired")
+        shutil.copytree(self.get_data_path("reads-paired"), reads_dir)
+        fp = os.path.join(reads_dir, "sample1_00_L001_R2_001.fastq.gz")
+        with gzip.open(fp, "ab") as f:
+            f.write(b"@extra/2\nACGT\n+\nIIII\n")
+        reads = CasavaOneEightSingleLanePerSampleDirFmt(reads_dir, mode="r")
+
+        with self.assertRaisesRegex(ValueError, r"differ in number \(100 and 101\)"):
+            process_seqs(reads, thread=3, shard_size=1e-9)
+
+    @patch("q2_fastp.fastp.SHARD_BATCH_READS", 7)
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_shard_fastp)
+    def test_process_seqs_shards_incomplete_read(self, mock_run_command):
+        reads_dir = os.path.join(self.temp_dir.name, "reads-paired")
+        shutil.copytree(self.get_data_path("reads-paired"), reads_dir)
+        fp = os.path.join(reads_dir, "sample1_00_L001_R1_001.fastq.gz")
+        with gzip.open(fp, "ab") as f:
+            f.write(b"@extra/1\nACGT\n")
+        reads = CasavaOneEightSingleLanePerSampleDirFmt(reads_dir, mode="r")
+
+        with self.assertRaisesRegex(RuntimeError, "awk failed(.|\n)*incomplete read"):
+            process_seqs(reads, thread=3, shard_size=1e-9)
+
+    def test_process_seqs_shards_dedup(self):
+        with self.assertRaisesRegex(ValueError, "cannot be deduplicated"):
+            process_seqs(self.reads_paired, thread=2, shard_size=1e-9, dedup=True)
+
+    def test_process_seqs_multiple_lanes(self):
+        def _evaluating_fastp(cmd, **kwargs):
+            # like fastp, read the inputs twice - first to evaluate the reads
+            for in_opt, out_opt in (("--in1", "--out1"), ("--in2", "--out2")):
+                if in_opt in cmd:
+                    with gzip.open(cmd[cmd.index(in_opt) + 1], "rb") as src:
+                        src.readline()
+                    with gzip.open(cmd[cmd.index(in_opt) + 1], "rb") as src:
+                        data = src.read()
+                    with gzip.open(cmd[cmd.index(out_opt) + 1], "wb") as dst:
+                        dst.write(data)
+            _fake_outputs({"json": cmd[cmd.index("--json") + 1]})
+            return {"wall_time": 1.0, "user_time": 1.0, "system_time": 0.0}
+
+        with patch("q2_fastp.fastp.run_command", side_effect=_evaluating_fastp):
+            obs_seqs, obs_reports = process_seqs(self._multi_lane_reads())
+
+        self.assertSetEqual(
+            {fp.name for fp in obs_seqs.path.glob("*.fastq.gz")},
+            {
+                "sample1_00_L001_R1_001.fastq.gz",
+                "sample_a_S1_L001_R1_001.fastq.gz",
+                "sample_a_S1_L001_R2_001.fastq.gz",
+            },
+        )
+        with gzip.open(obs_seqs.path / "sample_a_S1_L001_R2_001.fastq.gz", "rt") as f:
+            self.assertEqual(f.read(), "@lane1\nACGT\n+\nIIII\n@lane2\nACGT\n+\nIIII\n")
+        self.assertSetEqual(
+            {fp.name for fp in obs_reports.path.glob("*.json")},
+            {"sample1.json", "sample_a.json"},
+        )
+
+    @patch("shutil.which", return_value=None)
+    def test_process_seqs_output_compressor_missing(self, mock_which):
+        with self.assertRaisesRegex(ValueError, "compressor pigz was not found"):
+            process_seqs(self.reads, output_compressor="pigz")
+
+    def _processed_seqs(self, name, samples):
+        path = os.path.join(self.temp_dir.name, name)
+        os.makedirs(path)
+        for sample_id, n_reads in samples.items():
+            for direction in (1, 2):
+                fp = os.path.join(
+                    path, f"{sample_id}_00_L001_R{direction}_001.fastq.gz"
+                )
+                with gzip.open(fp, "wt") as f:
+                    for i in range(n_reads):
+                        f.write(f"@{name}-{i}\nACGT\n+\nIIII\n")
+        return CasavaOneEightSingleLanePerSampleDirFmt(path, mode="r")
+
+    def test_collate_processed_sequences(self):
+        sequences = [
+            self._processed_seqs("part1", {"sample1": 2, "sample2": 0}),
+            self._processed_seqs("part2", {"sample3": 1}),
+        ]
+        with self.assertWarnsRegex(UserWarning, "will be removed.*: sample2$"):
+            obs = collate_processed_sequences(sequences)
+
+        self.assertIsInstance(obs, CasavaOneEightSingleLanePerSampleDirFmt)
+        self.assertSetEqual(
+            {fp.name for fp in obs.path.iterdir()},
+            {
+                f"{s}_00_L001_R{r}_001.fastq.gz"
+                for s in ["sample1", "sample3"]
+                for r in (1, 2)
+            },
+        )
+
+    def test_collate_processed_sequences_all_empty(self):
+        sequences = [self._processed_seqs("part1", {"sample1": 0})]
+        with self.assertRaisesRegex(ValueError, "All samples are empty"):
+            collate_processed_sequences(sequences)
+
+    def test_collate_processed_sequences_duplicates(self):
+        sequences = [
+            self._processed_seqs("part1", {"sample1": 2}),
+            self._processed_seqs("part2", {"sample1": 3}),
+        ]
+        with self.assertRaisesRegex(
+            ValueError, "more than one set of sequences: sample1"
+        ):
+            collate_processed_sequences(sequences)
+
+        obs = collate_processed_sequences(sequences, on_duplicate_ids="keep_first")
+        with gzip.open(obs.path / "sample1_00_L001_R2_001.fastq.gz", "rt") as f:
+            self.assertEqual(f.read().count("@part1"), 2)
+
+    def test_collate_processed_sequences_duplicates_renamed(self):
+        part2 = self._processed_seqs("part2", {"sample1": 3})
+        for fp in part2.path.iterdir():
+            os.rename(fp, part2.path / fp.name.replace("_00_", "_S5_"))
+        sequences = [self._processed_seqs("part1", {"sample1": 2}), part2]
+
+        for policy, exp in (("keep_first", "_00_"), ("keep_last", "_S5_")):
+            obs = collate_processed_sequences(sequences, on_duplicate_ids=policy)
+            self.assertSetEqual(
+                {fp.name for fp in obs.path.iterdir()},
+                {f"sample1{exp}L001_R{r}_001.fastq.gz" for r in (1, 2)},
+            )
+
+    def test_process_seqs_partitioned(self):
+        partitions = {"0": MagicMock(), "1": MagicMock()}
+        actions = {
+            "partition_samples_single": MagicMock(return_value=(partitions,)),
+            "process_seqs": MagicMock(
+                side_effect=lambda seqs, **kwargs: (f"{id(seqs)}-seqs", "reports")
+            ),
+            "collate_processed_sequences": MagicMock(return_value=("collated",)),
+            "collate_fastp_reports": MagicMock(return_value=("collated-reports",)),
+        }
+        ctx = MagicMock()
+        ctx.get_action.side_effect = lambda plugin, action: actions[action]
+        sequences = MagicMock()
+        sequences.type.__le__.return_value = False
+
+        obs = process_seqs_partitioned(ctx, sequences, num_partitions=2, thread=4)
+
+        self.assertTupleEqual(obs, ("collated", "collated-reports"))
+        actions["partition_samples_single"].assert_called_once_with(sequences, 2)
+        self.assertEqual(actions["process_seqs"].call_count, 2)
+        for c in actions["process_seqs"].call_args_list:
+            self.assertTrue(c.kwargs["keep_empty_samples"])
+            self.assertEqual(c.kwargs["thread"], 4)
+            self.assertNotIn("num_partitions", c.kwargs)
+        actions["collate_processed_sequences"].assert_called_once_with(
+            [f"{id(p)}-seqs" for p in partitions.values()]
+        )
+        actions["collate_fastp_reports"].assert_called_once_with(["reports", "reports"])
+
 
 if __name__ == "__main__":
     unittest.main()
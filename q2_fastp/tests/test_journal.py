@@ -0,0 +1,80 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import unittest
+
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp._journal import JOURNAL_FILENAME, CheckpointJournal
+
+
+class TestCheckpointJournal(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.work_dir = os.path.join(self.temp_dir.name, "work")
+        self.outputs = {}
+        for role in ("out1", "json"):
+            self.outputs[role] = os.path.join(self.temp_dir.name, role)
+            with open(self.outputs[role], "w") as f:
+                f.write(role)
+        self.plan = pd.DataFrame(
+            {"input_fingerprint": ["abc", "abc"], "params_hash": ["def", "def"]},
+            index=pd.Index(["s1", "s2"], name="sample-id"),
+        )
+
+    def test_find_completed(self):
+        CheckpointJournal(self.work_dir).record(
+            "s1", self.outputs, "abc", "def", "0.23.4"
+        )
+
+        obs = CheckpointJournal(self.work_dir).find_completed(self.plan, "0.23.4")
+
+        self.assertDictEqual(
+            obs,
+            {
+                "s1": {
+                    "out1": os.path.join(self.work_dir, "samples", "s1", "out1"),
+                    "json": os.path.join(self.work_dir, "samples", "s1", "json"),
+                }
+            },
+        )
+        with open(obs["s1"]["out1"]) as f:
+            self.assertEqual(f.read(), "out1")
+
+    def test_find_completed_changed(self):
+        journal = CheckpointJournal(self.work_dir)
+        journal.record("s1", self.outputs, "abc", "other-params", "0.23.4")
+        journal.record("s2", self.outputs, "abc", "def", "0.23.4")
+
+        self.assertDictEqual(journal.find_completed(self.plan, "0.24.0"), {})
+        self.assertListEqual(list(journal.find_completed(self.plan, "0.23.4")), ["s2"])
+
+    def test_find_completed_missing_outputs(self):
+        journal = CheckpointJournal(self.work_dir)
+        journal.record("s1", self.outputs, "abc", "def", "0.23.4")
+        os.remove(os.path.join(self.work_dir, "samples", "s1", "out1"))
+
+        self.assertDictEqual(journal.find_completed(self.plan, "0.23.4"), {})
+
+    def test_torn_entry(self):
+        CheckpointJournal(self.work_dir).record(
+            "s1", self.outputs, "abc", "def", "0.23.4"
+        )
+        with open(os.path.join(self.work_dir, JOURNAL_FILENAME), "a") as f:
+            f.write('{"sample_id": "s2", "input_fing')
+
+        journal = CheckpointJournal(self.work_dir)
+
+        self.assertListEqual(list(journal.entries), ["s1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import unittest
+
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp.overrepresented import (
+    OverrepresentedIndex,
+    _read_overrepresented,
+    collate_overrepresented_indexes,
+    index_overrepresented_sequences,
+)
+from q2_fastp.types import FastpJsonDirectoryFormat
+
+
+class TestOverrepresented(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        with open(self.get_data_path("reports/set1/sample1.json")) as f:
+            self.report = json.load(f)
+
+    def _write_reports(self, name, samples):
+        """Write reports with the given overrepresented sequences of read1."""
+        path = os.path.join(self.temp_dir.name, name)
+        os.makedirs(path)
+        for sample_id, sequences in samples.items():
+            report = json.loads(json.dumps(self.report))
+            report["read1_before_filtering"]["overrepresented_sequences"] = sequences
+            with open(os.path.join(path, f"{sample_id}.json"), "w") as f:
+                json.dump(report, f)
+        return FastpJsonDirectoryFormat(path, mode="r")
+
+    def test_read_overrepresented(self):
+        self.report["read1_before_filtering"]["overrepresented_sequences"] = {
+            "AAAA": 10,
+            "CCCC": 5,
+        }
+        self.report["read2_before_filtering"]["overrepresented_sequences"] = {"AAAA": 3}
+        self.report["read1_after_filtering"]["overrepresented_sequences"] = {"GGGG": 1}
+        fp = os.path.join(self.temp_dir.name, "sample1.json")
+        with open(fp, "w") as f:
+            json.dump(self.report, f)
+
+        obs = _read_overrepresented(fp, "before_filtering")
+        self.assertDictEqual(obs, {"AAAA": 13, "CCCC": 5})
+        self.assertDictEqual(_read_overrepresented(fp, "after_filtering"), {"GGGG": 1})
+
+    def test_read_overrepresented_without_analysis(self):
+        obs = _read_overrepresented(
+            self.get_data_path("reports/set1/sample1.json"), "before_filtering"
+        )
+        self.assertDictEqual(obs, {})
+
+    def test_index_counts(self):
+        index = OverrepresentedIndex()
+        index.add_sample("sample1", {"AAAA": 10, "CCCC": 5})
+        index.add_sample("sample2", {"AAAA": 7})
+
+        self.assertEqual(index.estimate("AAAA"), (2, 17))
+        self.assertEqual(index.estimate("CCCC"), (1, 5))
+        self.assertEqual(index.estimate("GGGG"), (0, 0))
+        self.assertListEqual(index.sample_ids, ["sample1", "sample2"])
+
+    def test_index_sample_added_once(self):
+        index = OverrepresentedIndex()
+        self.assertTrue(index.add_sample("sample1", {"AAAA": 10}))
+        self.assertFalse(index.add_sample("sample1", {"AAAA": 10}))
+        self.assertEqual(index.estimate("AAAA"), (1, 10))
+
+    def test_index_keeps_most_widespread(self):
+        index = OverrepresentedIndex(top_k=2)
+        index.add_sample("sample1", {"AAAA": 1, "CCCC": 100})
+        index.add_sample("sample2", {"GGGG": 1, "TTTT": 1})
+        index.add_sample("sample3", {"GGGG": 1, "TTTT": 1})
+        index.add_sample("sample4", {"GGGG": 1})
+
+        table = index.to_dataframe()
+        self.assertListEqual(table.index.tolist(), ["GGGG", "TTTT"])
+        self.assertListEqual(table["samples"].tolist(), [3, 2])
+        self.assertListEqual(table["sample_percent"].tolist(), [75.0, 50.0])
+
+    def test_index_counts_never_underestimated(self):
+        # with 16 buckets per row, most sequences share buckets
+        index = OverrepresentedIndex(top_k=5, width=16)
+        sequences = [f"{i:08b}".replace("0", "A").replace("1", "C") for i in range(64)]
+        for i in range(10):
+            index.add_sample(f"sample{i}", {seq: 1 for seq in sequences[: 6 * i + 4]})
+
+        for n, seq in enumerate(sequences):
+            exp = sum(n < 6 * i + 4 for i in range(10))
+            self.assertGreaterEqual(index.estimate(seq)[0], exp)
+        self.assertEqual(len(index.top), 5)
+
+    def test_merge(self):
+        index1 = OverrepresentedIndex()
+        index1.add_sample("sample1", {"AAAA": 10, "CCCC": 5})
+        index2 = OverrepresentedIndex()
+        index2.add_sample("sample2", {"AAAA": 2, "GGGG": 1})
+
+        index1.merge(index2)
+        self.assertEqual(index1.estimate("AAAA"), (2, 12))
+        self.assertListEqual(index1.sample_ids, ["sample1", "sample2"])
+        self.assertSetEqual(set(index1.top), {"AAAA", "CCCC", "GGGG"})
+
+    def test_merge_shared_samples(self):
+        index1 = OverrepresentedIndex()
+        index1.add_sample("sample1", {"AAAA": 10})
+        index2 = OverrepresentedIndex()
+        index2.add_sample("sample1", {"AAAA": 10})
+        with self.assertRaisesRegex(ValueError, "more than one index: sample1"):
+            index1.merge(index2)
+
+    def test_merge_different_settings(self):
+        with self.assertRaisesRegex(ValueError, "same stage and sketch width"):
+            OverrepresentedIndex().merge(OverrepresentedIndex(width=1024))
+        with self.assertRaisesRegex(ValueError, "same stage and sketch width"):
+            OverrepresentedIndex().merge(OverrepresentedIndex("after_filtering"))
+
+    def test_arrays_round_trip(self):
+        index = OverrepresentedIndex(top_k=3, width=1024)
+        index.add_sample("sample1", {"AAAA": 10, "CCCC": 5})
+        index.add_sample("sample2", {"AAAA": 2})
+
+        obs = OverrepresentedIndex.from_arrays(index.to_arrays())
+        self.assertEqual(
+            (obs.stage, obs.top_k, obs.width), ("before_filtering", 3, 1024)
+        )
+        self.assertListEqual(obs.sample_ids, ["sample1", "sample2"])
+        self.assertDictEqual(obs.top, index.top)
+        self.assertFalse(obs.add_sample("sample1", {"AAAA": 10}))
+
+    def test_index_overrepresented_sequences(self):
+        reports = self._write_reports(
+            "reports",
+            {
+                "sample1": {"AAAA": 10, "CCCC": 5},
+                "sample2": {"AAAA": 2},
+                "sample3": {"GGGG": 4},
+            },
+        )
+        serial = index_overrepresented_sequences(reports, top_k=2)
+        parallel = index_overrepresented_sequences(reports, top_k=2, n_jobs=2)
+
+        self.assertListEqual(serial.sample_ids, ["sample1", "sample2", "sample3"])
+        self.assertListEqual(serial.sample_ids, parallel.sample_ids)
+        self.assertDictEqual(serial.top, parallel.top)
+        self.assertEqual(serial.to_dataframe().index[0], "AAAA")
+
+    def test_index_overrepresented_sequences_update(self):
+        reports1 = self._write_reports("set1", {"sample1": {"AAAA": 10}})
+        reports2 = self._write_reports(
+            "set2", {"sample1": {"AAAA": 10}, "sample2": {"AAAA": 2}}
+        )
+        index = index_overrepresented_sequences(reports1, sketch_width=1024)
+        obs = index_overrepresented_sequences(reports2, index=index, top_k=5)
+
+        self.assertEqual(obs.estimate("AAAA"), (2, 12))
+        self.assertEqual((obs.width, obs.top_k), (1024, 1000))
+
+    def test_collate_overrepresented_indexes(self):
+        index1 = index_overrepresented_sequences(
+            self._write_reports("set1", {"sample1": {"AAAA": 10}})
+        )
+        index2 = index_overrepresented_sequences(
+            self._write_reports("set2", {"sample2": {"AAAA": 2}})
+        )
+
+        obs = collate_overrepresented_indexes([index1, index2])
+        self.assertEqual(obs.estimate("AAAA"), (2, 12))
+        # the inputs are left untouched
+        self.assertListEqual(index1.sample_ids, ["sample1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import gzip
+import os
+import random
+import unittest
+from unittest.mock import ANY, patch
+
+import pandas as pd
+from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp.preview import (
+    _estimate_run,
+    _estimate_sample,
+    _scan_reads,
+    preview_processing,
+)
+from q2_fastp.tests.test_fastp import _fake_fastp
+from q2_fastp.visualization import TEMPLATES
+
+
+class TestPreview(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.reads = CasavaOneEightSingleLanePerSampleDirFmt(
+            self.get_data_path("reads"), mode="r"
+        )
+
+    def _write_fastq(self, n_reads, members=1):
+        fp = os.path.join(self.temp_dir.name, "reads.fastq.gz")
+        rng = random.Random(42)
+        with open(fp, "wb") as f:
+            for member in range(members):
+                records = "".join(
+                    f"@read{i}\n"
+                    + "".join(rng.choice("ACGT") for _ in range(100))
+                    + "\n+\n"
+                    + "I" * 100
+                    + "\n"
+                    for i in range(n_reads // members)
+                )
+                f.write(gzip.compress(records.encode()))
+        return fp
+
+    def test_scan_reads_whole_file(self):
+        fp = self._write_fastq(100)
+        self.assertTupleEqual(_scan_reads(fp, 1000), (100, os.path.getsize(fp)))
+
+    def test_scan_reads_multiple_members(self):
+        fp = self._write_fastq(100, members=4)
+        self.assertEqual(_scan_reads(fp, 1000)[0], 100)
+
+    def test_scan_reads_stops_early(self):
+        fp = self._write_fastq(20000)
+        found, consumed = _scan_reads(fp, 100)
+        self.assertEqual(found, 100)
+        self.assertLess(consumed, os.path.getsize(fp))
+
+    def test_estimate_sample(self):
+        fp = self._write_fastq(20000)
+        previewed, estimated = _estimate_sample(fp, 2000)
+        self.assertEqual(previewed, 2000)
+        self.assertAlmostEqual(estimated, 20000, delta=4000)
+
+    def test_estimate_sample_short_file(self):
+        fp = self._write_fastq(100)
+        self.assertTupleEqual(_estimate_sample(fp, 1000), (100, 100))
+
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_estimate_run_multiple_lanes(self, mock_run_command):
+        path = os.path.join(self.temp_dir.name, "lanes")
+        os.makedirs(path)
+        for lane in (1, 2):
+            fp = os.path.join(path, f"sample_a_S1_L00{lane}_R1_001.fastq.gz")
+            with gzip.open(fp, "wt") as f:
+                f.write("@read\nACGT\n+\nIIII\n" * 3)
+        sequences = CasavaOneEightSingleLanePerSampleDirFmt(path, mode="r")
+
+        obs = _estimate_run(sequences, {"reads_to_process": 5})
+
+        self.assertEqual(obs.loc["sample_a", "previewed_reads"], 5)
+        self.assertEqual(obs.loc["sample_a", "estimated_reads"], 6)
+        cmd = mock_run_command.call_args.args[0]
+        self.assertTrue(cmd[cmd.index("--in1") + 1].endswith(".lanes.fastq.gz"))
+
+    @patch("q2templates.render")
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_preview_processing(self, mock_run_command, mock_render):
+        preview_processing(self.temp_dir.name, self.reads, reads_to_process=5)
+
+        for c in mock_run_command.call_args_list:
+            cmd = c.args[0]
+            self.assertEqual(cmd[cmd.index("--reads_to_process") + 1], "5")
+
+        mock_render.assert_called_once_with(
+            [os.path.join(TEMPLATES, "preview", "index.html")],
+            self.temp_dir.name,
+            context=ANY,
+        )
+        context = mock_render.call_args.kwargs["context"]
+        self.assertEqual(context["n_samples"], 4)
+        # the fake fastp keeps 10 out of 30 reads of every sample
+        self.assertEqual(context["retention"], "33.33")
+
+        estimates = pd.read_csv(
+            os.path.join(self.temp_dir.name, "preview.tsv"), sep="\t", index_col=0
+        )
+        self.assertListEqual(
+            estimates.index.tolist(), ["sample1", "sample2", "sample3", "sample4"]
+        )
+        self.assertTrue((estimates["previewed_reads"] == 5).all())
+        self.assertTrue((estimates["estimated_reads"] >= 5).all())
+        # the fake fastp takes 2 s per sample
+        self.assertTrue(
+            (
+                estimates["estimated_time"]
+                == 2 * estimates["estimated_reads"] / estimates["previewed_reads"]
+            ).all()
+        )
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.temp_dir.name, "js", "sample-table-data.js")
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import unittest
+
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp.reports import (
+    REPORT_FIELDS,
+    _parse_report,
+    merge_reports,
+    parse_reports,
+    summarize_reports,
+)
+from q2_fastp.types import FastpJsonDirectoryFormat
+
+
+class TestReports(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.fps = [self.get_data_path(f"reports/set1/sample{i}.json") for i in (1, 2)]
+
+    def test_parse_report(self):
+        obs = dict(zip(REPORT_FIELDS, _parse_report(self.fps[0])))
+        self.assertEqual(obs["fastp_version"], "0.23.4")
+        self.assertEqual(obs["total_reads_before_filtering"], 3000004)
+        self.assertEqual(obs["total_reads_after_filtering"], 2555308)
+        self.assertEqual(obs["low_quality_reads"], 444696)
+        self.assertEqual(obs["duplication_rate"], 0.00195866)
+        self.assertEqual(obs["insert_size_peak"], 140)
+        self.assertEqual(obs["adapter_trimmed_reads"], 3420)
+
+    def test_parse_report_missing_sections(self):
+        fp = os.path.join(self.temp_dir.name, "sample1.json")
+        with open(fp, "w") as f:
+            json.dump({"summary": {"fastp_version": "0.23.4"}}, f)
+        obs = dict(zip(REPORT_FIELDS, _parse_report(fp)))
+        self.assertEqual(obs["fastp_version"], "0.23.4")
+        self.assertIsNone(obs["insert_size_peak"])
+
+    def test_parse_reports(self):
+        obs = parse_reports(self.fps)
+        self.assertListEqual(obs.index.tolist(), ["sample1", "sample2"])
+        self.assertListEqual(obs.columns.tolist(), list(REPORT_FIELDS))
+        self.assertEqual(obs.loc["sample1", "total_reads_before_filtering"], 3000004)
+
+    def test_parse_reports_parallel(self):
+        pd.testing.assert_frame_equal(
+            parse_reports(self.fps, n_jobs=2), parse_reports(self.fps)
+        )
+
+    def _load_reports(self):
+        reports = []
+        for fp in self.fps:
+            with open(fp) as f:
+                reports.append(json.load(f))
+        return reports
+
+    def test_merge_reports_same_shards(self):
+        report = self._load_reports()[0]
+
+        obs = merge_reports([report, report], command="fastp --in1 sample1")
+
+        before = obs["summary"]["before_filtering"]
+        self.assertEqual(before["total_reads"], 2 * 3000004)
+        self.assertAlmostEqual(before["q20_rate"], 0.954283, places=6)
+        self.assertEqual(before["read1_mean_length"], 126)
+        self.assertAlmostEqual(before["gc_content"], 0.667123)
+        self.assertEqual(obs["filtering_result"]["low_quality_reads"], 2 * 444696)
+        self.assertEqual(obs["insert_size"]["peak"], 140)
+        self.assertEqual(
+            obs["adapter_cutting"]["read1_adapter_counts"]["others"], 2 * 1710
+        )
+        curves = obs["read1_before_filtering"]["quality_curves"]
+        self.assertEqual(
+            curves["mean"], report["read1_before_filtering"]["quality_curves"]["mean"]
+        )
+        self.assertNotIn("duplication", obs)
+        self.assertEqual(obs["command"], "fastp --in1 sample1")
+        self.assertListEqual(
+            list(obs), [section for section in report if section != "duplication"]
+        )
+
+    def test_merge_reports(self):
+        reports = self._load_reports()
+
+        obs = merge_reports(reports)
+
+        after = obs["summary"]["after_filtering"]
+        stages = [report["summary"]["after_filtering"] for report in reports]
+        self.assertEqual(after["total_reads"], sum(s["total_reads"] for s in stages))
+        self.assertAlmostEqual(
+            after["q30_rate"],
+            sum(s["q30_bases"] for s in stages) / sum(s["total_bases"] for s in stages),
+        )
+        self.assertEqual(
+            obs["read1_after_filtering"]["kmer_count"]["AAAAA"],
+            sum(r["read1_after_filtering"]["kmer_count"]["AAAAA"] for r in reports),
+        )
+        self.assertEqual(obs["command"], reports[0]["command"])
+
+    def test_merge_reports_summary_only(self):
+        shard = {
+            "summary": {
+                "fastp_version": "0.23.4",
+                "before_filtering": {"total_reads": 12},
+                "after_filtering": {"total_reads": 5},
+            }
+        }
+
+        obs = merge_reports([shard, shard, shard])
+
+        self.assertEqual(obs["summary"]["before_filtering"]["total_reads"], 36)
+        self.assertEqual(obs["summary"]["after_filtering"]["total_reads"], 15)
+        self.assertEqual(obs["summary"]["fastp_version"], "0.23.4")
+
+    def test_summarize_reports(self):
+        reports = FastpJsonDirectoryFormat(self.get_data_path("reports/set1"), "r")
+        pd.testing.assert_frame_equal(
+            summarize_reports(reports), parse_reports(self.fps)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,206 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+import unittest
+from functools import partial
+
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp._runner import (
+    JobCancelledError,
+    JobRunner,
+    _CoreBudget,
+    current_job,
+    run_process,
+)
+from q2_fastp.utils import run_command
+
+
+def _run(cmd, **kwargs):
+    return run_command(cmd, verbose=False, resources=True, **kwargs)
+
+
+class TestRunner(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def test_core_budget(self):
+        async def _check():
+            budget = _CoreBudget(4, 3)
+            self.assertTrue(await budget.acquire(3))
+            self.assertFalse(budget._fits(2))
+            self.assertTrue(budget._fits(1))
+            await budget.release(3)
+            self.assertTrue(budget._fits(4))
+
+        asyncio.run(_check())
+
+    def test_core_budget_oversized(self):
+        async def _check():
+            budget = _CoreBudget(4, 3)
+            self.assertTrue(await budget.acquire(8))
+            self.assertEqual(budget.used, 8)
+
+        asyncio.run(_check())
+
+    def test_core_budget_aborted(self):
+        async def _check():
+            budget = _CoreBudget(4, 3)
+            self.assertTrue(await budget.acquire(4))
+            await budget.release(4, failed=True)
+            self.assertFalse(await budget.acquire(1))
+
+        asyncio.run(_check())
+
+    def test_run_process(self):
+        obs = asyncio.run(run_process(["true"]))
+        self.assertSetEqual(
+            set(obs), {"wall_time", "user_time", "system_time", "max_rss"}
+        )
+        self.assertGreater(obs["max_rss"], 0)
+
+    def test_run_process_error(self):
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            asyncio.run(run_process(["false"]))
+        self.assertEqual(cm.exception.returncode, 1)
+        self.assertListEqual(cm.exception.cmd, ["false"])
+
+    def test_run_process_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            asyncio.run(run_process(["no-such-command-q2-fastp"]))
+
+    def test_run_process_timeout(self):
+        start = time.perf_counter()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            asyncio.run(run_process(["sleep", "30"], timeout=0.5))
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_run_jobs_in_order(self):
+        jobs = [partial(lambda i: i * 2, i) for i in range(5)]
+        obs = JobRunner(3).run(jobs)
+        self.assertListEqual(obs, [0, 2, 4, 6, 8])
+
+    def test_run_jobs_first_error(self):
+        def _job(i):
+            if i in (1, 3):
+                raise ValueError(f"job{i}")
+            return i
+
+        with self.assertRaisesRegex(ValueError, "job1"):
+            JobRunner(2).run([partial(_job, i) for i in range(5)])
+
+    def test_run_jobs_stop_after_error(self):
+        started = []
+
+        def _job(i):
+            started.append(i)
+            if i == 0:
+                raise ValueError("job0")
+
+        with self.assertRaises(ValueError):
+            JobRunner(1).run([partial(_job, i) for i in range(5)])
+        self.assertListEqual(started, [0])
+
+    def test_run_jobs_processes(self):
+        def _job():
+            self.assertIsNotNone(current_job())
+            return _run(["true"])
+
+        obs = JobRunner(2).run([_job, _job])
+        self.assertEqual(len(obs), 2)
+        self.assertIn("max_rss", obs[0])
+        self.assertIsNone(current_job())
+
+    def test_run_jobs_process_stdin(self):
+        fp = os.path.join(self.temp_dir.name, "out.txt")
+
+        def _write(process):
+            with process.stdin as f:
+                f.write(b"hello\n")
+
+        def _job():
+            with open(fp, "wb") as out:
+                return _run(["cat"], stdin=subprocess.PIPE, stdout=out, on_start=_write)
+
+        JobRunner(1).run([_job])
+        with open(fp) as f:
+            self.assertEqual(f.read(), "hello\n")
+
+    def test_run_jobs_timeout(self):
+        start = time.perf_counter()
+        with self.assertRaises(subprocess.TimeoutExpired) as cm:
+            JobRunner(1, timeout=0.5).run([partial(_run, ["sleep", "30"])])
+        self.assertEqual(cm.exception.timeout, 0.5)
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_run_jobs_within_running_loop(self):
+        async def _run_jobs():
+            return JobRunner(2).run([partial(_run, ["true"])] * 2)
+
+        self.assertEqual(len(asyncio.run(_run_jobs())), 2)
+
+    def test_run_jobs_interrupted(self):
+        pids, started = [], []
+
+        def _job(i):
+            started.append(i)
+            return _run(["sleep", "30"], on_start=lambda p: pids.append(p.pid))
+
+        timer = threading.Timer(1, os.kill, (os.getpid(), signal.SIGINT))
+        timer.start()
+        start = time.perf_counter()
+        try:
+            with self.assertRaises(KeyboardInterrupt):
+                JobRunner(2).run([partial(_job, i) for i in range(4)])
+        finally:
+            timer.cancel()
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertListEqual(sorted(started), [0, 1])
+        for pid in pids:
+            with self.assertRaises(ProcessLookupError):
+                os.kill(pid, 0)
+
+    def test_run_jobs_within_running_loop_interrupted(self):
+        pids = []
+
+        async def _run_jobs():
+            job = partial(_run, ["sleep", "30"], on_start=lambda p: pids.append(p.pid))
+            return JobRunner(2).run([job] * 2)
+
+        # a loop without a SIGINT handler of its own, like that of a notebook
+        loop = asyncio.new_event_loop()
+        timer = threading.Timer(1, os.kill, (os.getpid(), signal.SIGINT))
+        timer.start()
+        start = time.perf_counter()
+        try:
+            with self.assertRaises(KeyboardInterrupt):
+                loop.run_until_complete(_run_jobs())
+        finally:
+            timer.cancel()
+            loop.close()
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual(len(pids), 2)
+        for pid in pids:
+            with self.assertRaises(ProcessLookupError):
+                os.kill(pid, 0)
+
+    def test_cancelled_job_starts_no_processes(self):
+        def _job():
+            current_job().cancelled = True
+            return _run(["true"])
+
+        with self.assertRaises(JobCancelledError):
+            JobRunner(1).run([_job])
+
+
+if __name__ == "__main__":
+    unittest.main()
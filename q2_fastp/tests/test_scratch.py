@@ -0,0 +1,115 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp._scratch import ScratchStager
+
+
+class TestScratchStager(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.scratch = os.path.join(self.temp_dir.name, "scratch")
+        os.makedirs(self.scratch)
+        self.inputs = {}
+        for sample_id in ["s1", "s2", "s3"]:
+            fp = os.path.join(self.temp_dir.name, f"{sample_id}.fastq.gz")
+            with open(fp, "wb") as f:
+                f.write(b"x" * 100)
+            self.inputs[sample_id] = [fp]
+
+    def _staged_samples(self, stager):
+        # give the prefetching thread the chance to move on
+        time.sleep(0.1)
+        with stager._condition:
+            return sorted(stager.staged)
+
+    def test_prefetch(self):
+        stager = ScratchStager(self.scratch, self.inputs, 1024, prefetch=1)
+        self.assertListEqual(self._staged_samples(stager), ["s1"])
+
+        staged = stager.wait_for_inputs("s1")
+        self.assertEqual(os.path.dirname(os.path.dirname(staged[0])), self.scratch)
+        with open(staged[0], "rb") as f:
+            self.assertEqual(f.read(), b"x" * 100)
+        self.assertListEqual(self._staged_samples(stager), ["s1", "s2"])
+
+        stager.discard_inputs("s1")
+        self.assertFalse(os.path.exists(staged[0]))
+        stager.close()
+
+    def test_byte_budget(self):
+        # every sample reserves 200 bytes, so only one fits at a time
+        stager = ScratchStager(self.scratch, self.inputs, 250, prefetch=3)
+        self.assertListEqual(self._staged_samples(stager), ["s1"])
+
+        stager.wait_for_inputs("s1")
+        stager.discard_inputs("s1")
+        self.assertListEqual(self._staged_samples(stager), [])
+
+        output_fp = os.path.join(self.scratch, "s1.out")
+        with open(output_fp, "w") as f:
+            f.write("reads")
+        dst = os.path.join(self.temp_dir.name, "s1.out")
+        stager.move_outputs("s1", {output_fp: dst})
+        self.assertListEqual(self._staged_samples(stager), ["s2"])
+
+        stager.close()
+        with open(dst) as f:
+            self.assertEqual(f.read(), "reads")
+
+    def test_failed_sample_releases_budget(self):
+        # two samples of 200 bytes fit, the third waits for space
+        stager = ScratchStager(self.scratch, self.inputs, 500, prefetch=3)
+        stager.wait_for_inputs("s1")
+        stager.wait_for_inputs("s2")
+        self.assertListEqual(self._staged_samples(stager), ["s1", "s2"])
+
+        # s1 fails - its outputs are never moved
+        stager.discard_outputs("s1")
+        stager.discard_inputs("s1")
+        self.assertListEqual(self._staged_samples(stager), ["s2", "s3"])
+        self.assertEqual(stager.used, 400)
+        stager.close()
+
+    def test_discard_moved_outputs(self):
+        stager = ScratchStager(self.scratch, self.inputs, 1024, prefetch=1)
+        stager.wait_for_inputs("s1")
+        stager.discard_inputs("s1")
+        stager.move_outputs("s1", {})
+        stager.close()
+        used = stager.used
+
+        # the space was already released by moving the outputs
+        stager.discard_outputs("s1")
+        self.assertEqual(stager.used, used)
+
+    def test_sample_exceeding_budget(self):
+        stager = ScratchStager(self.scratch, self.inputs, 10, prefetch=2)
+
+        # the sample is staged on its own, but nothing else next to it
+        self.assertEqual(len(stager.wait_for_inputs("s1")), 1)
+        self.assertListEqual(self._staged_samples(stager), ["s1"])
+        stager.close()
+
+    @patch("q2_fastp._scratch._copy_file", side_effect=OSError("No space left"))
+    def test_staging_fails(self, mock_copy):
+        stager = ScratchStager(self.scratch, self.inputs, 1024, prefetch=1)
+        with self.assertRaisesRegex(RuntimeError, "No space left"):
+            stager.wait_for_inputs("s1")
+        stager.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import gzip
+import os
+import random
+import unittest
+from unittest.mock import ANY, patch
+
+import numpy as np
+import pandas as pd
+from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp.fastp import _lane_manifest
+from q2_fastp.stats import _collect_stats, _fastq_stats, summarize_sequences
+from q2_fastp.visualization import TEMPLATES
+
+
+class TestStats(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.reads_paired = CasavaOneEightSingleLanePerSampleDirFmt(
+            self.get_data_path("reads-paired"), mode="r"
+        )
+
+    def _write_fastq(self, records, trailing_newline=True):
+        fp = os.path.join(self.temp_dir.name, "reads.fastq.gz")
+        data = "".join(f"@{name}\n{seq}\n+\n{qual}\n" for name, seq, qual in records)
+        with gzip.open(fp, "wt") as f:
+            f.write(data if trailing_newline else data.rstrip("\n"))
+        return fp
+
+    def _random_records(self, n_reads, lengths=(20, 60)):
+        rng = random.Random(42)
+        records = []
+        for i in range(n_reads):
+            length = rng.randint(*lengths)
+            seq = "".join(rng.choice("ACGTN") for _ in range(length))
+            qual = "".join(chr(33 + rng.randint(2, 40)) for _ in range(length))
+            records.append((f"read{i}", seq, qual))
+        return records
+
+    def _assert_stats(self, obs, records):
+        lengths = [len(seq) for _, seq, _ in records]
+        self.assertEqual(obs["reads"], len(records))
+        self.assertEqual(obs["bases"], sum(lengths))
+        self.assertEqual(
+            obs["gc_bases"],
+            sum(
+                seq.upper().count("G") + seq.upper().count("C") for _, seq, _ in records
+            ),
+        )
+        self.assertEqual(
+            obs["q30_bases"],
+            sum(ord(q) - 33 >= 30 for _, _, qual in records for q in qual),
+        )
+        np.testing.assert_array_equal(
+            obs["length_histogram"], np.bincount(lengths, minlength=max(lengths) + 1)
+        )
+        first = [ord(qual[0]) - 33 for _, _, qual in records]
+        self.assertAlmostEqual(obs["quality_sums"][0], sum(first))
+        self.assertEqual(obs["quality_counts"][0], len(records))
+        self.assertEqual(obs["quality_counts"][-1], lengths.count(max(lengths)))
+
+    def test_fastq_stats(self):
+        records = self._random_records(500)
+        self._assert_stats(_fastq_stats(self._write_fastq(records)), records)
+
+    def test_fastq_stats_single_length(self):
+        records = self._random_records(500, lengths=(50, 50))
+        records[3] = ("read3", "acgtgg" + records[3][1][6:], records[3][2])
+        self._assert_stats(_fastq_stats(self._write_fastq(records)), records)
+
+    @patch("q2_fastp.stats.STATS_BLOCK_SIZE", 97)
+    def test_fastq_stats_records_split_between_blocks(self):
+        records = self._random_records(500)
+        self._assert_stats(_fastq_stats(self._write_fastq(records)), records)
+
+    def test_fastq_stats_without_trailing_newline(self):
+        records = self._random_records(10)
+        fp = self._write_fastq(records, trailing_newline=False)
+        self._assert_stats(_fastq_stats(fp), records)
+
+    def test_fastq_stats_empty(self):
+        obs = _fastq_stats(self._write_fastq([]))
+        self.assertEqual(obs["reads"], 0)
+        self.assertEqual(len(obs["length_histogram"]), 0)
+
+    def test_fastq_stats_truncated(self):
+        fp = os.path.join(self.temp_dir.name, "reads.fastq.gz")
+        with gzip.open(fp, "wt") as f:
+            f.write("@read1\nACGT\n+\nIIII\n@read2\nACGT\n")
+        with self.assertRaisesRegex(ValueError, "incomplete"):
+            _fastq_stats(fp)
+
+    def test_fastq_stats_quality_length_mismatch(self):
+        fp = self._write_fastq([("read1", "ACGT", "III")])
+        with self.assertRaisesRegex(ValueError, "lengths"):
+            _fastq_stats(fp)
+
+    def test_collect_stats_parallel(self):
+        manifest = _lane_manifest(self.reads_paired)
+        serial = _collect_stats(manifest)
+        parallel = _collect_stats(manifest, n_jobs=2)
+        self.assertListEqual(list(serial), list(parallel))
+        for key in serial:
+            self.assertEqual(serial[key]["bases"], parallel[key]["bases"])
+
+    @patch("q2templates.render")
+    def test_summarize_sequences(self, mock_render):
+        summarize_sequences(self.temp_dir.name, self.reads_paired)
+
+        mock_render.assert_called_once_with(
+            [os.path.join(TEMPLATES, "stats", "index.html")],
+            self.temp_dir.name,
+            context=ANY,
+        )
+        context = mock_render.call_args.kwargs["context"]
+        self.assertEqual(context["n_samples"], 2)
+        self.assertEqual(context["reads"], "200")
+
+        table = pd.read_csv(
+            os.path.join(self.temp_dir.name, "sequence-stats.tsv"),
+            sep="\t",
+            index_col=0,
+        )
+        self.assertListEqual(table.index.tolist(), ["sample1", "sample2"])
+        self.assertListEqual(table["reads"].tolist(), [100, 100])
+        self.assertTrue(table["mean_length_reverse"].notna().all())
+        lengths = pd.read_csv(
+            os.path.join(self.temp_dir.name, "read-lengths.tsv"),
+            sep="\t",
+            index_col=0,
+        )
+        self.assertListEqual(lengths.columns.tolist(), ["forward", "reverse"])
+        self.assertEqual(lengths["forward"].sum(), 200)
+        qualities = pd.read_csv(
+            os.path.join(self.temp_dir.name, "mean-quality.tsv"),
+            sep="\t",
+            index_col=0,
+        )
+        self.assertEqual(qualities.index[0], 1)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.temp_dir.name, "js", "sample-table-data.js")
+            )
+        )
+
+    @patch("q2templates.render")
+    def test_summarize_sequences_multiple_lanes(self, mock_render):
+        path = os.path.join(self.temp_dir.name, "lanes")
+        os.makedirs(path)
+        lanes = {1: self._random_records(10, (20, 30)), 2: self._random_records(5)}
+        for lane, records in lanes.items():
+            fp = os.path.join(path, f"sample_a_S1_L00{lane}_R1_001.fastq.gz")
+            with gzip.open(fp, "wt") as f:
+                for name, seq, qual in records:
+                    f.write(f"@{name}\n{seq}\n+\n{qual}\n")
+        sequences = CasavaOneEightSingleLanePerSampleDirFmt(path, mode="r")
+        output_dir = os.path.join(self.temp_dir.name, "output")
+        os.makedirs(output_dir)
+
+        summarize_sequences(output_dir, sequences)
+
+        self.assertEqual(mock_render.call_args.kwargs["context"]["reads"], "15")
+        table = pd.read_csv(
+            os.path.join(output_dir, "sequence-stats.tsv"), sep="\t", index_col=0
+        )
+        self.assertListEqual(table.index.tolist(), ["sample_a"])
+        lengths = [len(seq) for _, seq, _ in lanes[1] + lanes[2]]
+        self.assertEqual(table.loc["sample_a", "bases"], sum(lengths))
+        self.assertEqual(table.loc["sample_a", "min_length"], min(lengths))
+        self.assertEqual(table.loc["sample_a", "max_length"], max(lengths))
+
+
+if __name__ == "__main__":
+    unittest.main()
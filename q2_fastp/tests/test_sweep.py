@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import gzip
+import os
+import unittest
+from unittest.mock import ANY, patch
+
+import pandas as pd
+from q2_types.per_sample_sequences import CasavaOneEightSingleLanePerSampleDirFmt
+from qiime2 import Metadata
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp.fastp import _lane_manifest
+from q2_fastp.sweep import _parse_parameter_sets, _stage_inputs, sweep_processing
+from q2_fastp.tests.test_fastp import _fake_fastp
+from q2_fastp.visualization import TEMPLATES
+
+
+class TestSweep(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.reads = CasavaOneEightSingleLanePerSampleDirFmt(
+            self.get_data_path("reads"), mode="r"
+        )
+        self.parameter_sets = pd.DataFrame(
+            {
+                "cut_mean_quality": [20.0, 25.0, None],
+                "cut_tail": ["false", "true", "true"],
+            },
+            index=pd.Index(["default", "strict", "tail-only"], name="id"),
+        )
+
+    def test_parse_parameter_sets(self):
+        sets = _parse_parameter_sets(self.parameter_sets)
+
+        self.assertListEqual(list(sets), ["default", "strict", "tail-only"])
+        self.assertEqual(sets["strict"]["cut_mean_quality"], 25)
+        self.assertIsInstance(sets["strict"]["cut_mean_quality"], int)
+        self.assertTrue(sets["strict"]["cut_tail"])
+        self.assertFalse(sets["default"]["cut_tail"])
+        # missing values fall back to the defaults of process_seqs
+        self.assertEqual(sets["tail-only"]["cut_mean_quality"], 20)
+        self.assertEqual(sets["tail-only"]["length_required"], 15)
+
+    def test_parse_parameter_sets_unknown_param(self):
+        self.parameter_sets["n_jobs"] = 2
+        with self.assertRaisesRegex(ValueError, "not parameters.*n_jobs"):
+            _parse_parameter_sets(self.parameter_sets)
+
+    def test_parse_parameter_sets_invalid_value(self):
+        self.parameter_sets["cut_tail"] = "maybe"
+        with self.assertRaisesRegex(ValueError, 'cut_tail" in the parameter set'):
+            _parse_parameter_sets(self.parameter_sets)
+
+    def test_stage_inputs(self):
+        staged = _stage_inputs(_lane_manifest(self.reads), self.temp_dir.name, n_jobs=2)
+
+        self.assertListEqual(
+            sorted(staged), ["sample1", "sample2", "sample3", "sample4"]
+        )
+        with open(staged["sample1"][0]) as f:
+            self.assertTrue(f.readline().startswith("@"))
+        self.assertFalse(staged["sample1"][0].endswith(".gz"))
+
+    @patch("q2templates.render")
+    @patch("q2_fastp.fastp.run_command", side_effect=_fake_fastp)
+    def test_sweep_processing(self, mock_run_command, mock_render):
+        sweep_processing(
+            self.temp_dir.name, self.reads, Metadata(self.parameter_sets), n_jobs=2
+        )
+
+        # every sample was processed once with every parameter set
+        self.assertEqual(mock_run_command.call_count, 12)
+        cmds = [c.args[0] for c in mock_run_command.call_args_list]
+        for cmd in cmds:
+            self.assertNotIn("--out1", cmd)
+            self.assertFalse(cmd[cmd.index("--in1") + 1].endswith(".gz"))
+        self.assertEqual(sum("--cut_tail" in cmd for cmd in cmds), 8)
+        self.assertEqual(
+            sum(cmd[cmd.index("--cut_mean_quality") + 1] == "25" for cmd in cmds), 4
+        )
+
+        mock_render.assert_called_once_with(
+            [os.path.join(TEMPLATES, "sweep", "index.html")],
+            self.temp_dir.name,
+            context=ANY,
+        )
+        comparison = pd.read_csv(
+            os.path.join(self.temp_dir.name, "sweep.tsv"), sep="\t", index_col=0
+        )
+        self.assertListEqual(
+            comparison.index.tolist(), ["default", "strict", "tail-only"]
+        )
+        self.assertListEqual(comparison["cut_mean_quality"].tolist(), [20, 25, 20])
+        # the fake fastp keeps 10 out of 30 reads of every sample
+        self.assertListEqual(comparison["reads_before_filtering"].tolist(), [120] * 3)
+        self.assertListEqual(comparison["reads_after_filtering"].tolist(), [40] * 3)
+        self.assertListEqual(comparison["fastp_time"].tolist(), [8.0] * 3)
+
+        samples = pd.read_csv(
+            os.path.join(self.temp_dir.name, "sweep-samples.tsv"), sep="\t"
+        )
+        self.assertEqual(len(samples), 12)
+
+    @patch("q2templates.render")
+    def test_sweep_processing_multiple_lanes(self, mock_render):
+        path = os.path.join(self.temp_dir.name, "lanes")
+        os.makedirs(path)
+        for lane, n_reads in ((1, 3), (2, 2)):
+            fp = os.path.join(path, f"sample_a_S1_L00{lane}_R1_001.fastq.gz")
+            with gzip.open(fp, "wt") as f:
+                f.write("@read\nACGT\n+\nIIII\n" * n_reads)
+        sequences = CasavaOneEightSingleLanePerSampleDirFmt(path, mode="r")
+
+        def _counting_fastp(cmd, **kwargs):
+            fp = cmd[cmd.index("--in1") + 1]
+            with (gzip.open if fp.endswith(".gz") else open)(fp, "rt") as f:
+                counts.append(len(f.readlines()) // 4)
+            return _fake_fastp(cmd, **kwargs)
+
+        for stage_inputs in (True, False):
+            with self.subTest(stage_inputs=stage_inputs):
+                counts = []
+                output_dir = os.path.join(self.temp_dir.name, str(stage_inputs))
+                os.makedirs(output_dir)
+                with patch("q2_fastp.fastp.run_command", side_effect=_counting_fastp):
+                    sweep_processing(
+                        output_dir,
+                        sequences,
+                        Metadata(self.parameter_sets),
+                        stage_inputs=stage_inputs,
+                    )
+
+                # a single run per parameter set, reading all the lanes
+                self.assertListEqual(counts, [5] * 3)
+                context = mock_render.call_args.kwargs["context"]
+                self.assertEqual(context["n_samples"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
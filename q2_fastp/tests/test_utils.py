@@ -6,13 +6,16 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 import os
-from unittest.mock import patch, call, MagicMock
+import shutil
+import subprocess
+from unittest.mock import patch, MagicMock
 
+import pandas as pd
 from qiime2.plugin.testing import TestPluginBase
 
-from q2_fastp import collate_fastp_reports
+from q2_fastp import collate_fastp_reports, collate_fastp_summaries
 from q2_fastp.types import FastpJsonDirectoryFormat
-from q2_fastp.utils import run_command
+from q2_fastp.utils import _copy_file, _read_sample_table, run_command
 
 
 class TestUtils(TestPluginBase):
@@ -34,6 +37,17 @@ class TestUtils(TestPluginBase):
 
         mock_subprocess_run.assert_called_once_with(cmd, check=True)
 
+    def test_run_command_with_resources(self):
+        obs = run_command(["true"], verbose=False, resources=True)
+        self.assertSetEqual(
+            set(obs), {"wall_time", "user_time", "system_time", "max_rss"}
+        )
+        self.assertGreater(obs["max_rss"], 0)
+
+    def test_run_command_with_resources_error(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_command(["false"], verbose=False, resources=True)
+
     @patch("subprocess.run")
     def test_run_command_with_pipe(self, mock_subprocess_run):
         mock_result = MagicMock()
@@ -48,28 +62,143 @@ class TestUtils(TestPluginBase):
         )
         self.assertEqual(result.stdout, "mock output")
 
-    @patch("q2_fastp.utils.shutil.move")
-    def test_collate(self, p):
+    def test_collate(self):
         obs = collate_fastp_reports(reports=[self.reports1, self.reports2])
         self.assertIsInstance(obs, FastpJsonDirectoryFormat)
-        p.assert_has_calls(
-            [
-                call(
-                    os.path.join(str(self.reports1.path), "sample1.json"),
-                    obs.path / "sample1.json",
-                ),
-                call(
-                    os.path.join(str(self.reports1.path), "sample2.json"),
-                    obs.path / "sample2.json",
-                ),
-                call(
-                    os.path.join(str(self.reports2.path), "sample3.json"),
-                    obs.path / "sample3.json",
-                ),
-                call(
-                    os.path.join(str(self.reports2.path), "sample4.json"),
-                    obs.path / "sample4.json",
-                ),
-            ],
-            any_order=True,
+        self.assertSetEqual(
+            {fp.name for fp in obs.path.iterdir()},
+            {"sample1.json", "sample2.json", "sample3.json", "sample4.json"},
         )
+        # the inputs are left in place
+        self.assertTrue(os.path.exists(self.reports1.path / "sample1.json"))
+
+    @patch("q2_fastp.utils.os.link", side_effect=OSError(18, "Cross-device link"))
+    def test_collate_copies_across_filesystems(self, mock_link):
+        obs = collate_fastp_reports(reports=[self.reports1, self.reports2])
+        self.assertEqual(mock_link.call_count, 4)
+        with open(obs.path / "sample3.json") as obs_f, open(
+            self.reports2.path / "sample3.json"
+        ) as exp_f:
+            self.assertEqual(obs_f.read(), exp_f.read())
+
+    def _reports_with_plan(self, name, sample_ids, content):
+        dst = os.path.join(self.temp_dir.name, name)
+        os.makedirs(dst)
+        for sample_id in sample_ids:
+            with open(os.path.join(dst, f"{sample_id}.json"), "w") as f:
+                f.write(content)
+        pd.DataFrame(
+            {"launch_order": 1, "input_size": 1, "threads": 1, "set": name},
+            index=pd.Index(sample_ids, name="sample-id"),
+        ).to_csv(os.path.join(dst, "run_plan.tsv"), sep="\t")
+        return FastpJsonDirectoryFormat(dst, "r")
+
+    def test_collate_duplicates_error(self):
+        reports = [
+            self._reports_with_plan("set1", ["sample1", "sample2"], "{}"),
+            self._reports_with_plan("set2", ["sample2", "sample3"], "{}"),
+        ]
+        with self.assertRaisesRegex(
+            ValueError, "present in more than one set of reports: sample2\\."
+        ):
+            collate_fastp_reports(reports)
+
+    def test_collate_duplicates_keep(self):
+        for policy, exp in (("keep_first", "set1"), ("keep_last", "set2")):
+            with self.subTest(policy=policy):
+                reports = [
+                    self._reports_with_plan(
+                        f"{policy}-set1", ["sample1", "sample2"], '{"set": 1}'
+                    ),
+                    self._reports_with_plan(
+                        f"{policy}-set2", ["sample2", "sample3"], '{"set": 2}'
+                    ),
+                ]
+                obs = collate_fastp_reports(reports, on_duplicate_ids=policy)
+
+                with open(obs.path / "sample2.json") as f:
+                    self.assertEqual(f.read(), f'{{"set": {exp[-1]}}}')
+                plan = pd.read_csv(obs.path / "run_plan.tsv", sep="\t", index_col=0)
+                self.assertListEqual(
+                    sorted(plan.index), ["sample1", "sample2", "sample3"]
+                )
+                self.assertEqual(plan.loc["sample2", "set"], f"{policy}-{exp}")
+
+    def test_collate_numeric_ids(self):
+        reports = [
+            self._reports_with_plan("set1", ["01", "2"], "{}"),
+            self._reports_with_plan("set2", ["3"], "{}"),
+        ]
+        obs = collate_fastp_reports(reports)
+
+        plan = _read_sample_table(obs.path / "run_plan.tsv")
+        self.assertListEqual(plan.index.tolist(), ["01", "2", "3"])
+
+    def test_copy_file(self):
+        src = os.path.join(self.temp_dir.name, "src")
+        dst = os.path.join(self.temp_dir.name, "dst")
+        with open(src, "wb") as f:
+            f.write(os.urandom(100000))
+        _copy_file(src, dst)
+        with open(src, "rb") as f_src, open(dst, "rb") as f_dst:
+            self.assertEqual(f_src.read(), f_dst.read())
+
+    def test_collate_run_plans(self):
+        reports = []
+        for i, name in enumerate(["set1", "set2"]):
+            dst = os.path.join(self.temp_dir.name, name)
+            shutil.copytree(self.get_data_path(f"reports/{name}"), dst)
+            pd.DataFrame(
+                {"launch_order": [1], "input_size": [100 * i], "threads": [2]},
+                index=pd.Index([f"sample{i}"], name="sample-id"),
+            ).to_csv(os.path.join(dst, "run_plan.tsv"), sep="\t")
+            reports.append(FastpJsonDirectoryFormat(dst, "r"))
+
+        obs = collate_fastp_reports(reports=reports)
+
+        self.assertSetEqual(
+            {fp.name for fp in obs.path.iterdir()},
+            {
+                "sample1.json",
+                "sample2.json",
+                "sample3.json",
+                "sample4.json",
+                "run_plan.tsv",
+            },
+        )
+        plan = pd.read_csv(obs.path / "run_plan.tsv", sep="\t", index_col=0)
+        self.assertListEqual(plan.index.tolist(), ["sample0", "sample1"])
+
+    def test_collate_summaries(self):
+        summaries = [
+            pd.DataFrame(
+                {"total_reads_before_filtering": [i, i + 1]},
+                index=pd.Index([f"sample{i}", f"sample{i + 1}"], name="id"),
+            )
+            for i in (1, 3)
+        ]
+        obs = collate_fastp_summaries(summaries)
+        self.assertListEqual(
+            obs.index.tolist(), ["sample1", "sample2", "sample3", "sample4"]
+        )
+
+    def test_collate_summaries_duplicates(self):
+        summary = pd.DataFrame(
+            {"total_reads_before_filtering": [1]},
+            index=pd.Index(["sample1"], name="id"),
+        )
+        with self.assertRaisesRegex(
+            ValueError, "present in more than one summary: sample1"
+        ):
+            collate_fastp_summaries([summary, summary])
+
+    def test_collate_summaries_keep_last(self):
+        summaries = [
+            pd.DataFrame(
+                {"total_reads_before_filtering": [i]},
+                index=pd.Index(["sample1"], name="id"),
+            )
+            for i in (1, 2)
+        ]
+        obs = collate_fastp_summaries(summaries, on_duplicate_ids="keep_last")
+        self.assertEqual(obs.loc["sample1", "total_reads_before_filtering"], 2)
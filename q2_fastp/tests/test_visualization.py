@@ -5,15 +5,18 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import json
 import os
 import unittest
 from unittest.mock import patch, MagicMock, ANY
 
+import pandas as pd
 from qiime2.plugin.testing import TestPluginBase
 
 from q2_fastp import visualize
+from q2_fastp.overrepresented import OverrepresentedIndex
 from q2_fastp.types import FastpJsonDirectoryFormat
-from q2_fastp.visualization import TEMPLATES
+from q2_fastp.visualization import TABLE_COLUMNS, TEMPLATES, _tabulate_samples
 
 
 class TestVisualization(TestPluginBase):
@@ -55,6 +58,78 @@ class TestVisualization(TestPluginBase):
             [os.path.join(TEMPLATES, "index.html")], self.temp_dir.name, context={}
         )
 
+    @patch("q2templates.render")
+    def test_visualize_native(self, mock_render):
+        visualize(self.temp_dir.name, self.reports, engine="native")
+
+        mock_render.assert_called_once_with(
+            [os.path.join(TEMPLATES, "native", "index.html")],
+            self.temp_dir.name,
+            context={
+                "n_samples": 2,
+                "raw_reads": ANY,
+                "filtered_reads": ANY,
+                "passed_percent": ANY,
+                "fastp_versions": "0.23.4",
+                "overrepresented": None,
+            },
+        )
+        summary = pd.read_csv(
+            os.path.join(self.temp_dir.name, "fastp-summary.tsv"),
+            sep="\t",
+            index_col=0,
+        )
+        self.assertListEqual(summary.index.tolist(), ["sample1", "sample2"])
+
+        self.assertTrue(
+            os.path.exists(os.path.join(self.temp_dir.name, "js", "sample-table.js"))
+        )
+        with open(os.path.join(self.temp_dir.name, "js", "sample-table-data.js")) as f:
+            content = f.read()
+        self.assertTrue(content.startswith("var sampleTable = "))
+        table = json.loads(content[len("var sampleTable = ") : -2])
+        self.assertListEqual(table["index"], ["sample1", "sample2"])
+        self.assertListEqual(table["columns"], list(TABLE_COLUMNS.values()))
+        self.assertEqual(table["data"][0][0], 3000004)
+
+    @patch("q2templates.render")
+    def test_visualize_native_overrepresented(self, mock_render):
+        index = OverrepresentedIndex()
+        index.add_sample("sample1", {"AAAA": 10, "CCCC": 5})
+        index.add_sample("sample2", {"AAAA": 2})
+
+        visualize(
+            self.temp_dir.name,
+            self.reports,
+            overrepresented_index=index,
+            engine="native",
+        )
+
+        context = mock_render.call_args.kwargs["context"]
+        self.assertIn("<th>AAAA</th>", context["overrepresented"])
+        self.assertEqual(context["overrepresented_stage"], "before filtering")
+        self.assertEqual(context["indexed_samples"], 2)
+        table = pd.read_csv(
+            os.path.join(self.temp_dir.name, "overrepresented-sequences.tsv"),
+            sep="\t",
+            index_col=0,
+        )
+        self.assertListEqual(table.index.tolist(), ["AAAA", "CCCC"])
+        self.assertListEqual(table["reads"].tolist(), [12, 5])
+
+    def test_tabulate_samples(self):
+        summary = pd.DataFrame(
+            {
+                **{col: [1.0] for col in TABLE_COLUMNS},
+                "passed_filter_reads": [3],
+                "total_reads_before_filtering": [4],
+            },
+            index=["sample1"],
+        )
+        obs = _tabulate_samples(summary)
+        self.assertEqual(obs.loc["sample1", "Passed filter (%)"], 75.0)
+        self.assertEqual(obs.loc["sample1", "Reads (raw)"], 4.0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -6,7 +6,30 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-from ._format import FastpJsonDirectoryFormat, FastpJsonFormat
-from ._type import FastpJSONReports
+from ._format import (
+    FastpHtmlFormat,
+    FastpJsonDirectoryFormat,
+    FastpJsonFormat,
+    FastpOverrepresentedIndexDirectoryFormat,
+    FastpOverrepresentedIndexFormat,
+    FastpRunPlanFormat,
+    FastpSummaryDirectoryFormat,
+    FastpSummaryFormat,
+    FastpTimingsFormat,
+)
+from ._type import FastpJSONReports, FastpOverrepresentedIndex, FastpSummary
 
-__all__ = ["FastpJsonFormat", "FastpJsonDirectoryFormat", "FastpJSONReports"]
+__all__ = [
+    "FastpHtmlFormat",
+    "FastpJsonFormat",
+    "FastpJsonDirectoryFormat",
+    "FastpJSONReports",
+    "FastpOverrepresentedIndex",
+    "FastpOverrepresentedIndexDirectoryFormat",
+    "FastpOverrepresentedIndexFormat",
+    "FastpRunPlanFormat",
+    "FastpSummary",
+    "FastpSummaryDirectoryFormat",
+    "FastpSummaryFormat",
+    "FastpTimingsFormat",
+]
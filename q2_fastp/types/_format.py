@@ -6,25 +6,301 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 from qiime2.core.exceptions import ValidationError
 from qiime2.plugin import model
 
+# the per-cycle curves, which make up most of a fastp report,
+# follow all the sections with the summary statistics
+CURVES_KEY = b'"read1_before_filtering"'
+READ_BLOCK_SIZE = 16 * 1024
+
+# the number of processes validating the reports of a directory in full
+# (see the README); parsing large reports is CPU-bound, so threads would not help
+VALIDATION_JOBS_VAR = "Q2_FASTP_VALIDATION_JOBS"
+VALIDATION_CACHE_SIZE = 100000
+
+
+def _read_report_head(fp: str) -> dict:
+    """Parse the sections of a fastp report preceding the per-cycle curves.
+
+    Only the beginning of the file is read, up to the first of the curves.
+    Reports without the curves (or with the sections ordered differently)
+    are parsed in full.
+    """
+    data = b""
+    with open(fp, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            start = max(len(data) - len(CURVES_KEY), 0)
+            data += block
+            idx = data.find(CURVES_KEY, start)
+            if idx != -1:
+                try:
+                    return json.loads(data[:idx].rstrip().rstrip(b",") + b"}")
+                except ValueError:
+                    data += f.read()
+                    break
+            if not block:
+                break
+    return json.loads(data)
+
+
+def _ends_with_brace(fp: str) -> bool:
+    with open(fp, "rb") as f:
+        f.seek(max(os.path.getsize(fp) - 64, 0))
+        return f.read().rstrip().endswith(b"}")
+
+
+def _validate_report(fp: str, level: str):
+    """Validate a fastp report, raising a ValueError if it is invalid.
+
+    On the "min" level only the beginning and the end of the report are
+    read: the sections preceding the per-cycle curves need to parse and
+    contain the summary, and the report needs to end with the closing
+    brace. On the "max" level the whole report is parsed.
+    """
+    if level == "min":
+        report = _read_report_head(fp)
+        if not _ends_with_brace(fp):
+            raise ValueError("The report is truncated.")
+    else:
+        with open(fp, "rb") as f:
+            report = json.load(f)
+    if not isinstance(report, dict) or "summary" not in report:
+        raise ValueError("The report does not contain the summary.")
+
+
+def _check_report(fp: str) -> bool:
+    try:
+        _validate_report(fp, "max")
+    except ValueError:
+        return False
+    return True
+
+
+class _ValidationCache:
+    """Remember the reports which passed validation in this process.
+
+    Reports are identified by their path and stat signature (device, inode,
+    size and modification time), so changed reports are validated again.
+    Reports validated on the "max" level count as validated on "min" too.
+    """
+
+    def __init__(self, max_size: int = VALIDATION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(fp: str):
+        stat = os.stat(fp)
+        return (
+            os.path.abspath(fp),
+            stat.st_dev,
+            stat.st_ino,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    def __contains__(self, item):
+        fp, level = item
+        key = self._key(fp)
+        with self._lock:
+            if self._entries.get(key) in (level, "max"):
+                self._entries.move_to_end(key)
+                return True
+        return False
+
+    def add(self, fp: str, level: str):
+        key = self._key(fp)
+        with self._lock:
+            if self._entries.get(key) != "max":
+                self._entries[key] = level
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_validated_reports = _ValidationCache()
+
 
 class FastpJsonFormat(model.TextFileFormat):
+    def _validate_(self, level):
+        fp = str(self.path)
+        if (fp, level) in _validated_reports:
+            return
+        try:
+            _validate_report(fp, level)
+        except ValueError:
+            raise ValidationError(
+                f'"{self.path}" JSON file is not formatted correctly.'
+            )
+        _validated_reports.add(fp, level)
+
+
+class FastpHtmlFormat(model.TextFileFormat):
     def _validate_(self, level):
         with open(self.path) as f:
-            try:
-                json.load(f)
-            except json.decoder.JSONDecodeError:
-                raise ValidationError(
-                    f'"{self.path}" JSON file is not formatted correctly.'
-                )
+            if "<html" not in f.read(1024).lower():
+                raise ValidationError(f'"{self.path}" is not an HTML file.')
+
+
+class _FastpTableFormat(model.TextFileFormat):
+    REQUIRED_COLUMNS = ["sample-id"]
+    NAME = "table"
+
+    def _validate_(self, level):
+        with open(self.path) as f:
+            header = f.readline().rstrip("\n").split("\t")
+        missing = [col for col in self.REQUIRED_COLUMNS if col not in header]
+        if missing:
+            raise ValidationError(
+                f'"{self.path}" {self.NAME} is missing the following columns: '
+                f'{", ".join(missing)}.'
+            )
+
+
+class FastpRunPlanFormat(_FastpTableFormat):
+    REQUIRED_COLUMNS = ["sample-id", "launch_order", "input_size", "threads"]
+    NAME = "run plan"
+
+
+class FastpTimingsFormat(_FastpTableFormat):
+    REQUIRED_COLUMNS = [
+        "sample-id",
+        "wall_time",
+        "user_time",
+        "system_time",
+        "max_rss",
+        "reads_per_second",
+        "mb_per_second",
+    ]
+    NAME = "timing table"
 
 
 class FastpJsonDirectoryFormat(model.DirectoryFormat):
     reports = model.FileCollection(r".+\.json$", format=FastpJsonFormat)
+    html_reports = model.FileCollection(
+        r".+\.html$", format=FastpHtmlFormat, optional=True
+    )
+    run_plan = model.File("run_plan.tsv", format=FastpRunPlanFormat, optional=True)
+    timings = model.File("timings.tsv", format=FastpTimingsFormat, optional=True)
+
+    def validate(self, level="max"):
+        n_jobs = int(os.environ.get(VALIDATION_JOBS_VAR, 1))
+        if level == "max" and n_jobs > 1:
+            self._validate_reports(n_jobs)
+        super().validate(level)
+
+    def _validate_reports(self, n_jobs: int):
+        """Parse the reports which were not validated before in parallel.
+
+        Reports passing validation are added to the validation cache, so
+        that they are not parsed again while the directory is validated.
+        Invalid reports are left to the validation of the directory itself.
+        """
+        fps = [
+            str(fp)
+            for fp in self.path.glob("*.json")
+            if (str(fp), "max") not in _validated_reports
+        ]
+        if len(fps) < 2:
+            return
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chunksize = max(len(fps) // (n_jobs * 4), 1)
+            results = executor.map(_check_report, fps, chunksize=chunksize)
+            for fp, valid in zip(fps, results):
+                if valid:
+                    _validated_reports.add(fp, "max")
 
     @reports.set_path_maker
     def reports_path_maker(self, sample_id):
         return f"{sample_id}.json"
+
+    @html_reports.set_path_maker
+    def html_reports_path_maker(self, sample_id):
+        return f"{sample_id}.html"
+
+
+class FastpSummaryFormat(model.BinaryFileFormat):
+    """Summary statistics of fastp reports, as a compressed NumPy archive.
+
+    The archive holds one array per column of the summary table, next to
+    the "id" array with the sample IDs. Numeric columns are stored as
+    floats (missing values being NaN), other columns as strings (missing
+    values being empty). Single columns can be loaded without reading the
+    others.
+    """
+
+    def _validate_(self, level):
+        try:
+            with np.load(str(self.path), allow_pickle=False) as npz:
+                if "id" not in npz.files:
+                    raise ValidationError(
+                        f'"{self.path}" summary does not contain the sample IDs.'
+                    )
+                if level == "max":
+                    n_samples = len(npz["id"])
+                    for col in npz.files:
+                        if npz[col].shape != (n_samples,):
+                            raise ValidationError(
+                                f'"{self.path}" summary column "{col}" does not '
+                                f"contain exactly one value per sample."
+                            )
+        except (OSError, ValueError, zipfile.BadZipFile):
+            raise ValidationError(f'"{self.path}" is not a NumPy archive.')
+
+
+FastpSummaryDirectoryFormat = model.SingleFileDirectoryFormat(
+    "FastpSummaryDirectoryFormat", "summary.npz", FastpSummaryFormat
+)
+
+
+class FastpOverrepresentedIndexFormat(model.BinaryFileFormat):
+    """An index of overrepresented sequences, as a NumPy archive.
+
+    The archive holds the count-min sketches counting the samples and the
+    reads of every sequence, the IDs of the indexed samples and the most
+    widespread sequences, next to the settings of the index.
+    """
+
+    ARRAYS = (
+        "stage",
+        "top_k",
+        "sample_sketch",
+        "read_sketch",
+        "sample_ids",
+        "sequences",
+    )
+
+    def _validate_(self, level):
+        try:
+            with np.load(str(self.path), allow_pickle=False) as npz:
+                missing = [name for name in self.ARRAYS if name not in npz.files]
+                if missing:
+                    raise ValidationError(
+                        f'"{self.path}" index does not contain: '
+                        f"{', '.join(missing)}."
+                    )
+                if level == "max":
+                    if npz["sample_sketch"].shape != npz["read_sketch"].shape:
+                        raise ValidationError(
+                            f'"{self.path}" index sketches differ in shape.'
+                        )
+        except (OSError, ValueError, zipfile.BadZipFile):
+            raise ValidationError(f'"{self.path}" is not a NumPy archive.')
+
+
+FastpOverrepresentedIndexDirectoryFormat = model.SingleFileDirectoryFormat(
+    "FastpOverrepresentedIndexDirectoryFormat",
+    "index.npz",
+    FastpOverrepresentedIndexFormat,
+)
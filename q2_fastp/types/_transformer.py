@@ -0,0 +1,70 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+import qiime2
+
+from ..overrepresented import OverrepresentedIndex
+from ..plugin_setup import plugin
+from ._format import FastpOverrepresentedIndexFormat, FastpSummaryFormat
+
+
+def _read_summary(ff: FastpSummaryFormat) -> pd.DataFrame:
+    with np.load(str(ff), allow_pickle=False) as npz:
+        columns = {col: npz[col] for col in npz.files if col != "id"}
+        index = pd.Index(npz["id"].astype(object), name="id")
+
+    df = pd.DataFrame(columns, index=index)
+    for col, values in df.items():
+        if not pd.api.types.is_numeric_dtype(values):
+            df[col] = values.astype(object).replace("", np.nan)
+    return df
+
+
+@plugin.register_transformer
+def _1(data: pd.DataFrame) -> FastpSummaryFormat:
+    ff = FastpSummaryFormat()
+    arrays = {"id": data.index.to_numpy(dtype=str)}
+    for col, values in data.items():
+        if pd.api.types.is_numeric_dtype(values):
+            arrays[col] = values.to_numpy(dtype="float64", na_value=np.nan)
+        else:
+            arrays[col] = values.fillna("").to_numpy(dtype=str)
+    # np.savez_compressed would append the .npz extension to a file name
+    with open(str(ff), "wb") as f:
+        np.savez_compressed(f, **arrays)
+    return ff
+
+
+@plugin.register_transformer
+def _2(ff: FastpSummaryFormat) -> pd.DataFrame:
+    return _read_summary(ff).convert_dtypes()
+
+
+@plugin.register_transformer
+def _3(ff: FastpSummaryFormat) -> qiime2.Metadata:
+    return qiime2.Metadata(_read_summary(ff))
+
+
+@plugin.register_transformer
+def _4(data: OverrepresentedIndex) -> FastpOverrepresentedIndexFormat:
+    ff = FastpOverrepresentedIndexFormat()
+    with open(str(ff), "wb") as f:
+        np.savez_compressed(f, **data.to_arrays())
+    return ff
+
+
+@plugin.register_transformer
+def _5(ff: FastpOverrepresentedIndexFormat) -> OverrepresentedIndex:
+    with np.load(str(ff), allow_pickle=False) as npz:
+        return OverrepresentedIndex.from_arrays({name: npz[name] for name in npz.files})
+
+
+@plugin.register_transformer
+def _6(ff: FastpOverrepresentedIndexFormat) -> pd.DataFrame:
+    return _5(ff).to_dataframe()
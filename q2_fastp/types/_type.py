@@ -8,3 +8,5 @@
 from qiime2.core.type import SemanticType
 
 FastpJSONReports = SemanticType("FastpJSONReports")
+FastpSummary = SemanticType("FastpSummary")
+FastpOverrepresentedIndex = SemanticType("FastpOverrepresentedIndex")
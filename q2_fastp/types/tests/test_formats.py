@@ -6,15 +6,45 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import json
+import os
+import shutil
+from unittest.mock import patch
+
+import numpy as np
 from qiime2.core.exceptions import ValidationError
 from qiime2.plugin.testing import TestPluginBase
 
-from q2_fastp.types import FastpJsonDirectoryFormat
+from q2_fastp.types import (
+    FastpHtmlFormat,
+    FastpJsonDirectoryFormat,
+    FastpJsonFormat,
+    FastpOverrepresentedIndexFormat,
+    FastpRunPlanFormat,
+    FastpSummaryFormat,
+    FastpTimingsFormat,
+)
+from q2_fastp.types._format import (
+    VALIDATION_JOBS_VAR,
+    _read_report_head,
+    _validate_report,
+    _validated_reports,
+    _ValidationCache,
+)
 
 
 class TestFormats(TestPluginBase):
     package = "q2_fastp.tests"
 
+    def setUp(self):
+        super().setUp()
+        self.report_fp = self.get_data_path("reports/set1/sample1.json")
+
+    def _copy_report(self, name="sample1.json"):
+        fp = os.path.join(self.temp_dir.name, name)
+        shutil.copy(self.report_fp, fp)
+        return fp
+
     def test_fastp_json_format(self):
         FastpJsonDirectoryFormat(self.get_data_path("reports/set1"), "r").validate()
 
@@ -25,3 +55,204 @@ class TestFormats(TestPluginBase):
             FastpJsonDirectoryFormat(
                 self.get_data_path("reports/set3-broken"), "r"
             ).validate()
+
+    def test_fastp_run_plan_format(self):
+        fp = os.path.join(self.temp_dir.name, "run_plan.tsv")
+        with open(fp, "w") as f:
+            f.write("sample-id\tlaunch_order\tinput_size\tthreads\n")
+            f.write("sample1\t1\t1024\t4\n")
+        FastpRunPlanFormat(fp, "r").validate()
+
+    def test_fastp_run_plan_format_missing_columns(self):
+        fp = os.path.join(self.temp_dir.name, "run_plan.tsv")
+        with open(fp, "w") as f:
+            f.write("sample-id\tlaunch_order\n")
+            f.write("sample1\t1\n")
+        with self.assertRaisesRegex(
+            ValidationError, "missing the following columns: input_size, threads"
+        ):
+            FastpRunPlanFormat(fp, "r").validate()
+
+    def test_fastp_html_format(self):
+        fp = os.path.join(self.temp_dir.name, "sample1.html")
+        with open(fp, "w") as f:
+            f.write("<html><head><title>fastp report</title></head></html>")
+        FastpHtmlFormat(fp, "r").validate()
+
+    def test_fastp_html_format_invalid(self):
+        fp = os.path.join(self.temp_dir.name, "sample1.html")
+        with open(fp, "w") as f:
+            f.write("{}")
+        with self.assertRaisesRegex(ValidationError, "is not an HTML file"):
+            FastpHtmlFormat(fp, "r").validate()
+
+    def test_fastp_timings_format_missing_columns(self):
+        fp = os.path.join(self.temp_dir.name, "timings.tsv")
+        with open(fp, "w") as f:
+            f.write("sample-id\twall_time\tuser_time\tsystem_time\tmax_rss\n")
+            f.write("sample1\t1.0\t0.5\t0.1\t1024\n")
+        with self.assertRaisesRegex(
+            ValidationError,
+            "timing table is missing the following columns: "
+            "reads_per_second, mb_per_second",
+        ):
+            FastpTimingsFormat(fp, "r").validate()
+
+    def _write_summary(self, **arrays):
+        fp = os.path.join(self.temp_dir.name, "summary.npz")
+        with open(fp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        return fp
+
+    def test_fastp_summary_format(self):
+        fp = self._write_summary(
+            id=np.array(["sample1", "sample2"]),
+            total_reads_before_filtering=np.array([10.0, 20.0]),
+        )
+        FastpSummaryFormat(fp, "r").validate()
+
+    def test_fastp_summary_format_missing_ids(self):
+        fp = self._write_summary(total_reads_before_filtering=np.array([10.0]))
+        with self.assertRaisesRegex(ValidationError, "does not contain the sample IDs"):
+            FastpSummaryFormat(fp, "r").validate()
+
+    def test_fastp_summary_format_column_length(self):
+        fp = self._write_summary(
+            id=np.array(["sample1", "sample2"]),
+            total_reads_before_filtering=np.array([10.0]),
+        )
+        with self.assertRaisesRegex(
+            ValidationError, 'column "total_reads_before_filtering" does not'
+        ):
+            FastpSummaryFormat(fp, "r").validate()
+
+    def test_fastp_summary_format_not_npz(self):
+        fp = os.path.join(self.temp_dir.name, "summary.npz")
+        with open(fp, "w") as f:
+            f.write("{}")
+        with self.assertRaisesRegex(ValidationError, "is not a NumPy archive"):
+            FastpSummaryFormat(fp, "r").validate()
+
+    def _index_arrays(self, **arrays):
+        return {
+            "stage": np.array("before_filtering"),
+            "top_k": np.array(10),
+            "sample_sketch": np.zeros((4, 16), dtype=np.uint32),
+            "read_sketch": np.zeros((4, 16), dtype=np.uint64),
+            "sample_ids": np.array(["sample1"]),
+            "sequences": np.array(["AAAA"]),
+            **arrays,
+        }
+
+    def test_fastp_overrepresented_index_format(self):
+        fp = self._write_summary(**self._index_arrays())
+        FastpOverrepresentedIndexFormat(fp, "r").validate()
+
+    def test_fastp_overrepresented_index_format_missing_arrays(self):
+        arrays = self._index_arrays()
+        del arrays["read_sketch"]
+        fp = self._write_summary(**arrays)
+        with self.assertRaisesRegex(ValidationError, "does not contain: read_sketch"):
+            FastpOverrepresentedIndexFormat(fp, "r").validate()
+
+    def test_fastp_overrepresented_index_format_sketch_shapes(self):
+        fp = self._write_summary(
+            **self._index_arrays(read_sketch=np.zeros((4, 8), dtype=np.uint64))
+        )
+        with self.assertRaisesRegex(ValidationError, "sketches differ in shape"):
+            FastpOverrepresentedIndexFormat(fp, "r").validate()
+
+    def test_read_report_head(self):
+        obs = _read_report_head(self.report_fp)
+        self.assertListEqual(
+            list(obs),
+            [
+                "summary",
+                "filtering_result",
+                "duplication",
+                "insert_size",
+                "adapter_cutting",
+            ],
+        )
+        with open(self.report_fp) as f:
+            exp = json.load(f)
+        self.assertDictEqual(obs["insert_size"], exp["insert_size"])
+
+    def test_read_report_head_without_curves(self):
+        fp = os.path.join(self.temp_dir.name, "sample1.json")
+        with open(fp, "w") as f:
+            json.dump({"summary": {"fastp_version": "0.23.4"}}, f)
+        self.assertDictEqual(
+            _read_report_head(fp), {"summary": {"fastp_version": "0.23.4"}}
+        )
+
+    def test_fastp_json_format_min(self):
+        FastpJsonFormat(self._copy_report(), "r").validate(level="min")
+
+    def test_fastp_json_format_min_truncated(self):
+        fp = self._copy_report()
+        with open(fp, "r+") as f:
+            f.truncate(os.path.getsize(fp) // 2)
+        with self.assertRaisesRegex(
+            ValidationError, "JSON file is not formatted correctly"
+        ):
+            FastpJsonFormat(fp, "r").validate(level="min")
+
+    def test_fastp_json_format_missing_summary(self):
+        fp = os.path.join(self.temp_dir.name, "sample1.json")
+        with open(fp, "w") as f:
+            json.dump({"filtering_result": {}}, f)
+        for level in ("min", "max"):
+            with self.assertRaisesRegex(
+                ValidationError, "JSON file is not formatted correctly"
+            ):
+                FastpJsonFormat(fp, "r").validate(level=level)
+
+    def test_fastp_json_format_cached(self):
+        fp = self._copy_report()
+        with patch(
+            "q2_fastp.types._format._validate_report",
+            side_effect=_validate_report,
+        ) as mock_validate:
+            FastpJsonFormat(fp, "r").validate(level="max")
+            FastpJsonFormat(fp, "r").validate(level="max")
+            FastpJsonFormat(fp, "r").validate(level="min")
+            self.assertEqual(mock_validate.call_count, 1)
+
+            # changed reports are validated again
+            with open(fp, "a") as f:
+                f.write("\n")
+            FastpJsonFormat(fp, "r").validate(level="max")
+            self.assertEqual(mock_validate.call_count, 2)
+
+    def test_validation_cache_levels(self):
+        cache = _ValidationCache(max_size=1)
+        fp1, fp2 = self._copy_report("sample1.json"), self._copy_report("s2.json")
+        cache.add(fp1, "min")
+        self.assertIn((fp1, "min"), cache)
+        self.assertNotIn((fp1, "max"), cache)
+
+        cache.add(fp1, "max")
+        cache.add(fp1, "min")
+        self.assertIn((fp1, "max"), cache)
+
+        cache.add(fp2, "max")
+        self.assertNotIn((fp1, "min"), cache)
+        self.assertIn((fp2, "min"), cache)
+
+    def test_fastp_json_directory_format_parallel(self):
+        reports_dir = os.path.join(self.temp_dir.name, "reports")
+        shutil.copytree(self.get_data_path("reports/set1"), reports_dir)
+        with patch.dict(os.environ, {VALIDATION_JOBS_VAR: "2"}):
+            FastpJsonDirectoryFormat(reports_dir, "r").validate()
+        for name in ("sample1.json", "sample2.json"):
+            self.assertIn((os.path.join(reports_dir, name), "max"), _validated_reports)
+
+    def test_fastp_json_directory_format_parallel_invalid(self):
+        reports_dir = os.path.join(self.temp_dir.name, "reports")
+        shutil.copytree(self.get_data_path("reports/set3-broken"), reports_dir)
+        with patch.dict(os.environ, {VALIDATION_JOBS_VAR: "2"}):
+            with self.assertRaisesRegex(
+                ValidationError, "JSON file is not formatted correctly"
+            ):
+                FastpJsonDirectoryFormat(reports_dir, "r").validate()
@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_fastp.overrepresented import OverrepresentedIndex
+from q2_fastp.types import FastpOverrepresentedIndexFormat, FastpSummaryFormat
+from q2_fastp.types._transformer import _1, _2, _3, _4, _5, _6
+
+
+class TestTransformers(TestPluginBase):
+    package = "q2_fastp.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.summary = pd.DataFrame(
+            {
+                "fastp_version": ["0.23.4", None],
+                "total_reads_before_filtering": [3000004, 20],
+                "insert_size_peak": [140, None],
+                "duplication_rate": [0.00195866, 0.5],
+            },
+            index=pd.Index(["sample1", "sample2"], name="id"),
+        ).convert_dtypes()
+
+    def test_dataframe_to_summary_format(self):
+        obs = _1(self.summary)
+        self.assertIsInstance(obs, FastpSummaryFormat)
+        obs.validate()
+
+        with np.load(str(obs), allow_pickle=False) as npz:
+            self.assertListEqual(
+                npz.files,
+                [
+                    "id",
+                    "fastp_version",
+                    "total_reads_before_filtering",
+                    "insert_size_peak",
+                    "duplication_rate",
+                ],
+            )
+            self.assertListEqual(npz["fastp_version"].tolist(), ["0.23.4", ""])
+            self.assertTrue(np.isnan(npz["insert_size_peak"][1]))
+
+    def test_summary_format_to_dataframe(self):
+        obs = _2(_1(self.summary))
+        pd.testing.assert_frame_equal(obs, self.summary)
+
+    def test_summary_format_to_metadata(self):
+        obs = _3(_1(self.summary))
+        self.assertIsInstance(obs, qiime2.Metadata)
+        df = obs.to_dataframe()
+        self.assertEqual(df.loc["sample1", "total_reads_before_filtering"], 3000004)
+        self.assertTrue(pd.isna(df.loc["sample2", "fastp_version"]))
+
+    def test_overrepresented_index_round_trip(self):
+        index = OverrepresentedIndex(top_k=5, width=1024)
+        index.add_sample("sample1", {"AAAA": 10, "CCCC": 5})
+
+        ff = _4(index)
+        self.assertIsInstance(ff, FastpOverrepresentedIndexFormat)
+        ff.validate()
+        obs = _5(ff)
+        self.assertEqual(obs.estimate("AAAA"), (1, 10))
+        self.assertDictEqual(obs.top, index.top)
+        self.assertListEqual(obs.sample_ids, ["sample1"])
+
+    def test_overrepresented_index_format_to_dataframe(self):
+        index = OverrepresentedIndex()
+        index.add_sample("sample1", {"AAAA": 10, "CCCC": 5})
+
+        obs = _6(_4(index))
+        self.assertListEqual(obs.index.tolist(), ["AAAA", "CCCC"])
+        self.assertListEqual(obs["reads"].tolist(), [10, 5])
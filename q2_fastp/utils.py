@@ -8,9 +8,22 @@
 import os
 import shutil
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
+import pandas as pd
+
+from q2_fastp._runner import current_job
 from q2_fastp.types import FastpJsonDirectoryFormat
 
+# per-sample tables describing a run, stored next to the fastp reports
+RUN_TABLES = ("run_plan.tsv", "timings.tsv")
+
+# the number of threads copying files which could not be linked
+COPY_THREADS = 8
+
 EXTERNAL_CMD_WARNING = (
     "Running external command line application(s). "
     "This may print messages to stdout and/or stderr.\n"
@@ -20,12 +33,48 @@ EXTERNAL_CMD_WARNING = (
 )
 
 
-def run_command(cmd, env=None, verbose=True, pipe=False, **kwargs):
+def _run_with_resources(cmd, env=None, on_start=None, **kwargs):
+    """Run the command and collect the resources used by its process.
+
+    If provided, on_start is called with the started process (e.g. to
+    write its input) before waiting for it to finish. Within a job run by
+    a JobRunner, the process is run by the runner, which kills it if the
+    job times out or the run is interrupted.
+    """
+    job = current_job()
+    if job is not None:
+        return job.run_process(cmd, env=env, on_start=on_start, **kwargs)
+
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, env=env, **kwargs)
+    if on_start is not None:
+        on_start(process)
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    max_rss = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    return {
+        "wall_time": wall_time,
+        "user_time": rusage.ru_utime,
+        "system_time": rusage.ru_stime,
+        "max_rss": max_rss,
+    }
+
+
+def run_command(cmd, env=None, verbose=True, pipe=False, resources=False, **kwargs):
     if verbose:
         print(EXTERNAL_CMD_WARNING)
         print("\nCommand:", end=" ")
         print(" ".join(cmd), end="\n\n")
 
+    if resources:
+        return _run_with_resources(cmd, env=env, **kwargs)
+
     if pipe:
         result = subprocess.run(
             cmd, env=env, check=True, capture_output=True, text=True
@@ -47,11 +96,120 @@ def add_param(cmd, param, value, flag=None):
         cmd.append(str(value))
 
 
+def _copy_file(src: str, dst: str):
+    """Copy the file, letting the kernel clone it if the filesystem supports it."""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+def link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        _copy_file(src, dst)
+
+
+def _transfer_files(files: Dict[str, str], dst_dir: str):
+    """Hard-link the files into the directory, copying them if that fails.
+
+    Files which cannot be linked (e.g. because they are located on another
+    filesystem) are copied by several threads.
+
+    Parameters:
+    files (Dict[str, str]): The paths of the files, by their new names.
+    dst_dir (str): The directory to transfer the files to.
+    """
+    to_copy = []
+    for name, src in files.items():
+        dst = os.path.join(dst_dir, name)
+        try:
+            os.link(src, dst)
+        except OSError:
+            to_copy.append((src, dst))
+
+    if to_copy:
+        with ThreadPoolExecutor(max_workers=COPY_THREADS) as executor:
+            list(executor.map(lambda args: _copy_file(*args), to_copy))
+
+
+def _read_sample_table(fp: str) -> pd.DataFrame:
+    """Read a per-sample table, keeping the sample IDs as strings.
+
+    Otherwise, numeric sample IDs (e.g. "1") would be read as numbers and
+    no longer match the IDs of the samples.
+    """
+    return pd.read_csv(fp, sep="\t", index_col=0, converters={0: str})
+
+
+def _find_duplicates(ids: List[str], on_duplicate_ids: str, what: str) -> List[str]:
+    """Find the sample IDs present more than once.
+
+    Raises a ValueError if there are any and the policy is "error".
+    """
+    duplicated = pd.Index(ids)
+    duplicated = sorted(duplicated[duplicated.duplicated()].unique())
+    if duplicated and on_duplicate_ids == "error":
+        raise ValueError(
+            f"The following samples are present in more than one {what}: "
+            f"{', '.join(duplicated)}. Use the keep_first or keep_last policy "
+            "to only keep one of them."
+        )
+    return duplicated
+
+
+def _deduplicate(df: pd.DataFrame, on_duplicate_ids: str, what: str) -> pd.DataFrame:
+    if not _find_duplicates(df.index.tolist(), on_duplicate_ids, what):
+        return df
+    keep = "first" if on_duplicate_ids == "keep_first" else "last"
+    return df[~df.index.duplicated(keep=keep)]
+
+
 def collate_fastp_reports(
     reports: FastpJsonDirectoryFormat,
+    on_duplicate_ids: str = "error",
 ) -> FastpJsonDirectoryFormat:
     collated_reports = FastpJsonDirectoryFormat()
+
+    # list all inputs before transferring anything, so that duplicated
+    # samples are found up front
+    files, ids = {}, []
+    tables = {fn: [] for fn in RUN_TABLES}
     for report in reports:
-        for fp in report.path.iterdir():
-            shutil.move(str(fp), collated_reports.path / os.path.basename(fp))
+        with os.scandir(report.path) as entries:
+            for entry in entries:
+                if entry.name in tables:
+                    tables[entry.name].append(entry.path)
+                    continue
+                sample_id, ext = os.path.splitext(entry.name)
+                if ext == ".json":
+                    ids.append(sample_id)
+                if entry.name not in files or on_duplicate_ids != "keep_first":
+                    files[entry.name] = entry.path
+    _find_duplicates(ids, on_duplicate_ids, "set of reports")
+
+    _transfer_files(files, str(collated_reports.path))
+
+    for fn, fps in tables.items():
+        if fps:
+            df = pd.concat(_read_sample_table(fp) for fp in fps)
+            df = _deduplicate(df, on_duplicate_ids, "set of reports")
+            df.to_csv(collated_reports.path / fn, sep="\t")
     return collated_reports
+
+
+def collate_fastp_summaries(
+    summaries: List[pd.DataFrame], on_duplicate_ids: str = "error"
+) -> pd.DataFrame:
+    return _deduplicate(pd.concat(summaries), on_duplicate_ids, "summary")
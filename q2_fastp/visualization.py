@@ -9,8 +9,11 @@ import os
 import shutil
 import tempfile
 
+import pandas as pd
 import q2templates
 
+from q2_fastp.overrepresented import OverrepresentedIndex
+from q2_fastp.reports import summarize_reports
 from q2_fastp.types import FastpJsonDirectoryFormat
 from q2_fastp.utils import run_command
 
@@ -19,10 +22,31 @@ TEMPLATES = os.path.join(
     "assets",
 )
 
+# the columns of the sample table, with their headers
+TABLE_COLUMNS = {
+    "total_reads_before_filtering": "Reads (raw)",
+    "total_reads_after_filtering": "Reads (filtered)",
+    "passed_filter_percent": "Passed filter (%)",
+    "q30_rate_after_filtering": "Q30 rate (filtered)",
+    "gc_content_after_filtering": "GC content (filtered)",
+    "duplication_rate": "Duplication rate",
+    "insert_size_peak": "Insert size peak",
+    "adapter_trimmed_reads": "Adapter-trimmed reads",
+    "low_quality_reads": "Low quality reads",
+    "too_short_reads": "Too short reads",
+}
 
-def visualize(output_dir: str, reports: FastpJsonDirectoryFormat) -> None:
-    """Visualize fastp reports."""
+# the number of overrepresented sequences shown on the page; all the
+# sequences tracked by the index are written into the TSV file
+OVERREPRESENTED_ROWS = 50
+OVERREPRESENTED_COLUMNS = {
+    "samples": "Samples",
+    "sample_percent": "Samples (%)",
+    "reads": "Reads",
+}
 
+
+def _visualize_multiqc(output_dir: str, reports: FastpJsonDirectoryFormat):
     with tempfile.TemporaryDirectory() as temp_dir:
         cmd = [
             "multiqc",
@@ -42,3 +66,94 @@ def visualize(output_dir: str, reports: FastpJsonDirectoryFormat) -> None:
     ]
 
     q2templates.render(templates, output_dir, context={})
+
+
+def _write_sample_table(table: pd.DataFrame, output_dir: str):
+    """Write the table rendered by js/sample-table.js into the visualization.
+
+    The table is loaded by the page as a script, which (unlike fetching
+    a JSON file) also works when the page is opened from the disk.
+    """
+    js_dir = os.path.join(output_dir, "js")
+    os.makedirs(js_dir, exist_ok=True)
+    shutil.copy(os.path.join(TEMPLATES, "js", "sample-table.js"), js_dir)
+    with open(os.path.join(js_dir, "sample-table-data.js"), "w") as f:
+        f.write("var sampleTable = ")
+        f.write(table.to_json(orient="split"))
+        f.write(";\n")
+
+
+def _tabulate_samples(summary: pd.DataFrame) -> pd.DataFrame:
+    """Select the columns of the sample table from the report summary."""
+    table = summary.copy()
+    table["passed_filter_percent"] = (
+        100 * table["passed_filter_reads"] / table["total_reads_before_filtering"]
+    ).round(2)
+    table = table[list(TABLE_COLUMNS)].astype("float64").round(4)
+    return table.rename(columns=TABLE_COLUMNS)
+
+
+def _tabulate_overrepresented(index: OverrepresentedIndex, output_dir: str) -> str:
+    """Write the overrepresented sequences and render the most widespread."""
+    table = index.to_dataframe()
+    table.to_csv(os.path.join(output_dir, "overrepresented-sequences.tsv"), sep="\t")
+    table = table.head(OVERREPRESENTED_ROWS).rename(columns=OVERREPRESENTED_COLUMNS)
+    return table.to_html(
+        classes="table table-striped table-hover table-condensed",
+        border=0,
+        formatters={"Samples (%)": "{:.2f}".format},
+    )
+
+
+def _visualize_native(
+    output_dir: str,
+    reports: FastpJsonDirectoryFormat,
+    n_jobs: int,
+    overrepresented_index: OverrepresentedIndex = None,
+):
+    summary = summarize_reports(reports, n_jobs=n_jobs)
+    summary.to_csv(os.path.join(output_dir, "fastp-summary.tsv"), sep="\t")
+
+    _write_sample_table(_tabulate_samples(summary), output_dir)
+
+    raw_reads = summary["total_reads_before_filtering"].sum()
+    filtered_reads = summary["total_reads_after_filtering"].sum()
+    context = {
+        "n_samples": len(summary),
+        "raw_reads": f"{raw_reads:,}",
+        "filtered_reads": f"{filtered_reads:,}",
+        "passed_percent": (
+            f"{100 * filtered_reads / raw_reads:.2f}" if raw_reads else "n/a"
+        ),
+        "fastp_versions": ", ".join(sorted(summary["fastp_version"].dropna().unique())),
+        "overrepresented": None,
+    }
+    if overrepresented_index is not None:
+        context["overrepresented"] = _tabulate_overrepresented(
+            overrepresented_index, output_dir
+        )
+        context["overrepresented_stage"] = overrepresented_index.stage.replace("_", " ")
+        context["indexed_samples"] = len(overrepresented_index.sample_ids)
+    q2templates.render(
+        [os.path.join(TEMPLATES, "native", "index.html")], output_dir, context=context
+    )
+
+
+def visualize(
+    output_dir: str,
+    reports: FastpJsonDirectoryFormat,
+    overrepresented_index: OverrepresentedIndex = None,
+    engine: str = "multiqc",
+    n_jobs: int = 1,
+) -> None:
+    """Visualize fastp reports.
+
+    The MultiQC engine renders the full MultiQC report, while the native
+    engine extracts the summary statistics from the reports and shows them
+    in a paginated sample table, followed by the most widespread
+    overrepresented sequences if an index is given.
+    """
+    if engine == "multiqc":
+        _visualize_multiqc(output_dir, reports)
+    else:
+        _visualize_native(output_dir, reports, n_jobs, overrepresented_index)